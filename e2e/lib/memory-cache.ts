@@ -0,0 +1,63 @@
+/**
+ * In-memory stand-in for the Workers Cache API (`caches.default`)
+ *
+ * Stores responses by URL for GET requests and honours max-age from
+ * Cache-Control, like the edge cache does. Counts hits, misses and puts.
+ */
+
+export interface MemoryCacheCounters {
+  match: number;
+  hits: number;
+  put: number;
+}
+
+interface StoredResponse {
+  body: ArrayBuffer;
+  status: number;
+  headers: [string, string][];
+  expiresAt: number;
+}
+
+export class MemoryCache {
+  private entries = new Map<string, StoredResponse>();
+
+  counters: MemoryCacheCounters = { match: 0, hits: 0, put: 0 };
+
+  resetCounters(): void {
+    this.counters = { match: 0, hits: 0, put: 0 };
+  }
+
+  async match(request: Request | string): Promise<Response | undefined> {
+    this.counters.match++;
+    const url = typeof request === 'string' ? request : request.url;
+    const stored = this.entries.get(url);
+    if (!stored) return undefined;
+
+    if (stored.expiresAt <= Date.now()) {
+      this.entries.delete(url);
+      return undefined;
+    }
+
+    this.counters.hits++;
+    return new Response(stored.body.slice(0), { status: stored.status, headers: stored.headers });
+  }
+
+  async put(request: Request | string, response: Response): Promise<void> {
+    this.counters.put++;
+    const url = typeof request === 'string' ? request : request.url;
+    const maxAge = /max-age=(\d+)/.exec(response.headers.get('Cache-Control') || '');
+    if (!maxAge || response.headers.get('Cache-Control')?.includes('no-store')) return;
+
+    this.entries.set(url, {
+      body: await response.arrayBuffer(),
+      status: response.status,
+      headers: [...response.headers.entries()],
+      expiresAt: Date.now() + parseInt(maxAge[1], 10) * 1000,
+    });
+  }
+
+  async delete(request: Request | string): Promise<boolean> {
+    const url = typeof request === 'string' ? request : request.url;
+    return this.entries.delete(url);
+  }
+}
@@ -0,0 +1,219 @@
+/**
+ * In-memory R2 bucket stand-in for local benchmarks
+ *
+ * Implements the subset of the R2Bucket binding used by the worker
+ * (put/get/head/delete/list) and counts every operation so tests can
+ * assert how many R2 calls a code path makes.
+ */
+
+export interface MemoryR2Counters {
+  put: number;
+  get: number;
+  head: number;
+  delete: number;
+  list: number;
+  listedObjects: number;
+}
+
+interface StoredObject {
+  key: string;
+  data: Uint8Array;
+  etag: string;
+  uploaded: Date;
+  httpMetadata: Record<string, any>;
+  customMetadata: Record<string, string>;
+}
+
+function toBytes(value: any): Uint8Array {
+  if (value === null || value === undefined) return new Uint8Array(0);
+  if (typeof value === 'string') return new TextEncoder().encode(value);
+  if (value instanceof Uint8Array) return new Uint8Array(value);
+  if (value instanceof ArrayBuffer) return new Uint8Array(value.slice(0));
+  if (ArrayBuffer.isView(value)) {
+    return new Uint8Array(value.buffer.slice(value.byteOffset, value.byteOffset + value.byteLength));
+  }
+  throw new Error('MemoryR2Bucket: unsupported body type');
+}
+
+export class MemoryR2Bucket {
+  private objects = new Map<string, StoredObject>();
+  private sortedKeys: string[] | null = null;
+  private etagCounter = 0;
+
+  counters: MemoryR2Counters = { put: 0, get: 0, head: 0, delete: 0, list: 0, listedObjects: 0 };
+
+  resetCounters(): void {
+    this.counters = { put: 0, get: 0, head: 0, delete: 0, list: 0, listedObjects: 0 };
+  }
+
+  get size(): number {
+    return this.objects.size;
+  }
+
+  /**
+   * Insert an object without touching counters (for seeding fixtures)
+   */
+  seed(key: string, data: any, options: { customMetadata?: Record<string, string>; httpMetadata?: Record<string, any>; uploaded?: Date } = {}): void {
+    if (!this.objects.has(key)) this.sortedKeys = null;
+    this.objects.set(key, {
+      key,
+      data: toBytes(data),
+      etag: `etag-${++this.etagCounter}`,
+      uploaded: options.uploaded || new Date(),
+      httpMetadata: options.httpMetadata || {},
+      customMetadata: options.customMetadata || {},
+    });
+  }
+
+  async put(
+    key: string,
+    value: any,
+    options: { customMetadata?: Record<string, string>; httpMetadata?: Record<string, any>; onlyIf?: { etagMatches?: string } } = {}
+  ): Promise<any> {
+    this.counters.put++;
+    if (value instanceof ReadableStream || value instanceof Blob) {
+      value = await new Response(value).arrayBuffer();
+    }
+    // Conditional write: null when the stored etag has changed, like R2
+    if (options.onlyIf?.etagMatches !== undefined && this.objects.get(key)?.etag !== options.onlyIf.etagMatches) {
+      return null;
+    }
+    this.seed(key, value, options);
+    return this.describe(this.objects.get(key)!);
+  }
+
+  async get(key: string, options: { range?: { offset?: number; length?: number; suffix?: number } } = {}): Promise<any> {
+    this.counters.get++;
+    const stored = this.objects.get(key);
+    if (!stored) return null;
+
+    let data = stored.data;
+    let range: { offset: number; length: number } | undefined;
+    if (options.range) {
+      const total = data.byteLength;
+      const offset = options.range.suffix !== undefined
+        ? Math.max(0, total - options.range.suffix)
+        : options.range.offset ?? 0;
+      const length = options.range.suffix !== undefined
+        ? total - offset
+        : Math.min(options.range.length ?? total - offset, total - offset);
+      data = data.subarray(offset, offset + length);
+      range = { offset, length };
+    }
+
+    const bytes = new Uint8Array(data);
+    return {
+      ...this.describe(stored),
+      range,
+      get body() {
+        return new Response(bytes).body;
+      },
+      bodyUsed: false,
+      arrayBuffer: async () => bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.byteLength),
+      text: async () => new TextDecoder().decode(bytes),
+      json: async () => JSON.parse(new TextDecoder().decode(bytes)),
+    };
+  }
+
+  async head(key: string): Promise<any> {
+    this.counters.head++;
+    const stored = this.objects.get(key);
+    return stored ? this.describe(stored) : null;
+  }
+
+  async delete(keys: string | string[]): Promise<void> {
+    this.counters.delete++;
+    const removed = new Set<string>();
+    for (const key of Array.isArray(keys) ? keys : [keys]) {
+      if (this.objects.delete(key)) removed.add(key);
+    }
+    // Keep the sorted index rather than re-sorting on the next list
+    if (removed.size > 0 && this.sortedKeys) {
+      this.sortedKeys = this.sortedKeys.filter((key) => !removed.has(key));
+    }
+  }
+
+  async list(options: { prefix?: string; limit?: number; cursor?: string; delimiter?: string; startAfter?: string } = {}): Promise<any> {
+    this.counters.list++;
+    const prefix = options.prefix || '';
+    const limit = Math.min(options.limit ?? 1000, 1000);
+
+    if (!this.sortedKeys) this.sortedKeys = [...this.objects.keys()].sort();
+    const keys = this.sortedKeys;
+
+    // Like R2, cursors are positions in key order (the last key returned),
+    // so deleting listed objects does not shift later pages
+    const after = options.cursor ?? options.startAfter;
+    let index = this.lowerBound(after !== undefined && after >= prefix ? after : prefix);
+    if (after !== undefined && keys[index] === after) index++;
+
+    const objects: any[] = [];
+    const delimitedPrefixes: string[] = [];
+    let last: string | undefined;
+    let truncated = false;
+
+    while (index < keys.length && keys[index].startsWith(prefix)) {
+      if (objects.length + delimitedPrefixes.length >= limit) {
+        truncated = true;
+        break;
+      }
+
+      const key = keys[index];
+      const rest = key.substring(prefix.length);
+      const idx = options.delimiter ? rest.indexOf(options.delimiter) : -1;
+
+      if (idx < 0) {
+        objects.push(this.describe(this.objects.get(key)!));
+        last = key;
+        index++;
+      } else {
+        // Collapse keys below the delimiter into delimitedPrefixes
+        const p = prefix + rest.substring(0, idx + options.delimiter!.length);
+        delimitedPrefixes.push(p);
+        // Resume past every key sharing this prefix
+        last = p + '\uffff';
+        index = this.lowerBound(last);
+      }
+    }
+
+    this.counters.listedObjects += objects.length + delimitedPrefixes.length;
+
+    return {
+      objects,
+      delimitedPrefixes,
+      truncated,
+      cursor: truncated ? last : undefined,
+    };
+  }
+
+  /**
+   * Index of the first sorted key >= target
+   */
+  private lowerBound(target: string): number {
+    const keys = this.sortedKeys!;
+    let lo = 0;
+    let hi = keys.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >>> 1;
+      if (keys[mid] < target) lo = mid + 1;
+      else hi = mid;
+    }
+    return lo;
+  }
+
+  private describe(stored: StoredObject): any {
+    return {
+      key: stored.key,
+      size: stored.data.byteLength,
+      etag: stored.etag,
+      httpEtag: `"${stored.etag}"`,
+      uploaded: stored.uploaded,
+      httpMetadata: { ...stored.httpMetadata },
+      customMetadata: { ...stored.customMetadata },
+      writeHttpMetadata: (headers: Headers) => {
+        if (stored.httpMetadata.contentType) headers.set('content-type', stored.httpMetadata.contentType);
+        if (stored.httpMetadata.cacheControl) headers.set('cache-control', stored.httpMetadata.cacheControl);
+      },
+    };
+  }
+}
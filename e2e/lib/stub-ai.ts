@@ -0,0 +1,81 @@
+/**
+ * Workers AI stand-in for local benchmarks
+ *
+ * Replaces globalThis.fetch with a fake Workers AI REST endpoint that
+ * answers every call with a 1x1 PNG after a fixed latency, and builds the
+ * minimal Env the worker services need on top of an in-memory bucket.
+ */
+
+import { MemoryR2Bucket } from './memory-r2.js';
+
+export const PNG_1X1 = 'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==';
+
+export interface StubWorkersAIOptions {
+  // Delay before each response
+  latencyMs?: number;
+  // Non-200 statuses answer with a plain-text error body
+  status?: number;
+  // Called for every AI call before it is answered
+  onRequest?: (url: string, init?: RequestInit) => void | Promise<void>;
+  // Answer a call here instead (webhooks, per-request AI responses);
+  // return undefined to fall through to the default AI response
+  intercept?: (url: string, init?: RequestInit) => Response | undefined | Promise<Response | undefined>;
+}
+
+export interface StubWorkersAI {
+  // AI calls seen so far
+  calls: number;
+  // Can be changed between requests
+  latencyMs: number;
+  status: number;
+  restore(): void;
+}
+
+/**
+ * Install the stub; call restore() (e.g. in afterEach) to put fetch back
+ */
+export function stubWorkersAI(options: StubWorkersAIOptions = {}): StubWorkersAI {
+  const originalFetch = globalThis.fetch;
+  const stub: StubWorkersAI = {
+    calls: 0,
+    latencyMs: options.latencyMs ?? 0,
+    status: options.status ?? 200,
+    restore: () => {
+      globalThis.fetch = originalFetch;
+    },
+  };
+
+  globalThis.fetch = (async (input: any, init?: RequestInit) => {
+    const url = typeof input === 'string' ? input : input instanceof URL ? input.toString() : input.url;
+    const intercepted = await options.intercept?.(url, init);
+    if (intercepted) return intercepted;
+
+    stub.calls++;
+    await options.onRequest?.(url, init);
+    if (stub.latencyMs > 0) {
+      await new Promise((resolve) => setTimeout(resolve, stub.latencyMs));
+    }
+
+    if (stub.status !== 200) {
+      return new Response(`stub error ${stub.status}`, { status: stub.status });
+    }
+    return new Response(JSON.stringify({ result: { image: PNG_1X1 } }), {
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }) as typeof fetch;
+
+  return stub;
+}
+
+/**
+ * Env with stub credentials and a fresh in-memory bucket
+ */
+export function stubEnv(overrides: Record<string, unknown> = {}): any {
+  return {
+    IMAGE_BUCKET: new MemoryR2Bucket(),
+    IMAGE_EXPIRY_HOURS: '24',
+    CLOUDFLARE_ACCOUNT_ID: 'stub',
+    CLOUDFLARE_API_TOKEN: 'stub',
+    ...overrides,
+  };
+}
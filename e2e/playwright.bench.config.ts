@@ -0,0 +1,34 @@
+import { defineConfig } from '@playwright/test';
+
+/**
+ * Benchmark Configuration
+ *
+ * Runs tests/bench against in-memory stand-ins: no deployment, browser or
+ * health check needed. Kept apart from playwright.config.ts (which ignores
+ * tests/bench) so benchmarks and their timing assertions only run through
+ * `npm run test:bench`, never against staging in CI.
+ */
+
+export default defineConfig({
+  testDir: './tests/bench',
+
+  // One spec at a time so timings are not skewed by each other
+  fullyParallel: false,
+  workers: 1,
+
+  // A retried timing is not a measurement
+  retries: 0,
+
+  // 100k-object buckets take a while to seed
+  timeout: 300_000,
+
+  reporter: [['list']],
+
+  projects: [
+    {
+      name: 'bench',
+    },
+  ],
+
+  outputDir: 'test-results/bench/',
+});
@@ -32,6 +32,9 @@ console.log(`   Auth Headers Present: ${Object.keys(authHeaders).length > 0}`);
 export default defineConfig({
   testDir: './tests',
 
+  // Benchmarks run locally via `npm run test:bench` (playwright.bench.config.ts)
+  testIgnore: '**/bench/**',
+
   // Run tests in files in parallel
   fullyParallel: true,
 
@@ -0,0 +1,113 @@
+import { test, expect } from '@playwright/test';
+import { PNG_1X1, stubEnv, stubWorkersAI, type StubWorkersAI } from '../../lib/stub-ai.js';
+import { OpenAIEndpoint } from '../../../workers/src/endpoints/openai-endpoint.js';
+import { ImageGeneratorService } from '../../../workers/src/services/image-generator.js';
+
+/**
+ * Account Router Benchmark
+ *
+ * Drives generations through a single Workers AI account (the default
+ * deployment) that rate limits, and checks that no call is sent before
+ * Retry-After, that callers get 429 with Retry-After, and that it recovers.
+ */
+
+const MODEL = '@cf/black-forest-labs/flux-1-schnell';
+
+test.describe('Account router', () => {
+  let ai: StubWorkersAI;
+  let calls = 0;
+  let retryAfter: string | null = null;
+  let rateLimited = true;
+
+  test.beforeEach(() => {
+    calls = 0;
+    rateLimited = true;
+    ai = stubWorkersAI({
+      intercept: () => {
+        calls++;
+        if (!rateLimited) {
+          return new Response(JSON.stringify({ result: { image: PNG_1X1 } }), {
+            headers: { 'Content-Type': 'application/json' },
+          });
+        }
+        const headers: Record<string, string> = retryAfter ? { 'Retry-After': retryAfter } : {};
+        return new Response('rate limited', { status: 429, headers });
+      },
+    });
+  });
+
+  test.afterEach(() => {
+    ai.restore();
+  });
+
+  // Router health is per isolate and keyed by account, so each test uses its own
+  const generate = (accountId: string) =>
+    new OpenAIEndpoint(stubEnv({ CLOUDFLARE_ACCOUNT_ID: accountId })).handle(
+      new Request('https://worker.test/v1/images/generations', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ model: MODEL, prompt: 'router bench' }),
+      })
+    );
+
+  test('an open circuit is not called before Retry-After', async () => {
+    retryAfter = '60';
+
+    const first = await generate('router-open');
+    expect(first.status).toBe(429);
+    expect(Number(first.headers.get('Retry-After'))).toBeGreaterThan(50);
+    expect((await first.json()).error.type).toBe('rate_limit_error');
+    expect(calls).toBe(1);
+
+    // Circuit is open for a minute: later requests fail fast without
+    // calling upstream, even if it has recovered meanwhile
+    rateLimited = false;
+    for (let i = 0; i < 3; i++) {
+      const response = await generate('router-open');
+      expect(response.status).toBe(429);
+      expect(Number(response.headers.get('Retry-After'))).toBeGreaterThan(50);
+    }
+    expect(calls).toBe(1);
+  });
+
+  test('a short Retry-After is waited out, then one probe closes the circuit', async () => {
+    retryAfter = '1';
+    setTimeout(() => { rateLimited = false; }, 100);
+
+    expect((await generate('router-half-open')).status).toBe(200);
+    // First call 429, then a single half-open probe after the wait
+    expect(calls).toBe(2);
+  });
+
+  test('a 429 without Retry-After only backs off briefly', async () => {
+    retryAfter = null;
+    setTimeout(() => { rateLimited = false; }, 100);
+
+    const started = performance.now();
+    const response = await generate('router-cooldown');
+    const elapsedMs = performance.now() - started;
+
+    console.table([{ status: response.status, calls, elapsedMs: Math.round(elapsedMs) }]);
+    expect(response.status).toBe(200);
+    expect(elapsedMs).toBeLessThan(8_000);
+  });
+
+  test('an unreadable 2xx body still settles the account', async () => {
+    ai.restore();
+    let served = 0;
+    ai = stubWorkersAI({
+      intercept: () => {
+        served++;
+        const body = served === 1 ? '{"result": {"ima' : JSON.stringify({ result: { image: PNG_1X1 } });
+        return new Response(body, { headers: { 'Content-Type': 'application/json' } });
+      },
+    });
+
+    const generator = new ImageGeneratorService(stubEnv({ CLOUDFLARE_ACCOUNT_ID: 'router-malformed' }));
+    const result = await generator.generateImage(MODEL, 'router bench');
+
+    expect(result.success).toBe(true);
+    expect(served).toBe(2);
+    expect(generator.getAccountStats()[0].outstanding).toBe(0);
+  });
+});
@@ -0,0 +1,165 @@
+import { test, expect } from '@playwright/test';
+import { createHmac } from 'node:crypto';
+import { MemoryR2Bucket } from '../../lib/memory-r2.js';
+import { stubEnv, stubWorkersAI, type StubWorkersAI } from '../../lib/stub-ai.js';
+import { OpenAIEndpoint } from '../../../workers/src/endpoints/openai-endpoint.js';
+import { JobRunner } from '../../../workers/src/services/job-runner.js';
+import { JobStore } from '../../../workers/src/services/job-store.js';
+
+/**
+ * Async Jobs Benchmark
+ *
+ * Submits generations as async jobs against an in-memory bucket with a
+ * stubbed Workers AI endpoint (no queue bound, so jobs run in the
+ * background) and checks submit latency, polling, webhooks and cancel.
+ */
+
+const MODEL = '@cf/black-forest-labs/flux-1-schnell';
+const WEBHOOK_URL = 'https://hooks.test/images';
+const SECRET = 'bench-secret';
+
+test.describe('Async image jobs', () => {
+  let ai: StubWorkersAI;
+  let webhooks: Array<{ body: string; signature: string | null }> = [];
+
+  test.beforeEach(() => {
+    webhooks = [];
+    ai = stubWorkersAI({
+      latencyMs: 100,
+      intercept: (url, init) => {
+        if (!url.startsWith(WEBHOOK_URL)) return undefined;
+        const headers = new Headers(init?.headers);
+        webhooks.push({ body: String(init?.body), signature: headers.get('X-Webhook-Signature') });
+        return new Response('ok');
+      },
+    });
+  });
+
+  test.afterEach(() => {
+    ai.restore();
+  });
+
+  function createEndpoint(bucket: MemoryR2Bucket, concurrency = '4'): OpenAIEndpoint {
+    return new OpenAIEndpoint(stubEnv({
+      IMAGE_BUCKET: bucket,
+      GENERATION_CONCURRENCY: concurrency,
+      JOB_WEBHOOK_SECRET: SECRET,
+    }));
+  }
+
+  const submit = (endpoint: OpenAIEndpoint, body: Record<string, any>) =>
+    endpoint.handle(new Request('https://worker.test/v1/images/generations', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', Prefer: 'respond-async' },
+      body: JSON.stringify({ model: MODEL, prompt: 'async bench', ...body }),
+    }));
+
+  const poll = async (endpoint: OpenAIEndpoint, id: string, until: (job: any) => boolean) => {
+    for (let i = 0; i < 200; i++) {
+      const job = await (await endpoint.handle(new Request(`https://worker.test/v1/images/jobs/${id}`))).json();
+      if (until(job)) return job;
+      await new Promise((resolve) => setTimeout(resolve, 20));
+    }
+    throw new Error(`Job ${id} did not reach the expected state`);
+  };
+
+  test('submit returns immediately; poll and webhook deliver the result', async () => {
+    const endpoint = createEndpoint(new MemoryR2Bucket());
+
+    const started = performance.now();
+    const response = await submit(endpoint, { n: 4, webhook_url: WEBHOOK_URL });
+    const submitMs = performance.now() - started;
+
+    expect(response.status).toBe(202);
+    const job = await response.json();
+    expect(job.status).toBe('queued');
+    expect(response.headers.get('Location')).toBe(`/v1/images/jobs/${job.id}`);
+    expect(submitMs).toBeLessThan(ai.latencyMs);
+
+    const done = await poll(endpoint, job.id, (j) => j.status === 'succeeded' && webhooks.length > 0);
+    expect(done.data).toHaveLength(4);
+    expect(done.data[0].url).toMatch(/^https:\/\/worker\.test\/images\//);
+    expect(done.progress).toEqual({ completed: 4, total: 4 });
+
+    expect(webhooks).toHaveLength(1);
+    const expected = createHmac('sha256', SECRET).update(webhooks[0].body).digest('hex');
+    expect(webhooks[0].signature).toBe(`sha256=${expected}`);
+    expect(JSON.parse(webhooks[0].body).id).toBe(job.id);
+
+    console.table([{ n: 4, submitMs: Math.round(submitMs), aiLatencyMs: ai.latencyMs }]);
+  });
+
+  test('cancel stops a running job before the remaining images', async () => {
+    ai.latencyMs = 200;
+    const endpoint = createEndpoint(new MemoryR2Bucket(), '1');
+
+    const job = await (await submit(endpoint, { n: 4 })).json();
+    await poll(endpoint, job.id, (j) => j.progress.completed >= 1);
+
+    const cancel = await endpoint.handle(new Request(`https://worker.test/v1/images/jobs/${job.id}/cancel`, { method: 'POST' }));
+    expect((await cancel.json()).status).toBe('cancelled');
+
+    // Let any in-flight image finish, then confirm nothing else ran
+    await new Promise((resolve) => setTimeout(resolve, ai.latencyMs * 3));
+    const final = await poll(endpoint, job.id, () => true);
+    expect(final.status).toBe('cancelled');
+    expect(ai.calls).toBeLessThan(4);
+    expect(webhooks).toHaveLength(0);
+  });
+
+  test('burst of submissions holds no request open', async () => {
+    const endpoint = createEndpoint(new MemoryR2Bucket());
+    const burst = 50;
+
+    const started = performance.now();
+    const responses = await Promise.all(Array.from({ length: burst }, () => submit(endpoint, { n: 1 })));
+    const submitMs = performance.now() - started;
+    expect(responses.every((r) => r.status === 202)).toBe(true);
+
+    const ids = await Promise.all(responses.map(async (r) => (await r.json()).id));
+    await Promise.all(ids.map((id) => poll(endpoint, id, (j) => j.status === 'succeeded')));
+    const totalMs = performance.now() - started;
+
+    console.table([{ jobs: burst, allAcceptedMs: Math.round(submitMs), allDoneMs: Math.round(totalMs) }]);
+    expect(ai.calls).toBe(burst);
+  });
+
+  test('unknown jobs and b64_json are rejected', async () => {
+    const endpoint = createEndpoint(new MemoryR2Bucket());
+
+    const missing = await endpoint.handle(new Request(`https://worker.test/v1/images/jobs/job_${'0'.repeat(32)}`));
+    expect(missing.status).toBe(404);
+
+    const b64 = await submit(endpoint, { response_format: 'b64_json' });
+    expect(b64.status).toBe(400);
+  });
+
+  test('a job left running past the timeout is failed on poll and on redelivery', async () => {
+    const bucket = new MemoryR2Bucket();
+    const env = stubEnv({ IMAGE_BUCKET: bucket, JOB_TIMEOUT_MINUTES: '20' });
+    const store = new JobStore(env);
+
+    // As if the worker running them was evicted 21 minutes ago
+    const createStale = async () => {
+      const job = await store.create(
+        { task: 'generations', model: MODEL, prompt: 'stale', n: 1, params: {} },
+        { baseUrl: 'https://worker.test', webhookUrl: WEBHOOK_URL }
+      );
+      await store.update(job.id, (current) => ({ ...current, status: 'running', startedAt: Date.now() - 21 * 60 * 1000 }));
+      return job.id;
+    };
+
+    const polled = await createStale();
+    const job = await (await new OpenAIEndpoint(env).handle(new Request(`https://worker.test/v1/images/jobs/${polled}`))).json();
+    expect(job.status).toBe('failed');
+    expect(job.error.message).toContain('timed out');
+
+    const redelivered = await createStale();
+    const result = await new JobRunner(env).run(redelivered);
+    expect(result?.status).toBe('failed');
+    expect(result?.webhook?.delivered).toBe(true);
+
+    expect(ai.calls).toBe(0);
+    expect(webhooks.map((w) => JSON.parse(w.body).id)).toEqual([polled, redelivered]);
+  });
+});
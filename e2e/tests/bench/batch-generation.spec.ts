@@ -0,0 +1,105 @@
+import { test, expect } from '@playwright/test';
+import { stubEnv, stubWorkersAI, type StubWorkersAI } from '../../lib/stub-ai.js';
+import { ImageGeneratorService } from '../../../workers/src/services/image-generator.js';
+import { OpenAIEndpoint } from '../../../workers/src/endpoints/openai-endpoint.js';
+
+/**
+ * Batch Generation Benchmark
+ *
+ * Runs n>1 generations against a stubbed Workers AI endpoint that answers
+ * later items first and echoes the seed it was sent, and checks result
+ * order, seed + i, partial failures and the GENERATION_CONCURRENCY bound.
+ */
+
+const MODEL = '@cf/black-forest-labs/flux-1-schnell';
+const CONCURRENCY = 3;
+
+test.describe('Batch generation', () => {
+  let ai: StubWorkersAI;
+  let seeds: number[];
+  let inFlight = 0;
+  let maxInFlight = 0;
+  let failSeed: number | undefined;
+
+  test.beforeEach(() => {
+    seeds = [];
+    inFlight = 0;
+    maxInFlight = 0;
+    failSeed = undefined;
+    ai = stubWorkersAI({
+      intercept: async (_url, init) => {
+        const seed = JSON.parse(String(init?.body)).seed as number;
+        seeds.push(seed);
+        inFlight++;
+        maxInFlight = Math.max(maxInFlight, inFlight);
+        // Higher seeds answer sooner, so completion order differs from index order
+        await new Promise((resolve) => setTimeout(resolve, Math.max(5, 60 - (seed % 10) * 10)));
+        inFlight--;
+
+        if (seed === failSeed) {
+          return new Response('invalid input', { status: 400 });
+        }
+        // Echo the seed as the "image" so results can be matched to their index
+        return new Response(JSON.stringify({ result: { image: btoa(`seed-${seed}`) } }), {
+          headers: { 'Content-Type': 'application/json' },
+        });
+      },
+    });
+  });
+
+  test.afterEach(() => {
+    ai.restore();
+  });
+
+  const createGenerator = () => new ImageGeneratorService(stubEnv({ GENERATION_CONCURRENCY: String(CONCURRENCY) }));
+  const seedsOf = (images: any[]) => images.map((img) => atob(img.b64_json));
+
+  test('results keep index order with seed + i and bounded concurrency', async () => {
+    const n = 6;
+    const result = await createGenerator().generateImages(MODEL, 'batch order', n, { seed: 10 }, true);
+
+    expect(result.success).toBe(true);
+    expect(seedsOf(result.images)).toEqual([10, 11, 12, 13, 14, 15].map((s) => `seed-${s}`));
+    expect(new Set(seeds)).toEqual(new Set([10, 11, 12, 13, 14, 15]));
+    expect(maxInFlight).toBe(CONCURRENCY);
+
+    console.table([{ n, concurrency: CONCURRENCY, maxInFlight, completionOrder: seeds.join(',') }]);
+  });
+
+  test('a seed embedded in the prompt is kept; an explicit seed wins', async () => {
+    const generator = createGenerator();
+
+    const embedded = await generator.generateImages(MODEL, 'batch seed --seed=20', 3, {}, true);
+    expect(seedsOf(embedded.images)).toEqual(['seed-20', 'seed-21', 'seed-22']);
+
+    const explicit = await generator.generateImages(MODEL, 'batch seed --seed=20', 2, { seed: 30, steps: undefined }, true);
+    expect(seedsOf(explicit.images)).toEqual(['seed-30', 'seed-31']);
+  });
+
+  test('finished images are kept when part of the batch fails', async () => {
+    failSeed = 42;
+    const result = await createGenerator().generateImages(MODEL, 'batch partial', 4, { seed: 40 }, true);
+
+    expect(result.success).toBe(true);
+    expect(seedsOf(result.images)).toEqual(['seed-40', 'seed-41', 'seed-43']);
+    expect(result.errors).toHaveLength(1);
+    expect(result.errors![0].index).toBe(2);
+  });
+
+  test('invalid n is rejected with 400', async () => {
+    const endpoint = new OpenAIEndpoint(stubEnv());
+    for (const n of [2.5, -1, 0, 'two']) {
+      const response = await endpoint.handle(new Request('https://worker.test/v1/images/generations', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ model: MODEL, prompt: 'batch n', n }),
+      }));
+      expect(response.status).toBe(400);
+      expect((await response.json()).error.param).toBe('n');
+    }
+    expect(ai.calls + seeds.length).toBe(0);
+
+    const direct = await createGenerator().generateImages(MODEL, 'batch n', 2.5);
+    expect(direct.success).toBe(false);
+  });
+});
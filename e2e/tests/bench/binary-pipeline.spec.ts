@@ -0,0 +1,88 @@
+import { test, expect } from '@playwright/test';
+import { stubEnv, stubWorkersAI, type StubWorkersAI } from '../../lib/stub-ai.js';
+import { ImageGeneratorService } from '../../../workers/src/services/image-generator.js';
+import { bytesToBase64 } from '../../../workers/src/services/binary.js';
+
+/**
+ * Binary Pipeline Micro-benchmark
+ *
+ * Compares peak memory and CPU per edit request when the uploaded image is
+ * handed to the generator as a Blob (current path) versus converted to a
+ * base64 string first (previous fileToBase64 path), for 1, 4 and 8 outputs.
+ */
+
+const MODEL = '@cf/black-forest-labs/flux-2-klein-4b';
+const INPUT_BYTES = 2 * 1024 * 1024;
+
+test.describe('Binary image pipeline', () => {
+  let ai: StubWorkersAI;
+  let bytesSent = 0;
+
+  test.beforeEach(() => {
+    bytesSent = 0;
+    ai = stubWorkersAI({
+      onRequest: async (_url, init) => {
+        bytesSent += (await new Response(init?.body).arrayBuffer()).byteLength;
+      },
+    });
+  });
+
+  test.afterEach(() => {
+    ai.restore();
+  });
+
+  test('peak memory and CPU for 1, 4 and 8-image edits', async () => {
+    const input = new Uint8Array(INPUT_BYTES);
+    for (let i = 0; i < input.length; i += 4096) input[i] = i & 0xff;
+    const upload = new File([input], 'input.png', { type: 'image/png' });
+
+    const generator = new ImageGeneratorService(stubEnv());
+
+    const measure = async (label: string, n: number, run: () => Promise<{ images: unknown[] }>) => {
+      (globalThis as any).gc?.();
+      const before = process.memoryUsage();
+      let peak = before.heapUsed + before.arrayBuffers;
+      const sampler = setInterval(() => {
+        const m = process.memoryUsage();
+        peak = Math.max(peak, m.heapUsed + m.arrayBuffers);
+      }, 1);
+      const cpuStart = process.cpuUsage();
+
+      const result = await run();
+
+      const cpu = process.cpuUsage(cpuStart);
+      clearInterval(sampler);
+      const after = process.memoryUsage();
+      peak = Math.max(peak, after.heapUsed + after.arrayBuffers);
+
+      expect(result.images).toHaveLength(n);
+      return {
+        path: label,
+        n,
+        peakMB: +((peak - before.heapUsed - before.arrayBuffers) / 1024 / 1024).toFixed(1),
+        cpuMs: +((cpu.user + cpu.system) / 1000).toFixed(1),
+        sentMB: +(bytesSent / 1024 / 1024).toFixed(1),
+      };
+    };
+
+    const rows = [];
+    for (const n of [1, 4, 8]) {
+      bytesSent = 0;
+      rows.push(await measure('base64', n, async () => {
+        const b64 = bytesToBase64(await upload.arrayBuffer());
+        return generator.generateImageToImages(MODEL, 'edit', b64, n, { seed: 1 });
+      }));
+
+      bytesSent = 0;
+      rows.push(await measure('binary', n, () =>
+        generator.generateImageToImages(MODEL, 'edit', upload, n, { seed: 1 })
+      ));
+    }
+
+    console.table(rows);
+
+    // Binary path ships the original bytes, not a decoded copy of a string
+    const binary8 = rows.find((r) => r.path === 'binary' && r.n === 8)!;
+    expect(binary8.sentMB).toBeGreaterThanOrEqual(+(8 * INPUT_BYTES / 1024 / 1024).toFixed(1));
+  });
+});
@@ -0,0 +1,90 @@
+import { test, expect } from '@playwright/test';
+import { MemoryR2Bucket } from '../../lib/memory-r2.js';
+import { PNG_1X1, stubEnv, stubWorkersAI, type StubWorkersAI } from '../../lib/stub-ai.js';
+import { ImageGeneratorService } from '../../../workers/src/services/image-generator.js';
+
+/**
+ * Generation Cache Benchmark
+ *
+ * Runs ImageGeneratorService against an in-memory bucket with a stubbed
+ * Workers AI endpoint and counts upstream calls for repeated seeded requests.
+ */
+
+const MODEL = '@cf/black-forest-labs/flux-1-schnell';
+
+test.describe('Generation cache', () => {
+  let ai: StubWorkersAI;
+
+  test.beforeEach(() => {
+    ai = stubWorkersAI({ latencyMs: 50 });
+  });
+
+  test.afterEach(() => {
+    ai.restore();
+  });
+
+  function createGenerator(bucket: MemoryR2Bucket, cache: boolean, expiryHours: string = '24'): ImageGeneratorService {
+    return new ImageGeneratorService(stubEnv({
+      IMAGE_BUCKET: bucket,
+      GENERATION_CACHE: cache ? 'true' : undefined,
+      IMAGE_EXPIRY_HOURS: expiryHours,
+    }));
+  }
+
+  test('identical seeded requests hit the cache and coalesce', async () => {
+    const bucket = new MemoryR2Bucket();
+    const generator = createGenerator(bucket, true);
+    const prompt = `cache test ${Date.now()}`;
+
+    // Concurrent identical requests share one upstream call
+    const concurrent = await Promise.all(
+      Array.from({ length: 5 }, () => generator.generateImage(MODEL, prompt, { seed: 42 }))
+    );
+    expect(ai.calls).toBe(1);
+    const urls = new Set(concurrent.map((r) => r.imageUrl));
+    expect(urls.size).toBe(1);
+
+    // Later repeats are served from cache, including base64 output
+    const repeat = await generator.generateImage(MODEL, prompt, { seed: 42 });
+    const b64 = await generator.generateImage(MODEL, prompt, { seed: 42 }, true);
+    expect(ai.calls).toBe(1);
+    expect(repeat.imageUrl).toBe(concurrent[0].imageUrl);
+    expect(b64.base64Data).toBe(PNG_1X1);
+
+    // A different seed is a different cache key
+    await generator.generateImage(MODEL, prompt, { seed: 43 });
+    expect(ai.calls).toBe(2);
+
+    console.log('Cache stats:', generator.getCacheStats());
+  });
+
+  test('requests without a seed or with the cache disabled always call upstream', async () => {
+    const bucket = new MemoryR2Bucket();
+    const prompt = `uncached ${Date.now()}`;
+
+    const enabled = createGenerator(bucket, true);
+    await enabled.generateImage(MODEL, prompt);
+    await enabled.generateImage(MODEL, prompt);
+    expect(ai.calls).toBe(2);
+
+    const disabled = createGenerator(bucket, false);
+    await disabled.generateImage(MODEL, prompt, { seed: 7 });
+    await disabled.generateImage(MODEL, prompt, { seed: 7 });
+    expect(ai.calls).toBe(4);
+  });
+
+  test('entries close to expiry are regenerated instead of served', async () => {
+    const bucket = new MemoryR2Bucket();
+    const prompt = `near expiry ${Date.now()}`;
+
+    // Stored with a 1 hour TTL, which is under 10% of a 24 hour expiry
+    const first = await createGenerator(bucket, true, '1').generateImage(MODEL, prompt, { seed: 5 });
+    const second = await createGenerator(bucket, true, '24').generateImage(MODEL, prompt, { seed: 5 });
+    expect(ai.calls).toBe(2);
+    expect(second.imageUrl).not.toBe(first.imageUrl);
+
+    // The fresh image replaced the stale entry
+    await createGenerator(bucket, true, '24').generateImage(MODEL, prompt, { seed: 5 });
+    expect(ai.calls).toBe(2);
+  });
+});
@@ -0,0 +1,149 @@
+import { test, expect } from '@playwright/test';
+import { MemoryR2Bucket } from '../../lib/memory-r2.js';
+import { MemoryCache } from '../../lib/memory-cache.js';
+import { R2StorageService } from '../../../workers/src/services/r2-storage.js';
+import { serveImage } from '../../../workers/src/endpoints/image-proxy.js';
+
+/**
+ * Image Proxy Benchmark
+ *
+ * Serves /images/* against an in-memory bucket and Cache API and counts
+ * R2 reads for repeated, conditional, ranged and HEAD requests.
+ */
+
+const ORIGIN = 'https://worker.test';
+
+test.describe('Image proxy', () => {
+  let bucket: MemoryR2Bucket;
+  let cache: MemoryCache;
+  let env: any;
+  let url: string;
+  const bytes = new Uint8Array(1024).map((_, i) => i & 0xff);
+
+  test.beforeEach(async () => {
+    bucket = new MemoryR2Bucket();
+    cache = new MemoryCache();
+    (globalThis as any).caches = { default: cache };
+    env = { IMAGE_BUCKET: bucket, IMAGE_EXPIRY_HOURS: '24' };
+
+    const storage = new R2StorageService(env);
+    const uploaded = await storage.uploadImage(bytes.buffer, { model: 'bench', prompt: 'proxy', parameters: {} });
+    url = `${ORIGIN}${uploaded.url}`;
+    bucket.resetCounters();
+  });
+
+  test.afterEach(() => {
+    delete (globalThis as any).caches;
+  });
+
+  const fetchImage = (init: RequestInit = {}) => serveImage(new Request(url, init), env);
+
+  test('repeated fetches read R2 once', async () => {
+    const fetches = 20;
+    let etag: string | null = null;
+
+    for (let i = 0; i < fetches; i++) {
+      const response = await fetchImage();
+      expect(response.status).toBe(200);
+      expect(new Uint8Array(await response.arrayBuffer())).toEqual(bytes);
+      etag ??= response.headers.get('ETag');
+      expect(response.headers.get('ETag')).toBe(etag);
+
+      // Lifetime follows the image's expiry, not a fixed day
+      const maxAge = parseInt(/max-age=(\d+)/.exec(response.headers.get('Cache-Control')!)![1], 10);
+      expect(maxAge).toBeGreaterThan(24 * 3600 - 60);
+      expect(maxAge).toBeLessThanOrEqual(24 * 3600);
+    }
+
+    console.table([{ fetches, r2Gets: bucket.counters.get, r2Heads: bucket.counters.head, cacheHits: cache.counters.hits }]);
+    expect(bucket.counters.get).toBe(1);
+    expect(cache.counters.hits).toBe(fetches - 1);
+  });
+
+  test('conditional requests get 304 without reading the body', async () => {
+    const first = await fetchImage();
+    const etag = first.headers.get('ETag')!;
+    const lastModified = first.headers.get('Last-Modified')!;
+    bucket.resetCounters();
+
+    // Served from the edge cache
+    expect((await fetchImage({ headers: { 'If-None-Match': etag } })).status).toBe(304);
+    expect((await fetchImage({ headers: { 'If-None-Match': `W/${etag}` } })).status).toBe(304);
+    expect((await fetchImage({ headers: { 'If-Modified-Since': lastModified } })).status).toBe(304);
+    expect((await fetchImage({ headers: { 'If-None-Match': '"other"' } })).status).toBe(200);
+    expect(bucket.counters.get + bucket.counters.head).toBe(0);
+
+    // Cold edge cache: answered from R2 metadata with a head()
+    delete (globalThis as any).caches;
+    const notModified = await fetchImage({ headers: { 'If-None-Match': etag } });
+    expect(notModified.status).toBe(304);
+    expect(notModified.headers.get('ETag')).toBe(etag);
+    expect(bucket.counters.head).toBe(1);
+    expect(bucket.counters.get).toBe(0);
+  });
+
+  test('byte ranges and HEAD', async () => {
+    // Cold cache: only the requested bytes are read from R2
+    const get = bucket.get.bind(bucket);
+    let getOptions: any;
+    bucket.get = (key, options) => {
+      getOptions = options;
+      return get(key, options);
+    };
+    const cold = await fetchImage({ headers: { Range: 'bytes=100-199' } });
+    expect(cold.status).toBe(206);
+    expect(new Uint8Array(await cold.arrayBuffer())).toEqual(bytes.slice(100, 200));
+    expect(bucket.counters.head).toBe(1);
+    expect(bucket.counters.get).toBe(1);
+    expect(cache.counters.put).toBe(0);
+    expect(getOptions).toEqual({ range: { offset: 100, length: 100 } });
+
+    // A plain GET fills the cache; ranges after it never go to R2
+    expect((await fetchImage()).status).toBe(200);
+    bucket.resetCounters();
+
+    const partial = await fetchImage({ headers: { Range: 'bytes=100-199' } });
+    expect(partial.status).toBe(206);
+    expect(partial.headers.get('Content-Range')).toBe('bytes 100-199/1024');
+    expect(new Uint8Array(await partial.arrayBuffer())).toEqual(bytes.slice(100, 200));
+
+    const suffix = await fetchImage({ headers: { Range: 'bytes=-24' } });
+    expect(suffix.status).toBe(206);
+    expect(new Uint8Array(await suffix.arrayBuffer())).toEqual(bytes.slice(1000));
+
+    const outOfRange = await fetchImage({ headers: { Range: 'bytes=5000-' } });
+    expect(outOfRange.status).toBe(416);
+    expect(outOfRange.headers.get('Content-Range')).toBe('bytes */1024');
+
+    const head = await fetchImage({ method: 'HEAD' });
+    expect(head.status).toBe(200);
+    expect(head.headers.get('Content-Length')).toBe('1024');
+    expect(head.body).toBeNull();
+
+    expect(bucket.counters.get + bucket.counters.head).toBe(0);
+
+    // HEAD on a cold cache reads metadata only
+    delete (globalThis as any).caches;
+    bucket.resetCounters();
+    expect((await fetchImage({ method: 'HEAD' })).status).toBe(200);
+    expect(bucket.counters.get).toBe(0);
+    expect(bucket.counters.head).toBe(1);
+  });
+
+  test('expired and missing images are not cached', async () => {
+    const key = new URL(url).pathname.substring(1);
+    const stored = await bucket.head(key);
+    bucket.seed(key, bytes, {
+      customMetadata: { ...stored.customMetadata, expiresAt: String(Date.now() - 1000) },
+      httpMetadata: stored.httpMetadata,
+    });
+
+    const expired = await fetchImage();
+    expect(expired.status).toBe(200);
+    expect(expired.headers.get('Cache-Control')).toBe('no-store');
+    expect(cache.counters.put).toBe(0);
+
+    const missing = await serveImage(new Request(`${ORIGIN}/images/2020-01-01/missing.png`), env);
+    expect(missing.status).toBe(404);
+  });
+});
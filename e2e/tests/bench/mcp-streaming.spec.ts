@@ -0,0 +1,159 @@
+import { test, expect } from '@playwright/test';
+import { stubEnv, stubWorkersAI, type StubWorkersAI } from '../../lib/stub-ai.js';
+import { MCPEndpoint } from '../../../workers/src/endpoints/mcp-endpoint.js';
+
+/**
+ * MCP Streaming Benchmark
+ *
+ * Sends a run_model call for 4 images with Accept: text/event-stream and
+ * compares time-to-first-image (first progress notification) against time
+ * to the final result, with Workers AI stubbed at a fixed latency. Also
+ * drives the HTTP+SSE session transport (in-memory session store).
+ */
+
+const MODEL = '@cf/black-forest-labs/flux-1-schnell';
+const AI_LATENCY_MS = 200;
+const N = 4;
+
+test.describe('MCP streaming', () => {
+  let ai: StubWorkersAI;
+
+  test.beforeEach(() => {
+    ai = stubWorkersAI({ latencyMs: AI_LATENCY_MS });
+  });
+
+  test.afterEach(() => {
+    ai.restore();
+  });
+
+  test('first image arrives before the batch completes', async () => {
+    const endpoint = new MCPEndpoint(stubEnv({
+      // Sequential generation makes the gap between first and last image visible
+      GENERATION_CONCURRENCY: '1',
+    }));
+
+    const start = performance.now();
+    const response = await endpoint.handle(new Request('http://localhost/mcp', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'application/json, text/event-stream',
+      },
+      body: JSON.stringify({
+        jsonrpc: '2.0',
+        id: 1,
+        method: 'tools/call',
+        params: {
+          name: 'run_model',
+          arguments: { taskType: 'generations', model_id: MODEL, prompt: 'streaming bench', n: N },
+          _meta: { progressToken: 'bench' },
+        },
+      }),
+    }));
+
+    expect(response.headers.get('Content-Type')).toBe('text/event-stream');
+
+    const reader = response.body!.pipeThrough(new TextDecoderStream()).getReader();
+    const events: { at: number; message: any }[] = [];
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      let boundary: number;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const data = block.split('\n').find((line) => line.startsWith('data: '));
+        if (data) events.push({ at: performance.now() - start, message: JSON.parse(data.slice(6)) });
+      }
+    }
+
+    const progress = events.filter((e) => e.message.method === 'notifications/progress');
+    const final = events.find((e) => e.message.id === 1);
+
+    expect(progress).toHaveLength(N);
+    expect(progress.map((e) => e.message.params.progress)).toEqual([1, 2, 3, 4]);
+    expect(final?.message.result.content).toBeDefined();
+
+    const firstMs = progress[0].at;
+    const finalMs = final!.at;
+    console.table([{ n: N, aiLatencyMs: AI_LATENCY_MS, firstImageMs: Math.round(firstMs), finalMs: Math.round(finalMs) }]);
+
+    // Buffered JSON would deliver nothing until finalMs
+    expect(firstMs).toBeLessThan(finalMs / 2);
+  });
+
+  test('a POST for an unknown SSE session gets 404', async () => {
+    const endpoint = new MCPEndpoint(stubEnv());
+    const response = await endpoint.handle(new Request('http://localhost/mcp/message?sessionId=missing', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ jsonrpc: '2.0', id: 7, method: 'tools/list' }),
+    }));
+
+    expect(response.status).toBe(404);
+    const body = await response.json();
+    expect(body.id).toBe(7);
+    expect(body.error.message).toBe('Session not found');
+  });
+
+  test('HTTP+SSE session replies arrive on the GET stream', async () => {
+    const endpoint = new MCPEndpoint(stubEnv());
+    const session = await endpoint.handle(new Request('http://localhost/mcp?transport=sse'));
+    expect(session.headers.get('Content-Type')).toBe('text/event-stream');
+
+    const reader = session.body!.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    const nextEvent = async (): Promise<{ event: string; data: string }> => {
+      for (;;) {
+        const boundary = buffer.indexOf('\n\n');
+        if (boundary !== -1) {
+          const lines = buffer.slice(0, boundary).split('\n');
+          buffer = buffer.slice(boundary + 2);
+          const event = lines.find((line) => line.startsWith('event: '));
+          const data = lines.find((line) => line.startsWith('data: '));
+          if (event && data) return { event: event.slice(7), data: data.slice(6) };
+          continue;
+        }
+        const { value, done } = await reader.read();
+        if (done) throw new Error('Session stream ended');
+        buffer += value;
+      }
+    };
+
+    const opened = await nextEvent();
+    expect(opened.event).toBe('endpoint');
+    expect(opened.data).toMatch(/^\/mcp\/message\?sessionId=/);
+    const post = (body: Record<string, any>) => endpoint.handle(new Request(`http://localhost${opened.data}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ jsonrpc: '2.0', ...body }),
+    }));
+
+    expect((await post({ id: 1, method: 'tools/list' })).status).toBe(202);
+    const tools = JSON.parse((await nextEvent()).data);
+    expect(tools.id).toBe(1);
+    expect(tools.result.tools.length).toBeGreaterThan(0);
+
+    // run_model is acknowledged before any image is generated
+    const started = performance.now();
+    const accepted = await post({
+      id: 2,
+      method: 'tools/call',
+      params: { name: 'run_model', arguments: { taskType: 'generations', model_id: MODEL, prompt: 'session bench', n: 2 } },
+    });
+    expect(accepted.status).toBe(202);
+    expect(performance.now() - started).toBeLessThan(AI_LATENCY_MS);
+
+    const messages = [JSON.parse((await nextEvent()).data), JSON.parse((await nextEvent()).data), JSON.parse((await nextEvent()).data)];
+    expect(messages.filter((m) => m.method === 'notifications/message')).toHaveLength(2);
+    expect(messages[2].id).toBe(2);
+    expect(messages[2].result.content[0].text).toContain('Generated 2 images');
+
+    // Once the client has gone, POSTs to the session are rejected
+    await reader.cancel();
+    const closed = await post({ id: 3, method: 'tools/list' });
+    expect(closed.status).toBe(404);
+  });
+});
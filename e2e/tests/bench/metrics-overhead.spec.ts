@@ -0,0 +1,124 @@
+import { test, expect } from '@playwright/test';
+import { stubEnv, stubWorkersAI, type StubWorkersAI } from '../../lib/stub-ai.js';
+import worker from '../../../workers/src/index.js';
+import { RequestTrace, resetMetrics, snapshot } from '../../../workers/src/services/metrics.js';
+
+/**
+ * Metrics Overhead Benchmark
+ *
+ * Measures the cost of a timing span against the bare call, then drives
+ * generations through the worker with a stubbed Workers AI endpoint and
+ * checks the Server-Timing header and /metrics output.
+ */
+
+const MODEL = '@cf/black-forest-labs/flux-1-schnell';
+const ORIGIN = 'https://worker.test';
+
+test.describe('Request metrics', () => {
+  let ai: StubWorkersAI;
+  const ctx = { waitUntil: () => {}, passThroughOnException: () => {} } as any;
+  const env = stubEnv({ CLOUDFLARE_ACCOUNT_ID: 'stubaccount' });
+
+  test.beforeEach(() => {
+    resetMetrics();
+    ai = stubWorkersAI({ latencyMs: 20 });
+  });
+
+  test.afterEach(() => {
+    ai.restore();
+  });
+
+  const generate = (body: Record<string, any>) =>
+    worker.fetch(new Request(`${ORIGIN}/v1/images/generations`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ model: MODEL, prompt: 'metrics bench', ...body }),
+    }), env, ctx);
+
+  test('span overhead is negligible next to the stages it times', async () => {
+    const iterations = 200_000;
+    const trace = new RequestTrace('bench');
+    trace.model = MODEL;
+    let sink = 0;
+    const work = () => { sink += 1; return sink; };
+
+    let started = performance.now();
+    for (let i = 0; i < iterations; i++) work();
+    const bareMs = performance.now() - started;
+
+    started = performance.now();
+    for (let i = 0; i < iterations; i++) trace.measure('parse', work);
+    const tracedMs = performance.now() - started;
+
+    started = performance.now();
+    for (let i = 0; i < iterations; i++) await trace.span('upload', async () => work());
+    const asyncMs = performance.now() - started;
+
+    const perSpanUs = ((tracedMs - bareMs) / iterations) * 1000;
+    const perAsyncSpanUs = (asyncMs / iterations) * 1000;
+    console.table([{ iterations, bareMs: +bareMs.toFixed(1), tracedMs: +tracedMs.toFixed(1), perSpanUs: +perSpanUs.toFixed(3), perAsyncSpanUs: +perAsyncSpanUs.toFixed(3) }]);
+
+    // A request records a handful of spans around calls that take milliseconds
+    expect(perSpanUs).toBeLessThan(5);
+    expect(perAsyncSpanUs).toBeLessThan(10);
+  });
+
+  test('Server-Timing header and /metrics cover the generation hot path', async () => {
+    const response = await generate({ n: 4 });
+    expect(response.status).toBe(200);
+
+    const timing = response.headers.get('Server-Timing')!;
+    for (const stage of ['parse', 'ai', 'upload', 'total']) {
+      expect(timing).toMatch(new RegExp(`(^|, )${stage};dur=`));
+    }
+    expect(timing).toMatch(/ai;dur=[\d.]+;desc="x4"/);
+
+    ai.status = 400;
+    await generate({ n: 1 });
+
+    const text = await (await worker.fetch(new Request(`${ORIGIN}/metrics`), env, ctx)).text();
+    expect(text).toContain('# TYPE image_request_duration_ms histogram');
+    expect(text).toContain(`image_requests_total{endpoint="openai",model="${MODEL}",status="2xx"} 1`);
+    expect(text).toContain(`workers_ai_requests_total{model="${MODEL}",account="stubacco",status="200"} 4`);
+    expect(text).toContain(`workers_ai_requests_total{model="${MODEL}",account="stubacco",status="400"} 1`);
+    expect(text).toMatch(/image_bytes_total\{endpoint="openai",model="[^"]+",direction="r2_upload"\} \d+/);
+
+    const json = await (await worker.fetch(new Request(`${ORIGIN}/metrics?format=json`), env, ctx)).json();
+    const ai = json.histograms.filter((h: any) => h.metric === 'workers_ai_request_duration_ms' && h.status === '200');
+    expect(ai).toHaveLength(1);
+    expect(ai[0].count).toBe(4);
+    expect(ai[0].p50Ms).toBeGreaterThanOrEqual(10);
+
+    console.table(snapshot().histograms.map(({ metric, stage, status, count, meanMs, p95Ms }) => ({ metric, stage, status, count, meanMs, p95Ms })));
+  });
+
+  test('streamed MCP run_model is recorded when the stream closes, with its outcome', async () => {
+    const callTool = (prompt: string) =>
+      worker.fetch(new Request(`${ORIGIN}/mcp`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'application/json, text/event-stream' },
+        body: JSON.stringify({
+          jsonrpc: '2.0',
+          id: 1,
+          method: 'tools/call',
+          params: { name: 'run_model', arguments: { taskType: 'generations', model_id: MODEL, prompt, n: 2 } },
+        }),
+      }), env, ctx);
+
+    const ok = await callTool('metrics stream');
+    expect(ok.headers.get('Content-Type')).toBe('text/event-stream');
+    // Nothing is recorded until the body has been read to the end
+    expect(snapshot().counters.filter((c) => c.metric === 'image_requests_total')).toHaveLength(0);
+    await ok.text();
+
+    ai.status = 400;
+    await (await callTool('metrics stream failure')).text();
+
+    const requests = snapshot().counters.filter((c) => c.metric === 'image_requests_total' && c.endpoint === 'mcp');
+    expect(requests.map((c) => [c.status, c.value]).sort()).toEqual([['2xx', 1], ['5xx', 1]]);
+
+    // Duration covers the generation, not just the time to headers
+    const duration = snapshot().histograms.find((h) => h.metric === 'image_request_duration_ms' && h.endpoint === 'mcp' && h.status === '2xx');
+    expect(Number(duration?.meanMs)).toBeGreaterThanOrEqual(ai.latencyMs);
+  });
+});
@@ -0,0 +1,149 @@
+import { test, expect } from '@playwright/test';
+import { MemoryR2Bucket } from '../../lib/memory-r2.js';
+import { R2StorageService } from '../../../workers/src/services/r2-storage.js';
+
+/**
+ * R2 Expiry Cleanup Benchmark
+ *
+ * Seeds an in-memory bucket with 100k images spread over 10 date folders
+ * and measures the R2 operations spent by cleanupExpired and getStats:
+ * a first pass that builds the per-folder index, then an hourly run after
+ * new uploads, against the full scan the index replaces.
+ */
+
+const HOUR_MS = 60 * 60 * 1000;
+const DAY_MS = 24 * HOUR_MS;
+const EXPIRY_HOURS = 24;
+const OBJECTS = 100_000;
+const DAYS = 10;
+
+function createStorage(bucket: MemoryR2Bucket): R2StorageService {
+  return new R2StorageService({
+    IMAGE_BUCKET: bucket as any,
+    IMAGE_EXPIRY_HOURS: String(EXPIRY_HOURS),
+    TZ: 'UTC',
+  } as any);
+}
+
+/**
+ * Seed `count` images uploaded evenly over [from, to), keyed like uploadImage
+ */
+function seedImages(bucket: MemoryR2Bucket, count: number, from: number, to: number): void {
+  for (let i = 0; i < count; i++) {
+    const createdAt = Math.floor(from + ((to - from) * i) / count);
+    const day = new Date(createdAt).toISOString().split('T')[0];
+    const id = `${createdAt.toString(36)}-${Math.random().toString(36).substring(2, 10)}`;
+    bucket.seed(`images/${day}/${id}.png`, new Uint8Array(16), {
+      customMetadata: {
+        model: 'bench',
+        prompt: `image ${i}`,
+        createdAt: String(createdAt),
+        expiresAt: String(createdAt + EXPIRY_HOURS * HOUR_MS),
+      },
+    });
+  }
+}
+
+/**
+ * Ground truth by brute force (not counted against the bucket)
+ */
+function liveImages(bucket: MemoryR2Bucket, now: number): { live: number; expired: number } {
+  let live = 0;
+  let expired = 0;
+  for (const key of (bucket as any).objects.keys() as IterableIterator<string>) {
+    if (!key.startsWith('images/')) continue;
+    const expiresAt = parseInt((bucket as any).objects.get(key).customMetadata.expiresAt, 10);
+    if (expiresAt < now) expired++;
+    else live++;
+  }
+  return { live, expired };
+}
+
+test.describe('R2 expiry cleanup', () => {
+  const realNow = Date.now;
+  let clock = 0;
+
+  test.beforeEach(() => {
+    clock = realNow();
+    Date.now = () => clock;
+  });
+
+  test.afterEach(() => {
+    Date.now = realNow;
+  });
+
+  test('hourly runs and stats cost scales with change, not bucket size', async () => {
+    test.setTimeout(120_000);
+    const bucket = new MemoryR2Bucket();
+    const storage = createStorage(bucket);
+    seedImages(bucket, OBJECTS, clock - DAYS * DAY_MS, clock);
+
+    const rows: Array<Record<string, number | string>> = [];
+    const measure = async <T>(label: string, run: () => Promise<T>): Promise<T> => {
+      bucket.resetCounters();
+      const started = performance.now();
+      const result = await run();
+      rows.push({
+        step: label,
+        lists: bucket.counters.list,
+        deletes: bucket.counters.delete,
+        listedObjects: bucket.counters.listedObjects,
+        ms: Math.round(performance.now() - started),
+      });
+      return result;
+    };
+
+    // Before any cleanup the index is empty and stats scan the bucket
+    const scanned = await measure('getStats (full scan)', () => storage.getStats());
+    expect(scanned.totalImages).toBe(OBJECTS);
+
+    // First pass deletes everything expired and indexes every folder
+    const expected = liveImages(bucket, clock);
+    const firstDeleted = await measure('cleanup (first pass)', () => storage.cleanupExpired());
+    expect(firstDeleted).toBe(expected.expired);
+    expect(liveImages(bucket, clock)).toEqual({ live: expected.live, expired: 0 });
+
+    // An hour later: new uploads arrive and the oldest live hour expires
+    seedImages(bucket, 400, clock, clock + HOUR_MS);
+    clock += HOUR_MS;
+    const hourly = liveImages(bucket, clock);
+    const hourlyDeleted = await measure('cleanup (next hour)', () => storage.cleanupExpired());
+    expect(hourlyDeleted).toBe(hourly.expired);
+    expect(liveImages(bucket, clock)).toEqual({ live: hourly.live, expired: 0 });
+
+    const hourlyRun = rows[rows.length - 1];
+    expect(hourlyRun.listedObjects as number).toBeLessThan(hourly.live / 2);
+
+    // Stats come from the index plus uploads since the last cleanup
+    seedImages(bucket, 50, clock, clock + 60_000);
+    const stats = await measure('getStats (indexed)', () => storage.getStats());
+    expect(stats.totalImages).toBe(hourly.live + 50);
+    expect(stats.totalSize).toBe((hourly.live + 50) * 16);
+    expect(rows[rows.length - 1].listedObjects as number).toBeLessThan(1000);
+
+    console.table(rows);
+  });
+
+  test('a small operation budget resumes across invocations', async () => {
+    test.setTimeout(120_000);
+    const bucket = new MemoryR2Bucket();
+    const storage = createStorage(bucket);
+    seedImages(bucket, OBJECTS, clock - DAYS * DAY_MS, clock);
+    const expected = liveImages(bucket, clock);
+
+    const budget = 20;
+    let runs = 0;
+    let deleted = 0;
+    do {
+      bucket.resetCounters();
+      deleted += await storage.cleanupExpired(budget);
+      runs++;
+      // Budgeted operations plus the state read and write
+      expect(bucket.counters.list + bucket.counters.delete).toBeLessThanOrEqual(budget);
+    } while (liveImages(bucket, clock).expired > 0 && runs < 100);
+
+    expect(deleted).toBe(expected.expired);
+    expect((await storage.getStats()).totalImages).toBe(expected.live);
+    console.log(`Budget ${budget}: ${runs} invocations to clear ${deleted} expired objects`);
+  });
+});
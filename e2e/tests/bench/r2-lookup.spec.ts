@@ -0,0 +1,72 @@
+import { test, expect } from '@playwright/test';
+import { MemoryR2Bucket } from '../../lib/memory-r2.js';
+import { R2StorageService } from '../../../workers/src/services/r2-storage.js';
+
+/**
+ * R2 Image Lookup Benchmark
+ *
+ * Runs R2StorageService against an in-memory bucket and checks that
+ * getImage/deleteImage cost a constant number of R2 operations (no list)
+ * as the bucket grows.
+ */
+
+function createStorage(bucket: MemoryR2Bucket): R2StorageService {
+  return new R2StorageService({
+    IMAGE_BUCKET: bucket as any,
+    IMAGE_EXPIRY_HOURS: '24',
+  } as any);
+}
+
+test.describe('R2 image lookup', () => {
+  test('lookup and delete cost stays flat as object count grows', async () => {
+    const png = new Uint8Array([0x89, 0x50, 0x4e, 0x47]).buffer;
+    const results: Array<{ objects: number; ops: number; usPerLookup: number }> = [];
+
+    for (const count of [100, 1_000, 10_000, 50_000]) {
+      const bucket = new MemoryR2Bucket();
+      const storage = createStorage(bucket);
+
+      const ids: string[] = [];
+      for (let i = 0; i < count; i++) {
+        const uploaded = await storage.uploadImage(png, { model: 'bench', prompt: `image ${i}`, parameters: {} });
+        ids.push(uploaded.id);
+      }
+
+      bucket.resetCounters();
+      const lookups = 200;
+      const started = performance.now();
+      for (let i = 0; i < lookups; i++) {
+        const id = ids[Math.floor(Math.random() * ids.length)];
+        const image = await storage.getImage(id);
+        expect(image?.metadata.id).toBe(id);
+      }
+      const elapsed = performance.now() - started;
+
+      // One get() per lookup and never a list(), regardless of bucket size
+      expect(bucket.counters.list).toBe(0);
+      expect(bucket.counters.get).toBe(lookups);
+
+      results.push({ objects: count, ops: bucket.counters.get / lookups, usPerLookup: (elapsed * 1000) / lookups });
+
+      // Deleting the oldest image and one from the middle (where a lookup
+      // limited to the first 100 listed keys used to miss) must also work
+      bucket.resetCounters();
+      for (const id of [ids[0], ids[Math.floor(ids.length / 2)]]) {
+        expect(await storage.deleteImage(id)).toBe(true);
+        expect(await storage.getImage(id)).toBeNull();
+      }
+      expect(bucket.counters.list).toBe(0);
+    }
+
+    console.table(results);
+  });
+
+  test('unknown or malformed ids resolve without listing', async () => {
+    const bucket = new MemoryR2Bucket();
+    const storage = createStorage(bucket);
+
+    expect(await storage.getImage('not-an-id!')).toBeNull();
+    expect(await storage.deleteImage('zzzzzzzz-missing')).toBe(false);
+    expect(bucket.counters.list).toBe(0);
+  });
+});
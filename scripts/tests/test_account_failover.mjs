@@ -0,0 +1,99 @@
+import http from 'http';
+
+// Local stub of the Workers AI REST endpoint (/accounts/:id/ai/run/:model)
+// used to exercise multi-account failover without real credentials.
+//
+// Usage:
+//   1. node scripts/tests/test_account_failover.mjs --stub-only   (starts the stub)
+//   2. In workers/, run wrangler dev with:
+//        CF_API_BASE_URL=http://localhost:8788/client/v4
+//        AI_ACCOUNTS='[{"account_id":"rate-limited","api_token":"x"},
+//                      {"account_id":"flaky","api_token":"x"},
+//                      {"account_id":"healthy","api_token":"x"}]'
+//   3. node scripts/tests/test_account_failover.mjs
+//
+// Account behaviour:
+//   rate-limited -> always 429 with Retry-After: 30
+//   flaky        -> 503 on every other call
+//   healthy      -> always returns a 1x1 PNG
+
+const STUB_PORT = parseInt(process.env.STUB_PORT || '8788', 10);
+const BASE_URL = process.env.BASE_URL || 'http://localhost:8787';
+const API_KEY = process.env.API_KEY;
+const REQUESTS = parseInt(process.env.REQUESTS || '10', 10);
+
+const PNG_1X1 = 'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==';
+
+const hits = { 'rate-limited': 0, flaky: 0, healthy: 0 };
+
+function startStub() {
+  const server = http.createServer((req, res) => {
+    const match = req.url.match(/\/accounts\/([^/]+)\/ai\/run\//);
+    const account = match ? match[1] : 'unknown';
+    hits[account] = (hits[account] || 0) + 1;
+
+    // Drain the request body before responding
+    req.on('data', () => {});
+    req.on('end', () => {
+      if (account === 'rate-limited') {
+        res.writeHead(429, { 'Content-Type': 'application/json', 'Retry-After': '30' });
+        res.end(JSON.stringify({ success: false, errors: [{ message: 'rate limited' }] }));
+        return;
+      }
+      if (account === 'flaky' && hits.flaky % 2 === 1) {
+        res.writeHead(503, { 'Content-Type': 'application/json' });
+        res.end(JSON.stringify({ success: false, errors: [{ message: 'unavailable' }] }));
+        return;
+      }
+      res.writeHead(200, { 'Content-Type': 'application/json' });
+      res.end(JSON.stringify({ success: true, result: { image: PNG_1X1 } }));
+    });
+  });
+
+  return new Promise((resolve) => server.listen(STUB_PORT, () => resolve(server)));
+}
+
+async function main() {
+  const server = await startStub();
+  console.log(`Stub /ai/run/ endpoint listening on http://localhost:${STUB_PORT}/client/v4`);
+
+  if (process.argv.includes('--stub-only')) {
+    return;
+  }
+
+  const headers = { 'Content-Type': 'application/json' };
+  if (API_KEY) headers.Authorization = `Bearer ${API_KEY}`;
+
+  let ok = 0;
+  for (let i = 0; i < REQUESTS; i++) {
+    const response = await fetch(`${BASE_URL}/v1/images/generations`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({
+        model: '@cf/black-forest-labs/flux-1-schnell',
+        prompt: `failover test ${i}`,
+        response_format: 'b64_json',
+      }),
+    });
+    if (response.status === 200) ok++;
+    else console.log(`Request ${i} failed: ${response.status} ${await response.text()}`);
+  }
+
+  const stats = await (await fetch(`${BASE_URL}/api/internal/accounts`, { headers })).json();
+
+  console.log(`\nSucceeded: ${ok}/${REQUESTS}`);
+  console.log('Stub hits:', hits);
+  console.log('Router stats:', JSON.stringify(stats, null, 2));
+
+  // The rate-limited account should be hit at most once, then skipped until Retry-After
+  const passed = ok === REQUESTS && hits['rate-limited'] <= 1;
+  console.log(passed ? '\n✅ Failover test passed' : '\n❌ Failover test failed');
+
+  server.close();
+  process.exit(passed ? 0 : 1);
+}
+
+main().catch((err) => {
+  console.error(err);
+  process.exit(1);
+});
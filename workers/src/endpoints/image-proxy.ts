@@ -0,0 +1,225 @@
+// ============================================================================
+// Image Proxy - Serve generated images from R2 through the worker
+// Edge cache first, conditional GET (ETag/Last-Modified), byte ranges, HEAD;
+// cache lifetime follows each image's expiresAt
+// ============================================================================
+
+import type { Env } from '../types.js';
+
+/**
+ * Serve GET/HEAD /images/<key>
+ */
+export async function serveImage(request: Request, env: Env, ctx?: ExecutionContext): Promise<Response> {
+  if (request.method !== 'GET' && request.method !== 'HEAD') {
+    return new Response('Method not allowed', { status: 405, headers: { Allow: 'GET, HEAD' } });
+  }
+
+  const url = new URL(request.url);
+  const key = url.pathname.substring(1); // Remove leading slash
+  // One cache entry per image, whatever the query string or request headers
+  const cacheKey = new Request(`${url.origin}${url.pathname}`, { method: 'GET' });
+  const cache = edgeCache();
+
+  try {
+    const cached = await cache?.match(cacheKey);
+    if (cached) {
+      // A cached copy is local to the edge, so a range is cut from it here
+      return await respond(request, cached.headers, async (range) =>
+        range ? (await cached.arrayBuffer()).slice(range.start, range.end + 1) : cached.body
+      );
+    }
+
+    // HEAD, conditional and ranged requests start from metadata alone
+    const ranged = request.headers.has('Range');
+    if (request.method === 'HEAD' || isConditional(request) || ranged) {
+      const head = await env.IMAGE_BUCKET.head(key);
+      if (!head) {
+        return new Response('Image not found', { status: 404 });
+      }
+      const headers = objectHeaders(head, env);
+      if (request.method === 'HEAD' || notModified(request, headers)) {
+        return respond(request, headers, null);
+      }
+      if (ranged) {
+        // Read only the requested bytes; the next plain GET fills the cache
+        return await respond(request, headers, async (range) => {
+          const options = range ? { range: { offset: range.start, length: range.end - range.start + 1 } } : undefined;
+          const object = await env.IMAGE_BUCKET.get(key, options);
+          if (!object) throw new Error(`Image removed while serving: ${key}`);
+          return object.body;
+        });
+      }
+    }
+
+    const image = await env.IMAGE_BUCKET.get(key);
+    if (!image) {
+      return new Response('Image not found', { status: 404 });
+    }
+
+    const headers = objectHeaders(image, env);
+    let body = image.body;
+
+    const age = maxAge(headers);
+    if (cache && age > 0) {
+      // Stream to the client and the edge cache at once; the cache drops
+      // its copy when the image expires
+      const [forCache, forClient] = body.tee();
+      body = forClient;
+      const stored = new Headers(headers);
+      stored.set('Cache-Control', `public, max-age=${age}`);
+      const store = cache.put(cacheKey, new Response(forCache, { headers: stored }));
+      if (ctx) {
+        ctx.waitUntil(store);
+      } else {
+        await store;
+      }
+    }
+
+    return await respond(request, headers, async () => body);
+  } catch (error) {
+    return new Response('Error fetching image', { status: 500 });
+  }
+}
+
+/**
+ * The Workers edge cache, when running on Cloudflare (absent in plain Node)
+ */
+function edgeCache(): Cache | undefined {
+  return typeof caches !== 'undefined' ? (caches as unknown as { default: Cache }).default : undefined;
+}
+
+/**
+ * Response headers for an R2 object. `Expires` carries the image's
+ * expiresAt so a cached copy can recompute max-age when it is served.
+ */
+function objectHeaders(object: R2Object, env: Env): Headers {
+  const createdAt = parseInt(object.customMetadata?.createdAt ?? '', 10);
+  let expiresAt = parseInt(object.customMetadata?.expiresAt ?? '', 10);
+  if (!Number.isFinite(expiresAt)) {
+    const expiryHours = parseInt(env.IMAGE_EXPIRY_HOURS || '24', 10);
+    const base = Number.isFinite(createdAt) ? createdAt : object.uploaded.getTime();
+    expiresAt = base + expiryHours * 60 * 60 * 1000;
+  }
+
+  return new Headers({
+    'Content-Type': object.httpMetadata?.contentType || 'image/png',
+    'Content-Length': String(object.size),
+    ETag: object.httpEtag,
+    'Last-Modified': object.uploaded.toUTCString(),
+    Expires: new Date(expiresAt).toUTCString(),
+    'Accept-Ranges': 'bytes',
+  });
+}
+
+/**
+ * Seconds until the image expires
+ */
+function maxAge(headers: Headers): number {
+  const expires = Date.parse(headers.get('Expires') || '');
+  if (!Number.isFinite(expires)) return 0;
+  return Math.max(0, Math.floor((expires - Date.now()) / 1000));
+}
+
+function isConditional(request: Request): boolean {
+  return request.headers.has('If-None-Match') || request.headers.has('If-Modified-Since');
+}
+
+/**
+ * Whether a conditional GET can be answered with 304 (RFC 9110 §13.1):
+ * If-None-Match wins over If-Modified-Since; ETags compare weakly
+ */
+function notModified(request: Request, headers: Headers): boolean {
+  const ifNoneMatch = request.headers.get('If-None-Match');
+  if (ifNoneMatch) {
+    const etag = stripWeak(headers.get('ETag') || '');
+    return ifNoneMatch.trim() === '*' || ifNoneMatch.split(',').some((tag) => stripWeak(tag.trim()) === etag);
+  }
+
+  const ifModifiedSince = Date.parse(request.headers.get('If-Modified-Since') || '');
+  const lastModified = Date.parse(headers.get('Last-Modified') || '');
+  return Number.isFinite(ifModifiedSince) && Number.isFinite(lastModified) && lastModified <= ifModifiedSince;
+}
+
+function stripWeak(etag: string): string {
+  return etag.startsWith('W/') ? etag.substring(2) : etag;
+}
+
+/**
+ * Parse a single-range `Range: bytes=...` header against `size`.
+ * null means serve the whole body (no header, multiple ranges, or a stale
+ * If-Range); 'unsatisfiable' means 416.
+ */
+function parseRange(
+  request: Request,
+  headers: Headers,
+  size: number
+): { start: number; end: number } | 'unsatisfiable' | null {
+  const range = request.headers.get('Range');
+  if (!range) return null;
+
+  const ifRange = request.headers.get('If-Range');
+  if (ifRange && ifRange !== headers.get('ETag') && ifRange !== headers.get('Last-Modified')) {
+    return null;
+  }
+
+  const match = range.match(/^bytes=(\d*)-(\d*)$/);
+  if (!match || (match[1] === '' && match[2] === '')) return null;
+
+  let start: number;
+  let end: number;
+  if (match[1] === '') {
+    // Suffix range: the last N bytes
+    const suffix = parseInt(match[2], 10);
+    if (suffix === 0) return 'unsatisfiable';
+    start = Math.max(0, size - suffix);
+    end = size - 1;
+  } else {
+    start = parseInt(match[1], 10);
+    end = match[2] === '' ? size - 1 : Math.min(parseInt(match[2], 10), size - 1);
+  }
+
+  if (start >= size || start > end) return 'unsatisfiable';
+  return { start, end };
+}
+
+/**
+ * Build the response for a request from the image's headers. `body` is
+ * only called when a body is actually sent, with the byte range to send
+ * (null for the whole image).
+ */
+async function respond(
+  request: Request,
+  source: Headers,
+  body: ((range: { start: number; end: number } | null) => Promise<ReadableStream | ArrayBuffer | null>) | null
+): Promise<Response> {
+  const headers = new Headers(source);
+  const age = maxAge(headers);
+  headers.set('Cache-Control', age > 0 ? `public, max-age=${age}, immutable` : 'no-store');
+
+  if (notModified(request, headers)) {
+    headers.delete('Content-Length');
+    return new Response(null, { status: 304, headers });
+  }
+
+  if (request.method === 'HEAD' || !body) {
+    return new Response(null, { status: 200, headers });
+  }
+
+  // Content-Length is the full image size, from R2 metadata or the cached copy
+  const size = parseInt(headers.get('Content-Length') || '', 10);
+  const range = Number.isFinite(size) ? parseRange(request, headers, size) : null;
+
+  if (range === 'unsatisfiable') {
+    headers.set('Content-Range', `bytes */${size}`);
+    headers.delete('Content-Length');
+    return new Response(null, { status: 416, headers });
+  }
+
+  if (range) {
+    headers.set('Content-Range', `bytes ${range.start}-${range.end}/${size}`);
+    headers.set('Content-Length', String(range.end - range.start + 1));
+    return new Response(await body(range), { status: 206, headers });
+  }
+
+  return new Response(await body(null), { status: 200, headers });
+}
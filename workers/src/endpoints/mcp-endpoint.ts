@@ -4,10 +4,23 @@
 // ============================================================================
 
 import type { Env } from '../types.js';
-import { ImageGeneratorService } from '../services/image-generator.js';
+import {
+  ImageGeneratorService,
+  MAX_IMAGES_PER_REQUEST,
+  parseImageCount,
+  type BatchProgress,
+  type BatchProgressCallback,
+} from '../services/image-generator.js';
+import { getMCPSessionStore, encodeSSEMessage, type MCPSessionStore } from '../services/mcp-sessions.js';
+import type { RequestTrace } from '../services/metrics.js';
 
 export class MCPEndpoint {
   private generator: ImageGeneratorService;
+  private sessions: MCPSessionStore;
+  private ctx?: ExecutionContext;
+  private trace?: RequestTrace;
+  // Status of the last run_model whose generation failed (metrics only)
+  private failureStatus?: number;
   private corsHeaders: Record<string, string>;
 
   // Per-request mode (derived from path)
@@ -19,8 +32,11 @@ export class MCPEndpoint {
 
   private workerBaseUrl: string; // Store worker's base URL
 
-  constructor(env: Env) {
-    this.generator = new ImageGeneratorService(env);
+  constructor(env: Env, ctx?: ExecutionContext, trace?: RequestTrace) {
+    this.generator = new ImageGeneratorService(env, trace);
+    this.sessions = getMCPSessionStore(env);
+    this.ctx = ctx;
+    this.trace = trace;
     this.workerBaseUrl = ''; // Will be set from first request
 
 
@@ -67,16 +83,17 @@ export class MCPEndpoint {
       return new Response(null, { headers: this.corsHeaders });
     }
 
+    // GET for SSE transport connection (?transport=sse), ahead of the info
+    // routes since it uses the same paths
+    if (request.method === 'GET' && url.searchParams.get('transport') === 'sse') {
+      return this.handleSSE(request);
+    }
+
     // GET /mcp* - Return endpoint info (for human-readable API discovery)
     if (request.method === 'GET' && (pathname === '/mcp' || pathname === '/mcp/smart' || pathname === '/mcp/simple')) {
       return this.handleInfo(pathname);
     }
 
-    // GET for SSE transport connection (?transport=sse)
-    if (request.method === 'GET' && url.searchParams.get('transport') === 'sse') {
-      return this.handleSSE(request);
-    }
-
     // POST for MCP messages (handles both /mcp* and /mcp*/message for Streamable HTTP)
     if (
       request.method === 'POST' &&
@@ -141,21 +158,17 @@ export class MCPEndpoint {
   }
 
   /**
-   * Handle SSE transport connection
+   * Handle SSE transport connection.
+   * Opens a session stream; the first event names the endpoint to POST to,
+   * and responses/progress for those POSTs are pushed onto this stream.
    */
-  private async handleSSE(_request: Request): Promise<Response> {
-    const encoder = new TextEncoder();
-    const stream = new ReadableStream({
-      start(controller) {
-        // Send initial connection message
-        const data = JSON.stringify({
-          jsonrpc: '2.0',
-          method: 'notifications/initialized',
-          params: {},
-        });
-        controller.enqueue(encoder.encode(`data: ${data}\n\n`));
-      },
-    });
+  private async handleSSE(request: Request): Promise<Response> {
+    const url = new URL(request.url);
+    const base = url.pathname.replace(/\/+$/, '').replace(/\/message$/, '');
+    const model = url.searchParams.get('model');
+    const endpoint = `${base}/message?${model ? `model=${encodeURIComponent(model)}&` : ''}`;
+
+    const { id, stream } = await this.sessions.open(endpoint);
 
     return new Response(stream, {
       headers: {
@@ -163,6 +176,7 @@ export class MCPEndpoint {
         'Content-Type': 'text/event-stream',
         'Cache-Control': 'no-cache',
         Connection: 'keep-alive',
+        'Mcp-Session-Id': id,
       },
     });
   }
@@ -171,34 +185,9 @@ export class MCPEndpoint {
    * Handle MCP JSON-RPC message
    */
   private async handleMessage(request: Request): Promise<Response> {
+    let message: { id?: string | number; method?: string; params?: any };
     try {
-      const message: { id?: string | number; method?: string } = await request.json();
-
-      // Handle different message types
-      if (message.method === 'initialize') {
-        return this.handleInitialize(message);
-      }
-
-      if (message.method === 'notifications/listChanged') {
-        return this.handleListChanged(message);
-      }
-
-      if (message.method === 'tools/list') {
-        return this.handleListTools(message);
-      }
-
-      if (message.method === 'tools/call') {
-        return this.handleCallTool(message);
-      }
-
-      return new Response(JSON.stringify({
-        jsonrpc: '2.0',
-        id: message.id ?? null,
-        error: { code: -32600, message: 'Unknown method' },
-      }), {
-        status: 200,
-        headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
-      });
+      message = await request.json();
     } catch {
       return new Response(JSON.stringify({
         jsonrpc: '2.0',
@@ -209,6 +198,249 @@ export class MCPEndpoint {
         headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
       });
     }
+
+    // Legacy SSE transport: reply over the session stream opened by GET ?transport=sse
+    const sessionId = new URL(request.url).searchParams.get('sessionId');
+    if (sessionId) {
+      if (await this.sessions.has(sessionId)) {
+        return this.handleSessionMessage(sessionId, message);
+      }
+      // Closed or unknown session: a reply sent inline would never reach
+      // the client's stream, so tell it to reconnect
+      return this.sessionNotFound(message);
+    }
+
+    // Streamable HTTP: clients accepting SSE get run_model progress as it happens
+    const accept = request.headers.get('accept') || '';
+    if (this.isRunModelCall(message) && accept.includes('text/event-stream')) {
+      return this.streamToolCall(message);
+    }
+
+    return this.dispatch(message);
+  }
+
+  /**
+   * Route a JSON-RPC message to its handler
+   */
+  private async dispatch(message: { id?: string | number; method?: string; params?: any }): Promise<Response> {
+    // Handle different message types
+    if (message.method === 'initialize') {
+      return this.handleInitialize(message);
+    }
+
+    if (message.method === 'notifications/listChanged') {
+      return this.handleListChanged(message);
+    }
+
+    if (message.method === 'tools/list') {
+      return this.handleListTools(message);
+    }
+
+    if (message.method === 'tools/call') {
+      return this.handleCallTool(message);
+    }
+
+    return new Response(JSON.stringify({
+      jsonrpc: '2.0',
+      id: message.id ?? null,
+      error: { code: -32600, message: 'Unknown method' },
+    }), {
+      status: 200,
+      headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+    });
+  }
+
+  private isRunModelCall(message: { method?: string; params?: any }): boolean {
+    return message.method === 'tools/call' && message.params?.name === 'run_model';
+  }
+
+  /**
+   * Handle a POST for an open SSE session. Replies go onto the session
+   * stream: other methods are answered before the 202, while run_model is
+   * acknowledged at once and sends its progress and result after the
+   * response (ctx.waitUntil).
+   */
+  private async handleSessionMessage(
+    sessionId: string,
+    message: { id?: string | number; method?: string; params?: any }
+  ): Promise<Response> {
+    if (this.isRunModelCall(message)) {
+      const send = async (payload: unknown) => {
+        if (!(await this.sessions.send(sessionId, payload))) {
+          throw new Error(`session ${sessionId} is closed`);
+        }
+      };
+
+      // The request is recorded when the result has been sent
+      if (this.trace) this.trace.deferred = true;
+
+      const running = (async () => {
+        let payload: unknown = { error: 'session closed' };
+        try {
+          payload = await this.runToolCallWithProgress(message, send);
+          await send(payload);
+        } catch (error) {
+          console.warn(`MCP run_model result not delivered: ${error instanceof Error ? error.message : error}`);
+        } finally {
+          this.recordToolCall(payload);
+        }
+      })();
+      this.ctx?.waitUntil(running);
+
+      return new Response(null, { status: 202, headers: this.corsHeaders });
+    }
+
+    const response = await this.dispatch(message);
+    // Notifications carry no id and get no reply
+    if (message.id !== undefined && !(await this.sessions.send(sessionId, await response.json()))) {
+      return this.sessionNotFound(message);
+    }
+
+    return new Response(null, { status: 202, headers: this.corsHeaders });
+  }
+
+  /**
+   * 404 for a POST to a session that is closed or was never opened; the
+   * client should open a new one (GET ?transport=sse) and resend
+   */
+  private sessionNotFound(message: { id?: string | number }): Response {
+    return new Response(JSON.stringify({
+      jsonrpc: '2.0',
+      id: message.id ?? null,
+      error: { code: -32001, message: 'Session not found' },
+    }), {
+      status: 404,
+      headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+    });
+  }
+
+  /**
+   * Streamable HTTP response for run_model: progress events per image,
+   * then the final JSON-RPC result, as SSE on the POST response itself
+   */
+  private streamToolCall(message: { id?: string | number; params?: any }): Response {
+    const { readable, writable } = new TransformStream<Uint8Array, Uint8Array>();
+    const writer = writable.getWriter();
+    const send = async (payload: unknown) => {
+      await writer.write(encodeSSEMessage(payload));
+    };
+
+    // The request is recorded when the stream closes, with the tool's outcome
+    if (this.trace) this.trace.deferred = true;
+
+    (async () => {
+      let payload: unknown = { error: 'stream closed' };
+      try {
+        payload = await this.runToolCallWithProgress(message, send);
+        await send(payload);
+      } catch (error) {
+        console.warn(`MCP stream closed early: ${error instanceof Error ? error.message : error}`);
+      } finally {
+        this.recordToolCall(payload);
+        await writer.close().catch(() => {});
+      }
+    })();
+
+    return new Response(readable, {
+      headers: {
+        ...this.corsHeaders,
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+      },
+    });
+  }
+
+  /**
+   * Run run_model, emitting one notification per finished image, and
+   * return the final JSON-RPC response payload
+   */
+  private async runToolCallWithProgress(
+    message: { id?: string | number; params?: any },
+    send: (payload: unknown) => Promise<void>
+  ): Promise<unknown> {
+    const progressToken = message.params?._meta?.progressToken;
+    const onProgress: BatchProgressCallback = (progress) =>
+      send(this.buildProgressNotification(progressToken, progress));
+
+    try {
+      const content = await this.handleRunModels(message.params?.arguments, onProgress);
+      return { jsonrpc: '2.0', id: message.id, result: { content } };
+    } catch (error) {
+      const errorMessage = error instanceof Error ? error.message : String(error);
+      return { jsonrpc: '2.0', id: message.id, error: { code: -32603, message: errorMessage } };
+    }
+  }
+
+  /**
+   * Record a run_model request in the metrics with its real outcome: the
+   * HTTP status is 200 (or a stream) whether or not generation worked
+   */
+  private recordToolCall(payload: unknown): void {
+    if (!this.trace) return;
+    this.trace.deferred = true;
+    this.trace.finish(this.toolCallStatus(payload));
+  }
+
+  /**
+   * HTTP-style status for a run_model JSON-RPC response, for metrics:
+   * 5xx for a JSON-RPC error, the generation's status (500 by default) when
+   * every image failed, 400 for other tool errors (invalid arguments)
+   */
+  private toolCallStatus(payload: unknown): number {
+    const response = payload as { error?: unknown; result?: { content?: Array<{ isError?: boolean }> } };
+    if (response.error) return 500;
+    if (response.result?.content?.some((item) => item.isError)) {
+      return this.failureStatus ?? 400;
+    }
+    return 200;
+  }
+
+  /**
+   * notifications/progress when the client sent a progressToken, otherwise
+   * a notifications/message log entry carrying the same partial result
+   */
+  private buildProgressNotification(progressToken: string | number | undefined, progress: BatchProgress): unknown {
+    const position = `${progress.index + 1}/${progress.total}`;
+    const url = progress.image && 'url' in progress.image ? this.fullUrl(progress.image.url) : undefined;
+    const text = progress.error
+      ? `Image ${position} failed: ${progress.error}`
+      : url
+        ? `Image ${position} ready: ![Image ${progress.index + 1}](${url})`
+        : `Image ${position} ready`;
+
+    if (progressToken !== undefined) {
+      return {
+        jsonrpc: '2.0',
+        method: 'notifications/progress',
+        params: {
+          progressToken,
+          progress: progress.completed,
+          total: progress.total,
+          message: text,
+        },
+      };
+    }
+
+    return {
+      jsonrpc: '2.0',
+      method: 'notifications/message',
+      params: {
+        level: progress.error ? 'warning' : 'info',
+        logger: 'run_model',
+        data: {
+          index: progress.index,
+          completed: progress.completed,
+          total: progress.total,
+          url,
+          error: progress.error,
+          text,
+        },
+      },
+    };
+  }
+
+  private fullUrl(path: string): string {
+    return path.startsWith('http') ? path : `${this.workerBaseUrl}${path}`;
   }
 
   /**
@@ -272,6 +504,7 @@ export class MCPEndpoint {
 
       if (name === 'run_model') {
         result = await this.handleRunModels(args);
+        this.recordToolCall({ result: { content: result } });
       } else if (name === 'list_models') {
         result = await this.handleListModels(args);
       } else if (name === 'describe_model') {
@@ -296,6 +529,7 @@ export class MCPEndpoint {
       });
     } catch (error) {
       const errorMessage = error instanceof Error ? error.message : String(error);
+      if (name === 'run_model') this.recordToolCall({ error: errorMessage });
       return new Response(JSON.stringify({
         jsonrpc: '2.0',
         id: message.id,
@@ -311,7 +545,7 @@ export class MCPEndpoint {
    * Handle run_model tool call
    * Routes based on taskType: "generations" (text-to-image) or "edits" (image editing)
    */
-  private async handleRunModels(args: any): Promise<any[]> {
+  private async handleRunModels(args: any, onProgress?: BatchProgressCallback): Promise<any[]> {
     const {
       taskType,
       prompt,
@@ -423,7 +657,14 @@ export class MCPEndpoint {
     }
 
     // ── Build explicitParams from OpenAI-standard fields + cf_params ──
-    const numImages = Math.min(n || 1, 8);
+    const numImages = parseImageCount(n);
+    if (numImages === null) {
+      return [{
+        type: 'text',
+        text: `Error: n must be an integer between 1 and ${MAX_IMAGES_PER_REQUEST}.`,
+        isError: true,
+      }];
+    }
     const explicitParams: Record<string, any> = {};
     if (size !== undefined) explicitParams.size = size;
 
@@ -454,7 +695,9 @@ export class MCPEndpoint {
           singleImage,
           mask,
           numImages,
-          explicitParams
+          explicitParams,
+          false,
+          onProgress
         );
       } else {
         const imageInput = Array.isArray(image) ? image : image;
@@ -463,7 +706,9 @@ export class MCPEndpoint {
           prompt,
           imageInput,
           numImages,
-          explicitParams
+          explicitParams,
+          false,
+          onProgress
         );
       }
     } else {
@@ -471,11 +716,14 @@ export class MCPEndpoint {
         model_id,
         prompt,
         numImages,
-        explicitParams
+        explicitParams,
+        false,
+        onProgress
       );
     }
 
     if (!result.success) {
+      this.failureStatus = result.status || 500;
       return [{
         type: 'text',
         text: `Error: ${result.error}`,
@@ -485,8 +733,6 @@ export class MCPEndpoint {
 
     // ── Format response ──
     const textParts: string[] = [];
-    const baseUrl = this.workerBaseUrl;
-    const fullUrl = (path: string) => path.startsWith('http') ? path : `${baseUrl}${path}`;
     const hasUrl = (img: { url?: string; b64_json?: string }): img is { url: string } => 'url' in img && !!img.url;
 
     const modeLabel = taskType === 'edits' ? (mask ? 'Inpainted' : 'Edited') : 'Generated';
@@ -495,7 +741,7 @@ export class MCPEndpoint {
       const img = result.images[0];
       textParts.push(`Image ${modeLabel.toLowerCase()} successfully!\n`);
       if (hasUrl(img)) {
-        textParts.push(`![${modeLabel} Image](${fullUrl(img.url)})`);
+        textParts.push(`![${modeLabel} Image](${this.fullUrl(img.url)})`);
       } else {
         textParts.push(`Image ${modeLabel.toLowerCase()} (base64 data available)`);
       }
@@ -503,13 +749,18 @@ export class MCPEndpoint {
       textParts.push(`${modeLabel} ${result.images.length} images:\n\n`);
       result.images.forEach((img, i) => {
         if (hasUrl(img)) {
-          textParts.push(`Image ${i + 1}: ![${modeLabel} Image ${i + 1}](${fullUrl(img.url)})\n`);
+          textParts.push(`Image ${i + 1}: ![${modeLabel} Image ${i + 1}](${this.fullUrl(img.url)})\n`);
         } else {
           textParts.push(`Image ${i + 1}: (base64 data available)\n`);
         }
       });
     }
 
+    if (result.errors && result.errors.length > 0) {
+      const failed = result.errors.map((e) => `Image ${e.index + 1}: ${e.error}`).join('\n');
+      textParts.push(`\n${result.errors.length} of ${numImages} image(s) failed:\n${failed}`);
+    }
+
     return [{
       type: 'text',
       text: textParts.join('\n'),
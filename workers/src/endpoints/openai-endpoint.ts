@@ -1,42 +1,34 @@
 // ============================================================================
 // OpenAI-Compatible REST API Endpoint
 // Implements /v1/images/generations, /v1/images/edits, /v1/images/variations
+// and async jobs (/v1/images/jobs/{id})
 // ============================================================================
 
 import type { Env, OpenAIGenerationRequest, OpenAIEditRequest, OpenAIVariationRequest, OpenAIImageResponse } from '../types.js';
-import { ImageGeneratorService } from '../services/image-generator.js';
-
-/**
- * Convert ArrayBuffer to base64 string
- */
-function arrayBufferToBase64(buffer: ArrayBuffer): string {
-  const bytes = new Uint8Array(buffer);
-  const chunkSize = 0x8000; // 32KB
-  let binary = '';
-
-  for (let i = 0; i < bytes.length; i += chunkSize) {
-    const chunk = bytes.subarray(i, i + chunkSize);
-    binary += String.fromCharCode(...(chunk as unknown as number[]));
-  }
-
-  return btoa(binary);
-}
-
-/**
- * Read a File/Blob from FormData and convert to base64 string
- */
-async function fileToBase64(file: File | Blob | null): Promise<string | undefined> {
-  if (!file) return undefined;
-  const arrayBuffer = await file.arrayBuffer();
-  return arrayBufferToBase64(arrayBuffer);
-}
+import {
+  ImageGeneratorService,
+  MAX_IMAGES_PER_REQUEST,
+  parseImageCount,
+  type BatchResult,
+} from '../services/image-generator.js';
+import type { ImageInput } from '../services/binary.js';
+import { JobStore, formatJob, type ImageJobRequest } from '../services/job-store.js';
+import { JobRunner } from '../services/job-runner.js';
+import type { RequestTrace } from '../services/metrics.js';
 
 export class OpenAIEndpoint {
   private generator: ImageGeneratorService;
+  private jobs: JobStore;
+  private runner: JobRunner;
+  private ctx?: ExecutionContext;
   private corsHeaders: Record<string, string>;
 
-  constructor(env: Env) {
-    this.generator = new ImageGeneratorService(env);
+  constructor(env: Env, ctx?: ExecutionContext, trace?: RequestTrace) {
+    this.generator = new ImageGeneratorService(env, trace);
+    this.jobs = new JobStore(env);
+    // Jobs outlive this request, so they are traced separately
+    this.runner = new JobRunner(env);
+    this.ctx = ctx;
     this.corsHeaders = {
       'Access-Control-Allow-Origin': '*',
       'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
@@ -74,6 +66,15 @@ export class OpenAIEndpoint {
         const modelId = decodeURIComponent(path.substring('/v1/models/'.length));
         return this.handleDescribeModel(modelId);
       }
+      if (path.startsWith('/v1/images/jobs/')) {
+        const rest = path.substring('/v1/images/jobs/'.length);
+        if (request.method === 'GET' && !rest.includes('/')) {
+          return this.handleGetJob(rest);
+        }
+        if (request.method === 'POST' && rest.endsWith('/cancel')) {
+          return this.handleCancelJob(rest.substring(0, rest.length - '/cancel'.length));
+        }
+      }
 
       return new Response(JSON.stringify({ error: 'Not found' }), {
         status: 404,
@@ -109,33 +110,41 @@ export class OpenAIEndpoint {
 
     // Use model ID directly (full model ID required)
     const modelId = req.model || '@cf/black-forest-labs/flux-1-schnell';
-    const n = req.n || 1;
+    const n = parseImageCount(req.n);
+    if (n === null) {
+      return this.invalidCount();
+    }
 
     // Determine if we should return base64 or url
     const returnBase64 = req.response_format === 'b64_json';
 
+    const params = {
+      size: req.size,
+      steps: (req as any).steps,
+      seed: (req as any).seed,
+      guidance: (req as any).guidance,
+      negative_prompt: (req as any).negative_prompt,
+    };
+
+    if (this.wantsAsync(request, (req as any).async)) {
+      return this.submitJob(
+        request,
+        { task: 'generations', model: modelId, prompt: req.prompt, n, params },
+        { returnBase64, webhookUrl: (req as any).webhook_url }
+      );
+    }
+
     // Generate images
     const result = await this.generator.generateImages(
       modelId,
       req.prompt,
-      Math.min(n, 8), // Cap at 8 images
-      {
-        size: req.size,
-        steps: (req as any).steps,
-        seed: (req as any).seed,
-        guidance: (req as any).guidance,
-        negative_prompt: (req as any).negative_prompt,
-      },
+      n,
+      params,
       returnBase64
     );
 
     if (!result.success) {
-      return new Response(JSON.stringify({
-        error: { message: result.error, type: 'api_error' },
-      }), {
-        status: 500,
-        headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
-      });
+      return this.generationFailed(result);
     }
 
     // Build response based on response_format
@@ -172,12 +181,14 @@ export class OpenAIEndpoint {
   private async handleEdits(request: Request): Promise<Response> {
     const contentType = request.headers.get('content-type') || '';
 
-    let imageDataArr: string[] = [];
-    let maskData: string | undefined;
+    let imageDataArr: ImageInput[] = [];
+    let maskData: ImageInput | undefined;
     let prompt: string;
     let modelId: string;
-    let n: number;
+    let n: number | null;
     let returnBase64 = false;
+    let asyncFlag: unknown;
+    let webhookUrl: string | undefined;
 
     // Collect only explicitly-provided params (undefined = not provided,
     // so --key=value in prompt can fill gaps via ParamParser)
@@ -191,21 +202,23 @@ export class OpenAIEndpoint {
       const arrayEntries = formData.getAll('image[]') as (File | string)[];
       const imageEntries = [...allEntries, ...arrayEntries];
 
+      // Uploaded files stay binary; they are only base64-encoded if the model needs it
       for (const entry of imageEntries) {
         if (entry instanceof File) {
-          const b64 = await fileToBase64(entry);
-          if (b64) imageDataArr.push(b64);
+          if (entry.size > 0) imageDataArr.push(entry);
         } else if (typeof entry === 'string' && entry.length > 0) {
           imageDataArr.push(entry);
         }
       }
 
-      const maskFile = formData.get('mask') as File | null;
-      maskData = await fileToBase64(maskFile);
+      const maskEntry = formData.get('mask') as File | string | null;
+      if (maskEntry instanceof File ? maskEntry.size > 0 : !!maskEntry) {
+        maskData = maskEntry as ImageInput;
+      }
 
       prompt = formData.get('prompt') as string;
       modelId = (formData.get('model') as string) || '@cf/stabilityai/stable-diffusion-xl-base-1.0';
-      n = parseInt(formData.get('n') as string) || 1;
+      n = parseImageCount(formData.get('n'));
       returnBase64 = formData.get('response_format') === 'b64_json';
 
       // Extract optional CF-specific params from form data (only if provided)
@@ -226,6 +239,9 @@ export class OpenAIEndpoint {
 
       const strengthVal = formData.get('strength') as string | null;
       if (strengthVal) explicitParams.strength = parseFloat(strengthVal);
+
+      asyncFlag = formData.get('async');
+      webhookUrl = (formData.get('webhook_url') as string | null) || undefined;
     } else {
       const body = await request.json();
       const req = body as OpenAIEditRequest;
@@ -241,7 +257,7 @@ export class OpenAIEndpoint {
       maskData = (req as any).mask ?? (req as any).mask_b64;
       prompt = req.prompt;
       modelId = req.model || '@cf/stabilityai/stable-diffusion-xl-base-1.0';
-      n = req.n || 1;
+      n = parseImageCount(req.n);
       returnBase64 = req.response_format === 'b64_json';
 
       // Extract optional CF-specific params from JSON body (only if provided)
@@ -251,6 +267,9 @@ export class OpenAIEndpoint {
       if (req.guidance !== undefined) explicitParams.guidance = req.guidance;
       if (req.negative_prompt !== undefined) explicitParams.negative_prompt = req.negative_prompt;
       if (req.strength !== undefined) explicitParams.strength = req.strength;
+
+      asyncFlag = (req as any).async;
+      webhookUrl = (req as any).webhook_url;
     }
 
     if (imageDataArr.length === 0 || !prompt) {
@@ -262,30 +281,35 @@ export class OpenAIEndpoint {
       });
     }
 
-    const count = Math.min(n, 8);
+    if (n === null) {
+      return this.invalidCount();
+    }
+
+    if (this.wantsAsync(request, asyncFlag)) {
+      return this.submitJob(
+        request,
+        { task: 'edits', model: modelId, prompt, n, params: explicitParams },
+        { returnBase64, webhookUrl, images: maskData ? [imageDataArr[0]] : imageDataArr, mask: maskData }
+      );
+    }
 
     // Route to appropriate service method
     let result;
     if (maskData) {
       // Inpainting (masked edit) — single image only
       result = await this.generator.generateInpaints(
-        modelId, prompt, imageDataArr[0], maskData, count, explicitParams, returnBase64
+        modelId, prompt, imageDataArr[0], maskData, n, explicitParams, returnBase64
       );
     } else {
       // Image-to-image — pass single string or array depending on count
       const imageInput = imageDataArr.length === 1 ? imageDataArr[0] : imageDataArr;
       result = await this.generator.generateImageToImages(
-        modelId, prompt, imageInput, count, explicitParams, returnBase64
+        modelId, prompt, imageInput, n, explicitParams, returnBase64
       );
     }
 
     if (!result.success) {
-      return new Response(JSON.stringify({
-        error: { message: result.error, type: 'api_error' },
-      }), {
-        status: 500,
-        headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
-      });
+      return this.generationFailed(result);
     }
 
     // Build OpenAI-compatible response (same pattern as handleGenerations)
@@ -321,9 +345,9 @@ export class OpenAIEndpoint {
   private async handleVariations(request: Request): Promise<Response> {
     const contentType = request.headers.get('content-type') || '';
 
-    let imageDataArr: string[] = [];
+    let imageDataArr: ImageInput[] = [];
     let modelId: string;
-    let n: number;
+    let n: number | null;
     let returnBase64 = false;
     const explicitParams: Record<string, any> = {};
 
@@ -335,17 +359,17 @@ export class OpenAIEndpoint {
       const arrayEntries = formData.getAll('image[]') as (File | string)[];
       const imageEntries = [...allEntries, ...arrayEntries];
 
+      // Uploaded files stay binary; they are only base64-encoded if the model needs it
       for (const entry of imageEntries) {
         if (entry instanceof File) {
-          const b64 = await fileToBase64(entry);
-          if (b64) imageDataArr.push(b64);
+          if (entry.size > 0) imageDataArr.push(entry);
         } else if (typeof entry === 'string' && entry.length > 0) {
           imageDataArr.push(entry);
         }
       }
 
       modelId = (formData.get('model') as string) || '@cf/black-forest-labs/flux-2-klein-4b';
-      n = parseInt(formData.get('n') as string) || 1;
+      n = parseImageCount(formData.get('n'));
       returnBase64 = formData.get('response_format') === 'b64_json';
 
       const sizeVal = formData.get('size') as string | null;
@@ -371,7 +395,7 @@ export class OpenAIEndpoint {
       }
 
       modelId = req.model || '@cf/black-forest-labs/flux-2-klein-4b';
-      n = req.n || 1;
+      n = parseImageCount(req.n);
       returnBase64 = req.response_format === 'b64_json';
 
       if (req.size !== undefined) explicitParams.size = req.size;
@@ -389,7 +413,9 @@ export class OpenAIEndpoint {
       });
     }
 
-    const count = Math.min(n, 8);
+    if (n === null) {
+      return this.invalidCount();
+    }
 
     // Default strength for variations (more faithful to original)
     if (explicitParams.strength === undefined) {
@@ -401,18 +427,13 @@ export class OpenAIEndpoint {
       modelId,
       '', // Empty prompt for variations
       imageInput,
-      count,
+      n,
       explicitParams,
       returnBase64
     );
 
     if (!result.success) {
-      return new Response(JSON.stringify({
-        error: { message: result.error, type: 'api_error' },
-      }), {
-        status: 500,
-        headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
-      });
+      return this.generationFailed(result);
     }
 
     // Build OpenAI-compatible response
@@ -440,6 +461,148 @@ export class OpenAIEndpoint {
     });
   }
 
+  /**
+   * Whether the client asked for an async job: `Prefer: respond-async`
+   * (RFC 7240) or an `async` field in the request body
+   */
+  private wantsAsync(request: Request, flag: unknown): boolean {
+    const prefer = request.headers.get('prefer') || '';
+    return /\brespond-async\b/i.test(prefer) || flag === true || flag === 'true';
+  }
+
+  /**
+   * Create an async job and return 202 with its id right away
+   */
+  private async submitJob(
+    request: Request,
+    jobRequest: ImageJobRequest,
+    options: { returnBase64: boolean; webhookUrl?: string; images?: ImageInput[]; mask?: ImageInput }
+  ): Promise<Response> {
+    if (options.returnBase64) {
+      return new Response(JSON.stringify({
+        error: {
+          message: 'response_format b64_json is not supported for async jobs; results are returned as URLs',
+          type: 'invalid_request_error',
+          param: 'response_format',
+        },
+      }), {
+        status: 400,
+        headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+      });
+    }
+
+    if (options.webhookUrl !== undefined && !this.isValidWebhookUrl(options.webhookUrl)) {
+      return new Response(JSON.stringify({
+        error: { message: 'webhook_url must be an http(s) URL', type: 'invalid_request_error', param: 'webhook_url' },
+      }), {
+        status: 400,
+        headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+      });
+    }
+
+    const job = await this.jobs.create(jobRequest, {
+      baseUrl: new URL(request.url).origin,
+      webhookUrl: options.webhookUrl,
+      images: options.images,
+      mask: options.mask,
+    });
+    await this.runner.submit(job, this.ctx);
+
+    return new Response(JSON.stringify(formatJob(job)), {
+      status: 202,
+      headers: {
+        ...this.corsHeaders,
+        'Content-Type': 'application/json',
+        Location: `/v1/images/jobs/${job.id}`,
+      },
+    });
+  }
+
+  /**
+   * GET /v1/images/jobs/{id}
+   * Poll an async job
+   */
+  private async handleGetJob(jobId: string): Promise<Response> {
+    const stored = await this.jobs.get(jobId);
+    if (!stored) {
+      return this.jobNotFound(jobId);
+    }
+    // A job whose worker went away would otherwise stay running forever
+    const job = await this.runner.failIfStale(stored, this.ctx);
+
+    return new Response(JSON.stringify(formatJob(job)), {
+      headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+    });
+  }
+
+  /**
+   * POST /v1/images/jobs/{id}/cancel
+   * Cancel a queued or running job (images already generated are kept)
+   */
+  private async handleCancelJob(jobId: string): Promise<Response> {
+    const job = await this.jobs.cancel(jobId);
+    if (!job) {
+      return this.jobNotFound(jobId);
+    }
+
+    return new Response(JSON.stringify(formatJob(job)), {
+      headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+    });
+  }
+
+  /**
+   * Error response for a failed batch: 429/503 with Retry-After when
+   * Workers AI is rate limited or unavailable, 500 otherwise
+   */
+  private generationFailed(result: BatchResult): Response {
+    const headers: Record<string, string> = { ...this.corsHeaders, 'Content-Type': 'application/json' };
+    if (result.retryAfter !== undefined) {
+      headers['Retry-After'] = String(result.retryAfter);
+    }
+
+    return new Response(JSON.stringify({
+      error: {
+        message: result.error,
+        type: result.status === 429 ? 'rate_limit_error' : 'api_error',
+      },
+    }), {
+      status: result.status || 500,
+      headers,
+    });
+  }
+
+  private invalidCount(): Response {
+    return new Response(JSON.stringify({
+      error: {
+        message: `n must be an integer between 1 and ${MAX_IMAGES_PER_REQUEST}`,
+        type: 'invalid_request_error',
+        param: 'n',
+        code: null,
+      },
+    }), {
+      status: 400,
+      headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+    });
+  }
+
+  private jobNotFound(jobId: string): Response {
+    return new Response(JSON.stringify({
+      error: { message: `Job ${jobId} not found`, type: 'invalid_request_error', code: 'job_not_found' },
+    }), {
+      status: 404,
+      headers: { ...this.corsHeaders, 'Content-Type': 'application/json' },
+    });
+  }
+
+  private isValidWebhookUrl(value: string): boolean {
+    try {
+      const url = new URL(value);
+      return url.protocol === 'https:' || url.protocol === 'http:';
+    } catch {
+      return false;
+    }
+  }
+
   /**
    * GET /v1/models
    * List available models
@@ -3,15 +3,38 @@
 // Routes all requests to appropriate handlers
 // ============================================================================
 
-import type { Env } from './types.js';
+import type { Env, ImageJobMessage } from './types.js';
 import { OpenAIEndpoint } from './endpoints/openai-endpoint.js';
 import { MCPEndpoint } from './endpoints/mcp-endpoint.js';
 import { serveFrontend } from './endpoints/frontend.js';
+import { serveImage } from './endpoints/image-proxy.js';
+import { ImageGeneratorService } from './services/image-generator.js';
+import { JobRunner } from './services/job-runner.js';
+import { RequestTrace, renderPrometheus, snapshot } from './services/metrics.js';
 import { listModels } from './config/models.js';
 import { authenticateRequest, requiresAuth, createUnauthorizedResponse } from './middleware/auth.js';
 
+// Durable Object class for MCP_SESSIONS
+export { MCPSessionObject } from './services/mcp-sessions.js';
+
+/**
+ * Record the request in the metrics registry and expose its stage timings.
+ * Streamed tool calls finish their own trace when the stream closes; the
+ * header only covers the stages run before it was sent.
+ */
+function withServerTiming(response: Response, trace: RequestTrace): Response {
+  if (!trace.deferred) {
+    trace.finish(response.status);
+  }
+  const traced = new Response(response.body, response);
+  traced.headers.set('Server-Timing', trace.serverTiming());
+  // Let cross-origin pages read the timings (CORS is open as well)
+  traced.headers.set('Timing-Allow-Origin', '*');
+  return traced;
+}
+
 export default {
-  async fetch(request: Request, env: Env): Promise<Response> {
+  async fetch(request: Request, env: Env, ctx: ExecutionContext): Promise<Response> {
     const url = new URL(request.url);
     const path = url.pathname;
 
@@ -99,14 +122,16 @@ export default {
 
       // Route: OpenAI-compatible API
       if (path.startsWith('/v1/')) {
-        const openai = new OpenAIEndpoint(env);
-        return openai.handle(request);
+        const trace = new RequestTrace('openai');
+        const openai = new OpenAIEndpoint(env, ctx, trace);
+        return withServerTiming(await openai.handle(request), trace);
       }
 
       // Route: MCP endpoint (handles /mcp, /mcp/message, /mcp/?transport=sse)
       if (path === '/mcp' || path === '/mcp/message' || path.startsWith('/mcp/')) {
-        const mcp = new MCPEndpoint(env);
-        return mcp.handle(request);
+        const trace = new RequestTrace('mcp');
+        const mcp = new MCPEndpoint(env, ctx, trace);
+        return withServerTiming(await mcp.handle(request), trace);
       }
 
       // Route: API endpoints
@@ -117,23 +142,41 @@ export default {
         });
       }
 
-      // Route: Image proxy (serve images from R2 through the worker)
-      if (path.startsWith('/images/')) {
-        const imageKey = path.substring(1); // Remove leading slash
-        try {
-          const image = await env.IMAGE_BUCKET.get(imageKey);
-          if (!image) {
-            return new Response('Image not found', { status: 404 });
-          }
-          return new Response(image.body, {
-            headers: {
-              'Content-Type': image.httpMetadata?.contentType || 'image/png',
-              'Cache-Control': 'public, max-age=86400',
-            },
+      // Route: Per-account AI routing counters (requires auth when API_KEYS is set)
+      if (path === '/api/internal/accounts' && request.method === 'GET') {
+        const generator = new ImageGeneratorService(env);
+        return new Response(JSON.stringify({ accounts: generator.getAccountStats() }), {
+          headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        });
+      }
+
+      // Route: Generation cache counters (requires auth when API_KEYS is set)
+      if (path === '/api/internal/cache' && request.method === 'GET') {
+        const generator = new ImageGeneratorService(env);
+        return new Response(JSON.stringify(generator.getCacheStats()), {
+          headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+        });
+      }
+
+      // Route: Latency histograms, error and byte counters for this isolate
+      // (requires auth when API_KEYS is set). Prometheus text by default,
+      // JSON with ?format=json or Accept: application/json.
+      if (path === '/metrics' && request.method === 'GET') {
+        const wantsJson = url.searchParams.get('format') === 'json'
+          || (request.headers.get('Accept') || '').includes('application/json');
+        if (wantsJson) {
+          return new Response(JSON.stringify(snapshot()), {
+            headers: { ...corsHeaders, 'Content-Type': 'application/json' },
           });
-        } catch (error) {
-          return new Response('Error fetching image', { status: 500 });
         }
+        return new Response(renderPrometheus(), {
+          headers: { ...corsHeaders, 'Content-Type': 'text/plain; version=0.0.4; charset=utf-8' },
+        });
+      }
+
+      // Route: Image proxy (serve images from R2 through the worker)
+      if (path.startsWith('/images/')) {
+        return serveImage(request, env, ctx);
       }
 
       // 404 for unknown routes
@@ -163,4 +206,19 @@ export default {
       console.log(`Cleaned up ${deleted} expired images`);
     }
   },
-} satisfies ExportedHandler<Env>;
+
+  // Queue consumer for async image jobs (IMAGE_JOBS binding)
+  async queue(batch: MessageBatch<ImageJobMessage>, env: Env): Promise<void> {
+    const runner = new JobRunner(env);
+    for (const message of batch.messages) {
+      try {
+        await runner.run(message.body.jobId);
+        message.ack();
+      } catch (error) {
+        // Job record could not be read or written; let the queue redeliver
+        console.error(`Job ${message.body.jobId} failed:`, error);
+        message.retry();
+      }
+    }
+  },
+} satisfies ExportedHandler<Env, ImageJobMessage>;
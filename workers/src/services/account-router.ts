@@ -0,0 +1,311 @@
+// ============================================================================
+// Account Router - Health-aware selection across Workers AI accounts
+// Least-outstanding weighted picking, circuit breakers, Retry-After backoff
+// ============================================================================
+
+import type { AIAccount } from '../types.js';
+
+// Consecutive failures before an account's circuit opens
+const FAILURE_THRESHOLD = 3;
+// Default time an open circuit stays open before a half-open probe
+const OPEN_COOLDOWN_MS = 30_000;
+// Cooldown after a 429 that came without Retry-After
+const RATE_LIMIT_COOLDOWN_MS = 5_000;
+// Upper bound for any single Retry-After wait
+const MAX_RETRY_AFTER_MS = 60_000;
+// Calls slower than this count towards opening the circuit
+const SLOW_CALL_MS = 60_000;
+// EWMA smoothing factor for latency
+const LATENCY_ALPHA = 0.2;
+
+interface AccountState {
+  outstanding: number;
+  requests: number;
+  successes: number;
+  failures: number;
+  rateLimited: number;
+  consecutiveFailures: number;
+  openUntil: number;
+  halfOpenProbe: boolean;
+  latencyEwmaMs: number;
+  lastStatus?: number;
+  lastError?: string;
+}
+
+export interface AccountStats {
+  account_id: string;
+  weight: number;
+  state: 'closed' | 'open' | 'half-open';
+  outstanding: number;
+  requests: number;
+  successes: number;
+  failures: number;
+  rateLimited: number;
+  latencyEwmaMs: number;
+  openUntil?: number;
+  lastStatus?: number;
+  lastError?: string;
+}
+
+// Health state is kept per isolate so every request shares it
+const accountStates = new Map<string, AccountState>();
+
+function getState(accountId: string): AccountState {
+  let state = accountStates.get(accountId);
+  if (!state) {
+    state = {
+      outstanding: 0,
+      requests: 0,
+      successes: 0,
+      failures: 0,
+      rateLimited: 0,
+      consecutiveFailures: 0,
+      openUntil: 0,
+      halfOpenProbe: false,
+      latencyEwmaMs: 0,
+    };
+    accountStates.set(accountId, state);
+  }
+  return state;
+}
+
+/**
+ * Parse a Retry-After header (delta seconds or HTTP date) into milliseconds
+ */
+export function parseRetryAfter(value: string | null, now: number = Date.now()): number | undefined {
+  if (!value) return undefined;
+
+  const seconds = Number(value);
+  if (Number.isFinite(seconds)) {
+    return Math.min(Math.max(0, seconds * 1000), MAX_RETRY_AFTER_MS);
+  }
+
+  const date = Date.parse(value);
+  if (!Number.isNaN(date)) {
+    return Math.min(Math.max(0, date - now), MAX_RETRY_AFTER_MS);
+  }
+
+  return undefined;
+}
+
+/**
+ * Whether a status code is the account's fault (rate limit, quota, auth,
+ * upstream error) and the call should be retried on another account
+ */
+export function isAccountFailure(status: number): boolean {
+  return status === 401 || status === 403 || status === 408 || status === 429 || status >= 500;
+}
+
+/**
+ * No account can take a call right now. `status` is 429 when every account
+ * was rate limited, 503 otherwise; `retryAfterMs` is when the first one recovers.
+ */
+export class AccountsUnavailableError extends Error {
+  readonly status: 429 | 503;
+  readonly retryAfterMs: number;
+
+  constructor(status: 429 | 503, retryAfterMs: number) {
+    const seconds = Math.max(1, Math.ceil(retryAfterMs / 1000));
+    super(status === 429
+      ? `Workers AI rate limit reached on every account; retry in ${seconds}s`
+      : `Workers AI is unavailable on every account; retry in ${seconds}s`);
+    this.name = 'AccountsUnavailableError';
+    this.status = status;
+    this.retryAfterMs = retryAfterMs;
+  }
+
+  // Whole seconds for a Retry-After header
+  get retryAfterSeconds(): number {
+    return Math.max(1, Math.ceil(this.retryAfterMs / 1000));
+  }
+}
+
+export class AccountRouter {
+  constructor(private accounts: AIAccount[]) {}
+
+  private weightOf(account: AIAccount): number {
+    const weight = Number(account.weight ?? 1);
+    return Number.isFinite(weight) && weight > 0 ? weight : 1;
+  }
+
+  private circuitState(state: AccountState, now: number): 'closed' | 'open' | 'half-open' {
+    if (state.openUntil === 0) return 'closed';
+    return now < state.openUntil ? 'open' : 'half-open';
+  }
+
+  /**
+   * Pick the best available account, skipping any in `exclude`.
+   * Closed circuits are preferred by (outstanding + 1) / weight, then latency;
+   * a half-open account is only handed out for a single probe at a time.
+   * Returns null when every candidate is open.
+   */
+  pick(exclude: Set<string> = new Set()): AIAccount | null {
+    const now = Date.now();
+    let best: AIAccount | null = null;
+    let bestScore = Infinity;
+    let bestLatency = Infinity;
+
+    for (const account of this.accounts) {
+      if (exclude.has(account.account_id)) continue;
+
+      const state = getState(account.account_id);
+      const circuit = this.circuitState(state, now);
+      if (circuit === 'open') continue;
+      if (circuit === 'half-open' && state.halfOpenProbe) continue;
+
+      // Half-open accounts rank behind every closed one
+      const penalty = circuit === 'half-open' ? 1_000_000 : 0;
+      const score = penalty + (state.outstanding + 1) / this.weightOf(account);
+
+      if (
+        score < bestScore ||
+        (score === bestScore && state.latencyEwmaMs < bestLatency) ||
+        (score === bestScore && state.latencyEwmaMs === bestLatency && Math.random() < 0.5)
+      ) {
+        best = account;
+        bestScore = score;
+        bestLatency = state.latencyEwmaMs;
+      }
+    }
+
+    if (best) {
+      const state = getState(best.account_id);
+      if (this.circuitState(state, now) === 'half-open') {
+        state.halfOpenProbe = true;
+      }
+    }
+
+    return best;
+  }
+
+  /**
+   * Error for callers when no account could take a call
+   */
+  unavailableError(): AccountsUnavailableError {
+    const rateLimited = this.accounts.every((account) => getState(account.account_id).lastStatus === 429);
+    return new AccountsUnavailableError(rateLimited ? 429 : 503, this.nextAvailableIn());
+  }
+
+  /**
+   * Milliseconds until the earliest open circuit (not in `exclude`) closes
+   */
+  nextAvailableIn(exclude: Set<string> = new Set()): number {
+    const now = Date.now();
+    let wait = Infinity;
+    for (const account of this.accounts) {
+      if (exclude.has(account.account_id)) continue;
+      const state = getState(account.account_id);
+      wait = Math.min(wait, Math.max(0, state.openUntil - now));
+    }
+    return wait;
+  }
+
+  /**
+   * Mark the start of a call on an account
+   */
+  begin(account: AIAccount): void {
+    const state = getState(account.account_id);
+    state.outstanding++;
+    state.requests++;
+  }
+
+  /**
+   * Record a successful call
+   */
+  recordSuccess(account: AIAccount, latencyMs: number): void {
+    const state = getState(account.account_id);
+    state.outstanding = Math.max(0, state.outstanding - 1);
+    state.successes++;
+    state.lastStatus = 200;
+    state.lastError = undefined;
+    this.updateLatency(state, latencyMs);
+
+    if (latencyMs > SLOW_CALL_MS) {
+      this.tripIfNeeded(state, OPEN_COOLDOWN_MS);
+      return;
+    }
+
+    state.consecutiveFailures = 0;
+    state.openUntil = 0;
+    state.halfOpenProbe = false;
+  }
+
+  /**
+   * Record a failed call. 429s open the circuit for Retry-After (or a short
+   * default cooldown); other failures open it after FAILURE_THRESHOLD in a row.
+   */
+  recordFailure(
+    account: AIAccount,
+    latencyMs: number,
+    status: number | undefined,
+    error: string,
+    retryAfterMs?: number
+  ): void {
+    const state = getState(account.account_id);
+    state.outstanding = Math.max(0, state.outstanding - 1);
+    state.failures++;
+    state.lastStatus = status;
+    state.lastError = error.substring(0, 200);
+    this.updateLatency(state, latencyMs);
+
+    if (status === 429) {
+      state.rateLimited++;
+      state.consecutiveFailures++;
+      state.openUntil = Date.now() + (retryAfterMs ?? RATE_LIMIT_COOLDOWN_MS);
+      state.halfOpenProbe = false;
+      return;
+    }
+
+    this.tripIfNeeded(state, retryAfterMs ?? OPEN_COOLDOWN_MS);
+  }
+
+  /**
+   * Release an account without counting success or failure
+   * (e.g. the request itself was invalid)
+   */
+  release(account: AIAccount): void {
+    const state = getState(account.account_id);
+    state.outstanding = Math.max(0, state.outstanding - 1);
+    state.halfOpenProbe = false;
+  }
+
+  /**
+   * Per-account counters for monitoring
+   */
+  stats(): AccountStats[] {
+    const now = Date.now();
+    return this.accounts.map((account) => {
+      const state = getState(account.account_id);
+      const circuit = this.circuitState(state, now);
+      return {
+        account_id: account.account_id,
+        weight: this.weightOf(account),
+        state: circuit,
+        outstanding: state.outstanding,
+        requests: state.requests,
+        successes: state.successes,
+        failures: state.failures,
+        rateLimited: state.rateLimited,
+        latencyEwmaMs: Math.round(state.latencyEwmaMs),
+        openUntil: circuit === 'closed' ? undefined : state.openUntil,
+        lastStatus: state.lastStatus,
+        lastError: state.lastError,
+      };
+    });
+  }
+
+  private tripIfNeeded(state: AccountState, cooldownMs: number): void {
+    state.consecutiveFailures++;
+    const wasProbe = state.halfOpenProbe;
+    state.halfOpenProbe = false;
+    if (wasProbe || state.consecutiveFailures >= FAILURE_THRESHOLD) {
+      state.openUntil = Date.now() + cooldownMs;
+    }
+  }
+
+  private updateLatency(state: AccountState, latencyMs: number): void {
+    state.latencyEwmaMs = state.latencyEwmaMs === 0
+      ? latencyMs
+      : state.latencyEwmaMs * (1 - LATENCY_ALPHA) + latencyMs * LATENCY_ALPHA;
+  }
+}
@@ -0,0 +1,75 @@
+// ============================================================================
+// Binary helpers - Image data conversions for the generation pipeline
+// Images travel as Blob/ArrayBuffer and are base64-encoded only where a
+// wire format requires it (JSON model payloads, b64_json responses)
+// ============================================================================
+
+/**
+ * Image input accepted by the generator: base64 string (optionally a data
+ * URI), raw bytes, or a Blob/File straight from multipart form data
+ */
+export type ImageInput = string | ArrayBuffer | Uint8Array | Blob;
+
+/**
+ * Strip a data URI prefix from a base64 string
+ */
+export function stripDataUri(data: string): string {
+  return data.replace(/^data:[^;,]+;base64,/, '');
+}
+
+/**
+ * Decode base64 (or a base64 data URI) into bytes
+ */
+export function base64ToBytes(base64: string): Uint8Array {
+  const binary = atob(stripDataUri(base64));
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return bytes;
+}
+
+/**
+ * Encode bytes as base64
+ */
+export function bytesToBase64(data: ArrayBuffer | Uint8Array): string {
+  const bytes = data instanceof Uint8Array ? data : new Uint8Array(data);
+  const chunkSize = 0x8000; // 32KB, well below the argument limit
+  const parts: string[] = [];
+
+  for (let i = 0; i < bytes.length; i += chunkSize) {
+    const chunk = bytes.subarray(i, i + chunkSize);
+    parts.push(String.fromCharCode.apply(null, chunk as unknown as number[]));
+  }
+
+  return btoa(parts.join(''));
+}
+
+/**
+ * ArrayBuffer covering exactly the bytes of a view, without copying when
+ * the view already spans its whole buffer
+ */
+export function viewToArrayBuffer(view: Uint8Array): ArrayBuffer {
+  if (view.byteOffset === 0 && view.byteLength === view.buffer.byteLength) {
+    return view.buffer as ArrayBuffer;
+  }
+  return view.buffer.slice(view.byteOffset, view.byteOffset + view.byteLength) as ArrayBuffer;
+}
+
+/**
+ * Image input as a Blob for multipart upload (no copy for Blob/bytes)
+ */
+export function toBlob(input: ImageInput, type: string = 'image/png'): Blob {
+  if (input instanceof Blob) return input;
+  if (typeof input === 'string') return new Blob([base64ToBytes(input)], { type });
+  return new Blob([input], { type });
+}
+
+/**
+ * Image input as base64 (for JSON payloads); strings pass through
+ */
+export async function toBase64(input: ImageInput): Promise<string> {
+  if (typeof input === 'string') return stripDataUri(input);
+  if (input instanceof Blob) return bytesToBase64(await input.arrayBuffer());
+  return bytesToBase64(input);
+}
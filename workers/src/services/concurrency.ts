@@ -0,0 +1,83 @@
+// ============================================================================
+// Concurrency helpers - Bounded fan-out for batch generation
+// ============================================================================
+
+/**
+ * Counting semaphore used to cap in-flight work (e.g. per AI account)
+ */
+export class Semaphore {
+  private available: number;
+  private waiters: Array<() => void> = [];
+
+  constructor(private readonly limit: number) {
+    this.available = Math.max(1, limit);
+  }
+
+  /**
+   * Acquire a slot, waiting until one is free
+   */
+  async acquire(): Promise<void> {
+    if (this.available > 0) {
+      this.available--;
+      return;
+    }
+    await new Promise<void>((resolve) => this.waiters.push(resolve));
+  }
+
+  /**
+   * Release a slot, handing it directly to the next waiter if any
+   */
+  release(): void {
+    const next = this.waiters.shift();
+    if (next) {
+      next();
+    } else {
+      this.available = Math.min(this.available + 1, Math.max(1, this.limit));
+    }
+  }
+
+  /**
+   * Run a task while holding a slot
+   */
+  async run<T>(task: () => Promise<T>): Promise<T> {
+    await this.acquire();
+    try {
+      return await task();
+    } finally {
+      this.release();
+    }
+  }
+}
+
+/**
+ * Run `count` indexed tasks with at most `limit` in flight.
+ * Results are returned in index order regardless of completion order.
+ */
+export async function mapWithConcurrency<T>(
+  count: number,
+  limit: number,
+  task: (index: number) => Promise<T>
+): Promise<T[]> {
+  const results = new Array<T>(count);
+  let next = 0;
+
+  const worker = async (): Promise<void> => {
+    while (next < count) {
+      const index = next++;
+      results[index] = await task(index);
+    }
+  };
+
+  const workers = Math.max(1, Math.min(limit, count));
+  await Promise.all(Array.from({ length: workers }, () => worker()));
+
+  return results;
+}
+
+/**
+ * Parse a positive integer setting, falling back to a default
+ */
+export function parseConcurrency(value: string | undefined, fallback: number): number {
+  const parsed = parseInt(value || '', 10);
+  return Number.isFinite(parsed) && parsed > 0 ? parsed : fallback;
+}
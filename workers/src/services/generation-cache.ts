@@ -0,0 +1,215 @@
+// ============================================================================
+// Generation Cache - Content-addressed reuse of deterministic generations
+// Keyed by SHA-256 of (model id + canonical Cloudflare payload); pointers to
+// the stored image live in R2 under cache/, fronted by an in-isolate LRU
+// ============================================================================
+
+import type { Env } from '../types.js';
+
+export const CACHE_PREFIX = 'cache/';
+
+// Max pointer entries kept in the in-isolate LRU
+const MEMORY_CACHE_SIZE = 256;
+
+// Entries with less than this share of IMAGE_EXPIRY_HOURS left count as
+// misses, so a hit never hands out a URL that is about to stop working
+const MIN_REMAINING_FRACTION = 0.1;
+
+export interface CacheEntry {
+  id: string;
+  key: string;
+  url: string;
+  expiresAt: number;
+  // Image data (base64 or bytes), only present on the request that produced the entry
+  data?: string | ArrayBuffer;
+}
+
+export interface CacheStats {
+  hits: number;
+  memoryHits: number;
+  r2Hits: number;
+  misses: number;
+  coalesced: number;
+  stores: number;
+  errors: number;
+}
+
+// Shared across requests handled by this isolate
+const memoryCache = new Map<string, CacheEntry>();
+const inFlight = new Map<string, Promise<{ entry: CacheEntry | null; hit: boolean }>>();
+const stats: CacheStats = { hits: 0, memoryHits: 0, r2Hits: 0, misses: 0, coalesced: 0, stores: 0, errors: 0 };
+
+/**
+ * JSON.stringify with object keys sorted at every level
+ */
+function canonicalJSON(value: unknown): string {
+  if (value === null || typeof value !== 'object') {
+    return JSON.stringify(value) ?? 'null';
+  }
+  if (Array.isArray(value)) {
+    return `[${value.map(canonicalJSON).join(',')}]`;
+  }
+  const entries = Object.entries(value as Record<string, unknown>)
+    .filter(([, v]) => v !== undefined)
+    .sort(([a], [b]) => (a < b ? -1 : a > b ? 1 : 0));
+  return `{${entries.map(([k, v]) => `${JSON.stringify(k)}:${canonicalJSON(v)}`).join(',')}}`;
+}
+
+export class GenerationCache {
+  private bucket: R2Bucket;
+  private enabled: boolean;
+  private minRemainingMs: number;
+
+  constructor(env: Env) {
+    this.bucket = env.IMAGE_BUCKET;
+    const expiryHours = parseInt(env.IMAGE_EXPIRY_HOURS || '24', 10);
+    this.minRemainingMs = expiryHours * 60 * 60 * 1000 * MIN_REMAINING_FRACTION;
+    this.enabled = ['1', 'true', 'yes'].includes((env.GENERATION_CACHE || '').toLowerCase());
+  }
+
+  /**
+   * Whether caching applies: opt-in via GENERATION_CACHE and only for
+   * requests with an explicit seed (otherwise output is not deterministic)
+   */
+  isEnabledFor(seed: unknown): boolean {
+    return this.enabled && seed !== undefined && seed !== null && seed !== '';
+  }
+
+  /**
+   * Content hash of a model id and its Cloudflare AI payload
+   */
+  async keyFor(modelId: string, payload: Record<string, any>): Promise<string> {
+    const bytes = new TextEncoder().encode(canonicalJSON({ model: modelId, payload }));
+    const digest = await crypto.subtle.digest('SHA-256', bytes);
+    return [...new Uint8Array(digest)].map((b) => b.toString(16).padStart(2, '0')).join('');
+  }
+
+  /**
+   * Return the cached entry for `hash`, or run `produce` once and cache its
+   * result. Concurrent calls for the same hash share a single `produce`.
+   */
+  async getOrCreate(
+    hash: string,
+    produce: () => Promise<CacheEntry | null>
+  ): Promise<{ entry: CacheEntry | null; hit: boolean }> {
+    const pending = inFlight.get(hash);
+    if (pending) {
+      stats.coalesced++;
+      return pending;
+    }
+
+    // Registered before the first await so concurrent callers coalesce
+    // onto the lookup as well as the upstream call
+    const promise = (async () => {
+      const cached = await this.lookup(hash);
+      if (cached) {
+        return { entry: cached, hit: true };
+      }
+
+      stats.misses++;
+      const entry = await produce();
+      if (entry) {
+        await this.store(hash, entry);
+      }
+      return { entry, hit: false };
+    })();
+
+    inFlight.set(hash, promise);
+    try {
+      return await promise;
+    } finally {
+      inFlight.delete(hash);
+    }
+  }
+
+  /**
+   * Drop a cache entry (e.g. the image it points to is gone)
+   */
+  async invalidate(hash: string): Promise<void> {
+    memoryCache.delete(hash);
+    try {
+      await this.bucket.delete(`${CACHE_PREFIX}${hash}`);
+    } catch (error) {
+      stats.errors++;
+      console.warn(`Generation cache invalidate failed: ${error instanceof Error ? error.message : error}`);
+    }
+  }
+
+  /**
+   * Hit/miss counters for this isolate
+   */
+  getStats(): CacheStats & { memoryEntries: number; inFlight: number } {
+    return { ...stats, memoryEntries: memoryCache.size, inFlight: inFlight.size };
+  }
+
+  private async lookup(hash: string): Promise<CacheEntry | null> {
+    // Anything expiring before this is treated as already gone
+    const cutoff = Date.now() + this.minRemainingMs;
+
+    const memory = memoryCache.get(hash);
+    if (memory) {
+      if (memory.expiresAt > cutoff) {
+        // Refresh LRU position
+        memoryCache.delete(hash);
+        memoryCache.set(hash, memory);
+        stats.hits++;
+        stats.memoryHits++;
+        return memory;
+      }
+      memoryCache.delete(hash);
+    }
+
+    try {
+      const head = await this.bucket.head(`${CACHE_PREFIX}${hash}`);
+      const custom = head?.customMetadata;
+      if (!custom) return null;
+
+      const entry: CacheEntry = {
+        id: custom.id,
+        key: custom.key,
+        url: `/${custom.key}`,
+        expiresAt: parseInt(custom.expiresAt, 10),
+      };
+      if (!(entry.expiresAt > cutoff)) return null;
+
+      this.remember(hash, entry);
+      stats.hits++;
+      stats.r2Hits++;
+      return entry;
+    } catch (error) {
+      stats.errors++;
+      console.warn(`Generation cache lookup failed: ${error instanceof Error ? error.message : error}`);
+      return null;
+    }
+  }
+
+  private async store(hash: string, entry: CacheEntry): Promise<void> {
+    this.remember(hash, entry);
+    try {
+      // Pointer object: empty body, everything in customMetadata so a
+      // head() is enough to resolve it. expiresAt matches the image's TTL.
+      await this.bucket.put(`${CACHE_PREFIX}${hash}`, new Uint8Array(0), {
+        customMetadata: {
+          id: entry.id,
+          key: entry.key,
+          expiresAt: String(entry.expiresAt),
+        },
+      });
+      stats.stores++;
+    } catch (error) {
+      stats.errors++;
+      console.warn(`Generation cache store failed: ${error instanceof Error ? error.message : error}`);
+    }
+  }
+
+  private remember(hash: string, entry: CacheEntry): void {
+    // Never keep image bytes in the LRU, only the pointer
+    memoryCache.delete(hash);
+    memoryCache.set(hash, { id: entry.id, key: entry.key, url: entry.url, expiresAt: entry.expiresAt });
+    while (memoryCache.size > MEMORY_CACHE_SIZE) {
+      const oldest = memoryCache.keys().next().value;
+      if (oldest === undefined) break;
+      memoryCache.delete(oldest);
+    }
+  }
+}
@@ -2,18 +2,120 @@
 // Image Generator Service - Routes to appropriate Cloudflare AI model
 // ============================================================================
 
-import type { Env, ModelConfig, AIAccount } from '../types.js';
+import type { Env, ModelConfig, AIAccount, ParsedParams } from '../types.js';
 import { ParamParser } from './param-parser.js';
 import { R2StorageService } from './r2-storage.js';
 import { MODEL_CONFIGS } from '../config/models.js';
+import { Semaphore, mapWithConcurrency, parseConcurrency } from './concurrency.js';
+import { type ImageInput, bytesToBase64, stripDataUri, toBase64, toBlob, viewToArrayBuffer } from './binary.js';
+import { GenerationCache, type CacheStats } from './generation-cache.js';
+import {
+  AccountRouter,
+  AccountsUnavailableError,
+  isAccountFailure,
+  parseRetryAfter,
+  type AccountStats,
+} from './account-router.js';
+import { RequestTrace } from './metrics.js';
+
+const DEFAULT_API_BASE_URL = 'https://api.cloudflare.com/client/v4';
+// Total attempts per AI call across accounts
+const MAX_AI_ATTEMPTS = 3;
+// Give up instead of waiting longer than this for an account to recover
+const MAX_AI_WAIT_MS = 10_000;
+
+function backoffDelay(attempt: number): number {
+  const base = 250 * 2 ** attempt;
+  return base + Math.floor(Math.random() * base);
+}
+
+function sleep(ms: number): Promise<void> {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
+// Most images a single request can ask for
+export const MAX_IMAGES_PER_REQUEST = 8;
+
+/**
+ * Parse a requested image count. A missing value means 1 and larger values
+ * are capped at MAX_IMAGES_PER_REQUEST; anything that is not a positive
+ * integer returns null so the caller can reject the request.
+ */
+export function parseImageCount(value: unknown): number | null {
+  if (value === undefined || value === null || value === '') {
+    return 1;
+  }
+  const n = typeof value === 'string' ? Number(value.trim()) : value;
+  if (typeof n !== 'number' || !Number.isInteger(n) || n < 1) {
+    return null;
+  }
+  return Math.min(n, MAX_IMAGES_PER_REQUEST);
+}
+
+export type BatchImage = { url: string; id: string } | { b64_json: string };
+
+export interface BatchResult {
+  success: boolean;
+  images: BatchImage[];
+  error?: string;
+  // Per-index failures when only part of the batch succeeded
+  errors?: Array<{ index: number; error: string }>;
+  // Set when the batch failed because Workers AI is rate limited or
+  // unavailable: suggested HTTP status (429/503) and Retry-After seconds
+  status?: number;
+  retryAfter?: number;
+}
+
+// Reported once per batch item as soon as it finishes (success or failure)
+export interface BatchProgress {
+  index: number;
+  completed: number;
+  total: number;
+  image?: BatchImage;
+  error?: string;
+}
+
+export type BatchProgressCallback = (progress: BatchProgress) => void | Promise<void>;
+
+type SingleResult = {
+  success: boolean;
+  imageUrl?: string;
+  imageId?: string;
+  base64Data?: string;
+  error?: string;
+  status?: number;
+  retryAfter?: number;
+};
+
+/**
+ * Failed result for a caught error, keeping the retry hint when every
+ * Workers AI account is unavailable
+ */
+function failureResult(error: unknown): SingleResult {
+  const message = error instanceof Error ? error.message : String(error);
+  if (error instanceof AccountsUnavailableError) {
+    return { success: false, error: message, status: error.status, retryAfter: error.retryAfterSeconds };
+  }
+  return { success: false, error: message };
+}
+
+// Per-account limiters live at module scope so they are shared by every
+// request handled by this isolate (services are constructed per request).
+const accountLimiters = new Map<string, Semaphore>();
 
 export class ImageGeneratorService {
   private aiAccounts: AIAccount[];
+  private router: AccountRouter;
+  private apiBaseUrl: string;
   private storage: R2StorageService;
+  private cache: GenerationCache;
   private models: Map<string, ModelConfig>;
+  private batchConcurrency: number;
+  private accountConcurrency: number;
+  private trace: RequestTrace;
 
   private cleanBase64(data: string): string {
-    return data.replace(/^data:image\/\w+;base64,/, '');
+    return stripDataUri(data);
   }
 
   private async extractImageResult(
@@ -38,9 +140,7 @@ export class ImageGeneratorService {
         return { kind: 'binary', data: maybeImage };
       }
       if (maybeImage instanceof Uint8Array) {
-        const copied = new Uint8Array(maybeImage);
-        const buf = copied.buffer.slice(copied.byteOffset, copied.byteOffset + copied.byteLength);
-        return { kind: 'binary', data: buf };
+        return { kind: 'binary', data: viewToArrayBuffer(maybeImage) };
       }
       if (maybeImage instanceof ReadableStream) {
         const buf = await new Response(maybeImage).arrayBuffer();
@@ -53,9 +153,7 @@ export class ImageGeneratorService {
       return { kind: 'binary', data: result };
     }
     if (result instanceof Uint8Array) {
-      const copied = new Uint8Array(result);
-      const buf = copied.buffer.slice(copied.byteOffset, copied.byteOffset + copied.byteLength);
-      return { kind: 'binary', data: buf };
+      return { kind: 'binary', data: viewToArrayBuffer(result) };
     }
     if (result instanceof ReadableStream) {
       const buf = await new Response(result).arrayBuffer();
@@ -66,22 +164,48 @@ export class ImageGeneratorService {
   }
 
   private arrayBufferToBase64(buffer: ArrayBuffer): string {
-    const bytes = new Uint8Array(buffer);
-    const chunkSize = 0x8000; // 32KB
-    let binary = '';
-
-    for (let i = 0; i < bytes.length; i += chunkSize) {
-      const chunk = bytes.subarray(i, i + chunkSize);
-      // eslint-disable-next-line @typescript-eslint/no-explicit-any
-      binary += String.fromCharCode(...(chunk as any));
-    }
+    return this.trace.measure('encode', () => bytesToBase64(buffer));
+  }
 
-    return btoa(binary);
+  private parseParams(
+    prompt: string | Record<string, any>,
+    explicitParams: Record<string, any>,
+    model: ModelConfig
+  ): ParsedParams {
+    return this.trace.measure('parse', () => ParamParser.parse(prompt, explicitParams, model));
   }
 
-  constructor(env: Env) {
+  /**
+   * Upload a generated image to R2, timed as the `upload` stage
+   */
+  private async upload(
+    data: string | ArrayBuffer,
+    metadata: Parameters<R2StorageService['uploadImage']>[1]
+  ): ReturnType<R2StorageService['uploadImage']> {
+    const result = await this.trace.span('upload', () => this.storage.uploadImage(data, metadata));
+    // Base64 is decoded before upload: 4 characters carry 3 bytes
+    this.trace.bytes('r2_upload', typeof data === 'string' ? Math.floor(data.length * 3 / 4) : data.byteLength);
+    return result;
+  }
+
+  /**
+   * Normalise image inputs for a model once per request: JSON-format models
+   * need base64 in the payload, multipart models take the bytes as-is
+   */
+  private async prepareImageInputs(model: ModelConfig, images: ImageInput[]): Promise<ImageInput[]> {
+    if (model.inputFormat === 'multipart') {
+      return images;
+    }
+    return this.trace.span('encode', () => Promise.all(images.map((img) => toBase64(img))));
+  }
+
+  constructor(env: Env, trace?: RequestTrace) {
+    this.trace = trace || new RequestTrace('internal');
     this.storage = new R2StorageService(env);
+    this.cache = new GenerationCache(env);
     this.models = new Map(Object.entries(MODEL_CONFIGS));
+    this.batchConcurrency = parseConcurrency(env.GENERATION_CONCURRENCY, 4);
+    this.accountConcurrency = parseConcurrency(env.ACCOUNT_CONCURRENCY, 4);
 
     // Build AI accounts list:
     // 1. AI_ACCOUNTS (JSON array) if set and valid
@@ -113,88 +237,306 @@ export class ImageGeneratorService {
     } else {
       this.aiAccounts = fallback;
     }
+
+    this.router = new AccountRouter(this.aiAccounts);
+    this.apiBaseUrl = (env.CF_API_BASE_URL || DEFAULT_API_BASE_URL).replace(/\/+$/, '');
+  }
+
+  /**
+   * Get the shared in-flight limiter for an account
+   */
+  private getAccountLimiter(account: AIAccount): Semaphore {
+    let limiter = accountLimiters.get(account.account_id);
+    if (!limiter) {
+      limiter = new Semaphore(this.accountConcurrency);
+      accountLimiters.set(account.account_id, limiter);
+    }
+    return limiter;
+  }
+
+  /**
+   * Run a batch of n generations with bounded concurrency.
+   * Seeds are assigned by index up front (seed + i, from the explicit seed
+   * or a --seed embedded in the prompt) so results are reproducible
+   * regardless of completion order; images keep index order and finished
+   * images are kept even if other items fail. Once `signal` aborts, items
+   * that have not started are skipped as failed.
+   */
+  private async runBatch(
+    n: number,
+    prompt: string | Record<string, any>,
+    explicitParams: Record<string, any>,
+    returnBase64: boolean,
+    generate: (params: Record<string, any>) => Promise<SingleResult>,
+    onProgress?: BatchProgressCallback,
+    signal?: AbortSignal
+  ): Promise<BatchResult> {
+    if (!Number.isInteger(n) || n < 1 || n > MAX_IMAGES_PER_REQUEST) {
+      return { success: false, images: [], error: `n must be an integer between 1 and ${MAX_IMAGES_PER_REQUEST}` };
+    }
+
+    // Unset fields must not override --key=value params from the prompt
+    const provided = Object.fromEntries(
+      Object.entries(explicitParams).filter(([, value]) => value !== undefined)
+    );
+    const baseSeed = this.batchBaseSeed(prompt, provided);
+    let completed = 0;
+
+    type Outcome = { image?: BatchImage; error?: string; status?: number; retryAfter?: number };
+
+    const outcomes = await mapWithConcurrency<Outcome>(n, this.batchConcurrency, async (i) => {
+      const params = baseSeed !== undefined ? { ...provided, seed: baseSeed + i } : provided;
+      let result: SingleResult;
+      try {
+        result = signal?.aborted
+          ? { success: false, error: 'Cancelled' }
+          : await generate(params);
+      } catch (error) {
+        result = failureResult(error);
+      }
+
+      let outcome: Outcome;
+      if (!result.success) {
+        outcome = { error: result.error || 'Unknown error', status: result.status, retryAfter: result.retryAfter };
+      } else if (returnBase64 && result.base64Data) {
+        outcome = { image: { b64_json: result.base64Data } };
+      } else if (result.imageUrl) {
+        outcome = { image: { url: result.imageUrl, id: result.imageId! } };
+      } else {
+        outcome = { error: 'No image data returned' };
+      }
+
+      if (onProgress) {
+        completed++;
+        try {
+          await onProgress({ index: i, completed, total: n, image: outcome.image, error: outcome.error });
+        } catch (error) {
+          // A slow or disconnected listener must not fail the batch
+          console.warn(`Batch progress callback failed: ${error instanceof Error ? error.message : error}`);
+        }
+      }
+
+      return outcome;
+    });
+
+    const images: BatchImage[] = [];
+    const errors: Array<{ index: number; error: string }> = [];
+
+    outcomes.forEach((outcome, index) => {
+      if (outcome.image) {
+        images.push(outcome.image);
+      } else {
+        errors.push({ index, error: outcome.error || 'Unknown error' });
+      }
+    });
+
+    if (images.length === 0) {
+      // Report the retry hint if Workers AI was unavailable for any item
+      const unavailable = outcomes.find((outcome) => outcome.status);
+      return {
+        success: false,
+        images,
+        error: unavailable?.error ?? errors[0]?.error,
+        errors,
+        status: unavailable?.status,
+        retryAfter: unavailable?.retryAfter,
+      };
+    }
+
+    if (errors.length > 0) {
+      console.warn(`Batch generation partially failed: ${errors.length}/${n} images failed`);
+      return { success: true, images, errors };
+    }
+
+    return { success: true, images };
   }
 
   /**
-   * Pick a random AI account for load distribution
+   * Seed the batch counts up from: an explicit seed wins over one embedded
+   * in the prompt. Invalid values are left for ParamParser to reject.
    */
-  private pickAccount(): AIAccount {
-    return this.aiAccounts[Math.floor(Math.random() * this.aiAccounts.length)];
+  private batchBaseSeed(prompt: string | Record<string, any>, explicitParams: Record<string, any>): number | undefined {
+    let raw = explicitParams.seed;
+    if (raw === undefined || raw === null || raw === '') {
+      raw = typeof prompt === 'string' ? ParamParser.extractEmbedded(prompt).seed : prompt?.seed;
+    }
+    if (raw === undefined || raw === null || raw === '') {
+      return undefined;
+    }
+    const seed = Number(raw);
+    return Number.isInteger(seed) ? seed : undefined;
   }
 
   /**
-   * Call Cloudflare Workers AI via REST API
+   * Call Cloudflare Workers AI via REST API.
+   * Accounts are chosen by the health-aware router; rate-limited, auth and
+   * upstream failures are retried on another account, backing off (honouring
+   * Retry-After) once every account has been tried.
    */
   private async runAI(
     modelId: string,
     payload: Record<string, any>,
     model: ModelConfig,
-    images?: string[]
+    images?: ImageInput[]
   ): Promise<any> {
-    const account = this.pickAccount();
-    const url = `https://api.cloudflare.com/client/v4/accounts/${account.account_id}/ai/run/${modelId}`;
-
-    let response: Response;
+    let body: FormData | string;
+    // Payload size for the ai_request byte counter (multipart fields + blobs)
+    let requestBytes = 0;
+    const headers: Record<string, string> = {};
 
     if (model.inputFormat === 'multipart') {
       // Multipart form data (FLUX 2 models)
       const form = new FormData();
       for (const [key, value] of Object.entries(payload)) {
         if (value !== undefined && value !== null && key !== 'image') {
-          form.append(key, String(value));
+          const field = String(value);
+          form.append(key, field);
+          requestBytes += field.length;
         }
       }
 
-      // Append image(s) as binary blobs if provided
+      // Append image(s) as binary blobs if provided (Blob/bytes pass through uncopied)
       if (images && images.length > 0) {
         for (const img of images) {
-          const cleanedB64 = this.cleanBase64(img);
-          const bytes = this.base64ToUint8Array(cleanedB64);
-          form.append('image', new Blob([bytes.buffer as ArrayBuffer], { type: 'image/png' }));
+          const blob = toBlob(img);
+          form.append('image', blob);
+          requestBytes += blob.size;
         }
       } else if (payload.image && typeof payload.image === 'string' && payload.image.length > 100) {
         // Single image in payload (text-to-image with image param)
-        const cleanedB64 = this.cleanBase64(payload.image);
-        const bytes = this.base64ToUint8Array(cleanedB64);
-        form.append('image', new Blob([bytes.buffer as ArrayBuffer], { type: 'image/png' }));
+        const blob = toBlob(payload.image);
+        form.append('image', blob);
+        requestBytes += blob.size;
       }
 
-      response = await fetch(url, {
-        method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${account.api_token}`,
-        },
-        body: form,
-      });
+      body = form;
     } else {
       // JSON format
-      response = await fetch(url, {
-        method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${account.api_token}`,
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(payload),
-      });
+      headers['Content-Type'] = 'application/json';
+      body = JSON.stringify(payload);
+      requestBytes = body.length;
     }
 
-    if (!response.ok) {
-      const errorText = await response.text();
-      throw new Error(`Cloudflare AI API error (${response.status}): ${errorText}`);
-    }
+    const tried = new Set<string>();
+    let lastError: Error = new Error('No AI account available');
+    let lastStatus: number | undefined;
+
+    for (let attempt = 0; attempt < MAX_AI_ATTEMPTS; attempt++) {
+      let account = this.router.pick(tried);
+
+      if (!account) {
+        // Every untried account is unhealthy: wait for the first one to
+        // recover (or plain backoff), then allow accounts to be reused
+        const wait = Math.max(this.router.nextAvailableIn(), backoffDelay(attempt));
+        if (wait <= MAX_AI_WAIT_MS) {
+          await sleep(wait);
+          tried.clear();
+          account = this.router.pick(tried);
+        }
+        // Still open (or another request holds the half-open probe): fail
+        // with the remaining wait rather than calling before Retry-After
+        if (!account) break;
+      }
+
+      const selected = account;
+      tried.add(selected.account_id);
+      const url = `${this.apiBaseUrl}/accounts/${selected.account_id}/ai/run/${modelId}`;
+      const limiter = this.getAccountLimiter(account);
+      const accountLabel = account.account_id.substring(0, 8);
+      const started = Date.now();
+      const spanStarted = performance.now();
+      const recordAttempt = (status: number | 'error') => {
+        const duration = performance.now() - spanStarted;
+        this.trace.record('ai', duration);
+        this.trace.aiCall(accountLabel, status, duration);
+        this.trace.bytes('ai_request', requestBytes);
+      };
+      this.router.begin(account);
+
+      let response: Response;
+      try {
+        response = await limiter.run(() => fetch(url, {
+          method: 'POST',
+          headers: {
+            ...headers,
+            'Authorization': `Bearer ${selected.api_token}`,
+          },
+          body,
+        }));
+      } catch (error) {
+        const message = error instanceof Error ? error.message : String(error);
+        lastStatus = undefined;
+        recordAttempt('error');
+        this.router.recordFailure(account, Date.now() - started, undefined, message);
+        lastError = new Error(`Cloudflare AI API request failed: ${message}`);
+        continue;
+      }
+
+      if (!response.ok) {
+        // A failed body read must not skip settling the account below
+        const errorText = await response.text().catch((error) => `(unreadable body: ${error instanceof Error ? error.message : error})`);
+        lastStatus = response.status;
+        recordAttempt(response.status);
+        lastError = new Error(`Cloudflare AI API error (${response.status}): ${errorText}`);
+
+        if (!isAccountFailure(response.status)) {
+          // Bad request: another account would reject it too
+          this.router.release(account);
+          throw lastError;
+        }
+
+        const retryAfterMs = parseRetryAfter(response.headers.get('retry-after'));
+        this.router.recordFailure(account, Date.now() - started, response.status, errorText, retryAfterMs);
+        console.warn(`AI account ${account.account_id.substring(0, 8)} failed (${response.status}), retrying`);
+        continue;
+      }
+
+      // Determine response type from content-type header
+      const contentType = response.headers.get('content-type') || '';
+      let result: any;
+
+      try {
+        if (contentType.includes('application/json')) {
+          // JSON response — may contain { result: { image: "base64..." } } or { result: "base64..." }
+          const text = await response.text();
+          this.trace.bytes('ai_response', text.length);
+          const json = JSON.parse(text) as any;
+          // Cloudflare REST API wraps result in { result: ... }
+          result = json.result !== undefined ? json.result : json;
+        } else {
+          // Binary response (image/png, application/octet-stream, etc.)
+          result = await response.arrayBuffer();
+          this.trace.bytes('ai_response', result.byteLength);
+        }
+      } catch (error) {
+        // Truncated or malformed body: count it against the account so its
+        // in-flight count (and any half-open probe) is released
+        const message = error instanceof Error ? error.message : String(error);
+        lastStatus = undefined;
+        recordAttempt('error');
+        this.router.recordFailure(account, Date.now() - started, undefined, message);
+        lastError = new Error(`Cloudflare AI API returned an unreadable response: ${message}`);
+        continue;
+      }
 
-    // Determine response type from content-type header
-    const contentType = response.headers.get('content-type') || '';
+      recordAttempt(response.status);
+      this.router.recordSuccess(account, Date.now() - started);
+      return result;
+    }
 
-    if (contentType.includes('application/json')) {
-      // JSON response — may contain { result: { image: "base64..." } } or { result: "base64..." }
-      const json = await response.json() as any;
-      // Cloudflare REST API wraps result in { result: ... }
-      return json.result !== undefined ? json.result : json;
+    // Nothing could be sent, or every try was rate limited: tell the caller
+    // when to retry (429/503) instead of failing with a generic error
+    if (tried.size === 0 || lastStatus === 429) {
+      throw this.router.unavailableError();
     }
+    throw lastError;
+  }
 
-    // Binary response (image/png, application/octet-stream, etc.)
-    return await response.arrayBuffer();
+  /**
+   * Per-account routing counters (requests, failures, circuit state, latency)
+   */
+  getAccountStats(): AccountStats[] {
+    return this.router.stats();
   }
 
   /**
@@ -219,19 +561,30 @@ export class ImageGeneratorService {
     base64Data?: string;
     revisedPrompt?: string;
     error?: string;
+    status?: number;
+    retryAfter?: number;
   }> {
     const model = this.getModelConfig(modelId);
     if (!model) {
       return { success: false, error: `Unknown model: ${modelId}` };
     }
+    this.trace.model = model.id;
 
     try {
       // Parse parameters
-      const params = ParamParser.parse(prompt, explicitParams, model);
+      const params = this.parseParams(prompt, explicitParams, model);
 
       // Build Cloudflare AI payload
       const payload = ParamParser.toCFPayload(params, model);
 
+      // Explicit seed => deterministic output, so it can be served from cache
+      if (this.cache.isEnabledFor(params.seed)) {
+        const cached = await this.generateCached(model, params, payload, returnBase64);
+        if (cached) {
+          return cached;
+        }
+      }
+
       // Run the model via REST API
       const result = await this.runAI(model.id, payload, model);
 
@@ -254,7 +607,7 @@ export class ImageGeneratorService {
       }
 
       // Upload to R2 storage
-      const uploadResult = await this.storage.uploadImage(
+      const uploadResult = await this.upload(
         extracted.kind === 'base64' ? this.cleanBase64(extracted.data) : extracted.data,
         {
           model: model.id,
@@ -275,49 +628,102 @@ export class ImageGeneratorService {
         imageId: uploadResult.id,
       };
     } catch (error) {
-      const message = error instanceof Error ? error.message : String(error);
-      console.error(`Image generation failed: ${message}`);
-      return { success: false, error: message };
+      const failure = failureResult(error);
+      console.error(`Image generation failed: ${failure.error}`);
+      return failure;
     }
   }
 
   /**
-   * Generate multiple images
+   * Text-to-image through the generation cache. The image is always stored
+   * in R2 (the cache points at it), even when base64 output is requested.
+   * Returns null if the cached image is gone so the caller generates afresh.
+   */
+  private async generateCached(
+    model: ModelConfig,
+    params: ParsedParams,
+    payload: Record<string, any>,
+    returnBase64: boolean
+  ): Promise<SingleResult | null> {
+    const hash = await this.cache.keyFor(model.id, payload);
+
+    const { entry } = await this.cache.getOrCreate(hash, async () => {
+      const result = await this.runAI(model.id, payload, model);
+      const extracted = await this.extractImageResult(result);
+      if (!extracted) {
+        return null;
+      }
+
+      const data = extracted.kind === 'base64' ? this.cleanBase64(extracted.data) : extracted.data;
+      const uploadResult = await this.upload(data, {
+        model: model.id,
+        prompt: params.prompt,
+        parameters: {
+          size: params.size,
+          steps: params.steps,
+          seed: params.seed,
+          guidance: params.guidance,
+          negative_prompt: params.negative_prompt,
+        },
+      });
+
+      return {
+        id: uploadResult.id,
+        key: uploadResult.url.substring(1),
+        url: uploadResult.url,
+        expiresAt: uploadResult.expiresAt,
+        data,
+      };
+    });
+
+    if (!entry) {
+      return { success: false, error: 'No image in model response' };
+    }
+
+    if (!returnBase64) {
+      return { success: true, imageUrl: entry.url, imageId: entry.id };
+    }
+
+    const data = entry.data ?? await this.storage.getObjectData(entry.key);
+    if (!data) {
+      await this.cache.invalidate(hash);
+      return null;
+    }
+
+    return {
+      success: true,
+      base64Data: typeof data === 'string' ? data : this.arrayBufferToBase64(data),
+    };
+  }
+
+  /**
+   * Generation cache hit/miss counters for this isolate
+   */
+  getCacheStats(): CacheStats & { memoryEntries: number; inFlight: number } {
+    return this.cache.getStats();
+  }
+
+  /**
+   * Generate multiple images (concurrently, bounded by GENERATION_CONCURRENCY)
    */
   async generateImages(
     modelId: string,
     prompt: string | Record<string, any>,
     n: number = 1,
     explicitParams: Record<string, any> = {},
-    returnBase64: boolean = false
-  ): Promise<{
-    success: boolean;
-    images: Array<{ url: string; id: string } | { b64_json: string }>;
-    error?: string;
-  }> {
-    const results: Array<{ url: string; id: string } | { b64_json: string }> = [];
-
-    for (let i = 0; i < n; i++) {
-      const seed = explicitParams.seed ? explicitParams.seed + i : undefined;
-      const result = await this.generateImage(modelId, prompt, {
-        ...explicitParams,
-        seed,
-      }, returnBase64);
-
-      if (result.success) {
-        if (returnBase64 && result.base64Data) {
-          results.push({ b64_json: result.base64Data });
-        } else if (result.imageUrl) {
-          results.push({ url: result.imageUrl, id: result.imageId! });
-        } else {
-          return { success: false, images: results, error: 'No image data returned' };
-        }
-      } else {
-        return { success: false, images: results, error: result.error };
-      }
-    }
-
-    return { success: true, images: results };
+    returnBase64: boolean = false,
+    onProgress?: BatchProgressCallback,
+    signal?: AbortSignal
+  ): Promise<BatchResult> {
+    return this.runBatch(
+      n,
+      prompt,
+      explicitParams,
+      returnBase64,
+      (params) => this.generateImage(modelId, prompt, params, returnBase64),
+      onProgress,
+      signal
+    );
   }
 
   /**
@@ -326,7 +732,7 @@ export class ImageGeneratorService {
   async generateImageToImage(
     modelId: string,
     prompt: string | Record<string, any>,
-    imageData: string | string[],
+    imageData: ImageInput | ImageInput[],
     strength?: number,
     explicitParams: Record<string, any> = {},
     returnBase64: boolean = false
@@ -336,11 +742,14 @@ export class ImageGeneratorService {
     imageId?: string;
     base64Data?: string;
     error?: string;
+    status?: number;
+    retryAfter?: number;
   }> {
     const model = this.getModelConfig(modelId);
     if (!model) {
       return { success: false, error: `Unknown model: ${modelId}` };
     }
+    this.trace.model = model.id;
 
     if (!model.supportedTasks.includes('image-to-image')) {
       return { success: false, error: `Model ${modelId} does not support image-to-image` };
@@ -369,17 +778,21 @@ export class ImageGeneratorService {
       if (strength !== undefined) {
         mergedExplicit.strength = strength;
       }
-      // For single image, set image param for ParamParser
-      mergedExplicit.image = images[0];
+      // JSON models carry the (first) image as base64 in the payload;
+      // multipart models get the raw bytes appended by runAI instead
+      const inputs = await this.prepareImageInputs(model, images);
+      if (model.inputFormat !== 'multipart') {
+        mergedExplicit.image = inputs[0];
+      }
 
       // Parse parameters with image
-      const params = ParamParser.parse(prompt, mergedExplicit, model);
+      const params = this.parseParams(prompt, mergedExplicit, model);
 
       // Build payload with image
       const payload = ParamParser.toCFPayload(params, model);
 
       // Run the model via REST API (pass images for multipart handling)
-      const result = await this.runAI(model.id, payload, model, images);
+      const result = await this.runAI(model.id, payload, model, inputs);
 
       const extracted = await this.extractImageResult(result);
       if (!extracted) {
@@ -397,7 +810,7 @@ export class ImageGeneratorService {
         };
       }
 
-      const uploadResult = await this.storage.uploadImage(
+      const uploadResult = await this.upload(
         extracted.kind === 'base64' ? this.cleanBase64(extracted.data) : extracted.data,
         {
           model: model.id,
@@ -416,8 +829,7 @@ export class ImageGeneratorService {
         imageId: uploadResult.id,
       };
     } catch (error) {
-      const message = error instanceof Error ? error.message : String(error);
-      return { success: false, error: message };
+      return failureResult(error);
     }
   }
 
@@ -427,42 +839,29 @@ export class ImageGeneratorService {
   async generateImageToImages(
     modelId: string,
     prompt: string | Record<string, any>,
-    imageData: string | string[],
+    imageData: ImageInput | ImageInput[],
     n: number = 1,
     explicitParams: Record<string, any> = {},
-    returnBase64: boolean = false
-  ): Promise<{
-    success: boolean;
-    images: Array<{ url: string; id: string } | { b64_json: string }>;
-    error?: string;
-  }> {
-    const results: Array<{ url: string; id: string } | { b64_json: string }> = [];
-
-    for (let i = 0; i < n; i++) {
-      const seed = explicitParams.seed ? explicitParams.seed + i : undefined;
-      const result = await this.generateImageToImage(
-        modelId,
-        prompt,
-        imageData,
-        explicitParams.strength,
-        { ...explicitParams, seed },
-        returnBase64
-      );
-
-      if (result.success) {
-        if (returnBase64 && result.base64Data) {
-          results.push({ b64_json: result.base64Data });
-        } else if (result.imageUrl) {
-          results.push({ url: result.imageUrl, id: result.imageId! });
-        } else {
-          return { success: false, images: results, error: 'No image data returned' };
-        }
-      } else {
-        return { success: false, images: results, error: result.error };
-      }
-    }
-
-    return { success: true, images: results };
+    returnBase64: boolean = false,
+    onProgress?: BatchProgressCallback,
+    signal?: AbortSignal
+  ): Promise<BatchResult> {
+    // Convert inputs once for the whole batch rather than once per image
+    const model = this.getModelConfig(modelId);
+    if (model) this.trace.model = model.id;
+    const inputs = model
+      ? await this.prepareImageInputs(model, Array.isArray(imageData) ? imageData : [imageData])
+      : imageData;
+
+    return this.runBatch(
+      n,
+      prompt,
+      explicitParams,
+      returnBase64,
+      (params) => this.generateImageToImage(modelId, prompt, inputs, explicitParams.strength, params, returnBase64),
+      onProgress,
+      signal
+    );
   }
 
   /**
@@ -471,43 +870,29 @@ export class ImageGeneratorService {
   async generateInpaints(
     modelId: string,
     prompt: string,
-    imageData: string,
-    maskData: string,
+    imageData: ImageInput,
+    maskData: ImageInput,
     n: number = 1,
     explicitParams: Record<string, any> = {},
-    returnBase64: boolean = false
-  ): Promise<{
-    success: boolean;
-    images: Array<{ url: string; id: string } | { b64_json: string }>;
-    error?: string;
-  }> {
-    const results: Array<{ url: string; id: string } | { b64_json: string }> = [];
-
-    for (let i = 0; i < n; i++) {
-      const seed = explicitParams.seed ? explicitParams.seed + i : undefined;
-      const result = await this.generateInpaint(
-        modelId,
-        prompt,
-        imageData,
-        maskData,
-        { ...explicitParams, seed },
-        returnBase64
-      );
-
-      if (result.success) {
-        if (returnBase64 && result.base64Data) {
-          results.push({ b64_json: result.base64Data });
-        } else if (result.imageUrl) {
-          results.push({ url: result.imageUrl, id: result.imageId! });
-        } else {
-          return { success: false, images: results, error: 'No image data returned' };
-        }
-      } else {
-        return { success: false, images: results, error: result.error };
-      }
-    }
-
-    return { success: true, images: results };
+    returnBase64: boolean = false,
+    onProgress?: BatchProgressCallback,
+    signal?: AbortSignal
+  ): Promise<BatchResult> {
+    // Mask-capable models take JSON payloads: encode once for the whole batch
+    if (this.getModelConfig(modelId)) this.trace.model = modelId;
+    const [image, mask] = await this.trace.span('encode', () =>
+      Promise.all([toBase64(imageData), toBase64(maskData)])
+    );
+
+    return this.runBatch(
+      n,
+      prompt,
+      explicitParams,
+      returnBase64,
+      (params) => this.generateInpaint(modelId, prompt, image, mask, params, returnBase64),
+      onProgress,
+      signal
+    );
   }
 
   /**
@@ -516,8 +901,8 @@ export class ImageGeneratorService {
   async generateInpaint(
     modelId: string,
     prompt: string,
-    imageData: string,
-    maskData: string,
+    imageData: ImageInput,
+    maskData: ImageInput,
     explicitParams: Record<string, any> = {},
     returnBase64: boolean = false
   ): Promise<{
@@ -526,20 +911,26 @@ export class ImageGeneratorService {
     imageId?: string;
     base64Data?: string;
     error?: string;
+    status?: number;
+    retryAfter?: number;
   }> {
     const model = this.getModelConfig(modelId);
     if (!model) {
       return { success: false, error: `Unknown model: ${modelId}` };
     }
+    this.trace.model = model.id;
 
     if (!model.editCapabilities?.mask) {
       return { success: false, error: `Model ${modelId} does not support mask-based edits` };
     }
 
     try {
-      const params = ParamParser.parse(
+      const [image, mask] = await this.trace.span('encode', () =>
+        Promise.all([toBase64(imageData), toBase64(maskData)])
+      );
+      const params = this.parseParams(
         prompt,
-        { ...explicitParams, image: imageData, mask: maskData },
+        { ...explicitParams, image, mask },
         model
       );
 
@@ -564,7 +955,7 @@ export class ImageGeneratorService {
         };
       }
 
-      const uploadResult = await this.storage.uploadImage(
+      const uploadResult = await this.upload(
         extracted.kind === 'base64' ? this.cleanBase64(extracted.data) : extracted.data,
         {
           model: model.id,
@@ -583,8 +974,7 @@ export class ImageGeneratorService {
         imageId: uploadResult.id,
       };
     } catch (error) {
-      const message = error instanceof Error ? error.message : String(error);
-      return { success: false, error: message };
+      return failureResult(error);
     }
   }
 
@@ -642,23 +1032,4 @@ export class ImageGeneratorService {
   async cleanupExpired(): Promise<number> {
     return this.storage.cleanupExpired();
   }
-
-  /**
-   * Convert base64 string to Uint8Array for multipart form data
-   */
-  private base64ToUint8Array(base64: string): Uint8Array {
-    // Handle data URI prefix
-    const data = base64.replace(/^data:image\/\w+;base64,/, '');
-
-    // Decode base64 to binary string
-    const binaryString = atob(data);
-
-    // Convert to Uint8Array
-    const bytes = new Uint8Array(binaryString.length);
-    for (let i = 0; i < binaryString.length; i++) {
-      bytes[i] = binaryString.charCodeAt(i);
-    }
-
-    return bytes;
-  }
 }
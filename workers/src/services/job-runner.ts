@@ -0,0 +1,246 @@
+// ============================================================================
+// Job Runner - Executes async image jobs and delivers webhooks
+// Jobs go to the IMAGE_JOBS queue when it is bound; otherwise they run in
+// the background of the request that submitted them (ctx.waitUntil)
+// ============================================================================
+
+import type { Env, ImageJobMessage } from '../types.js';
+import { ImageGeneratorService, type BatchProgressCallback, type BatchResult } from './image-generator.js';
+import { JobStore, formatJob, type ImageJob } from './job-store.js';
+import { RequestTrace } from './metrics.js';
+
+// Webhook delivery attempts and per-attempt timeout
+const WEBHOOK_ATTEMPTS = 3;
+const WEBHOOK_TIMEOUT_MS = 10_000;
+
+// A job still `running` after this long lost its worker (evicted, or past
+// the queue consumer's wall-clock limit) and is marked failed
+const DEFAULT_JOB_TIMEOUT_MINUTES = 20;
+
+export class JobRunner {
+  private env: Env;
+  private store: JobStore;
+  private queue?: Queue<ImageJobMessage>;
+  private webhookSecret?: string;
+  private timeoutMs: number;
+
+  constructor(env: Env) {
+    this.env = env;
+    this.store = new JobStore(env);
+    this.queue = env.IMAGE_JOBS;
+    this.webhookSecret = env.JOB_WEBHOOK_SECRET;
+    const timeoutMinutes = parseInt(env.JOB_TIMEOUT_MINUTES || '', 10);
+    this.timeoutMs = (timeoutMinutes > 0 ? timeoutMinutes : DEFAULT_JOB_TIMEOUT_MINUTES) * 60 * 1000;
+  }
+
+  /**
+   * Hand a newly created job to the queue, or run it after the response
+   * has been sent when no queue is bound
+   */
+  async submit(job: ImageJob, ctx?: ExecutionContext): Promise<void> {
+    if (this.queue) {
+      await this.queue.send({ jobId: job.id });
+      return;
+    }
+
+    const running = this.run(job.id).then(
+      () => undefined,
+      (error) => console.error(`Job ${job.id} failed to run:`, error)
+    );
+    ctx?.waitUntil(running);
+  }
+
+  /**
+   * Run a queued job to completion. Safe to call more than once for the
+   * same job (queue redelivery): finished and cancelled jobs are skipped,
+   * and a job that has been running past the timeout is failed instead of
+   * being started again.
+   */
+  async run(jobId: string): Promise<ImageJob | null> {
+    const started = await this.store.update(jobId, (job) =>
+      job.status === 'queued' || (job.status === 'running' && !this.isStale(job))
+        ? { ...job, status: 'running', startedAt: job.startedAt ?? Date.now() }
+        : null
+    );
+    if (!started || started.status !== 'running') {
+      return started;
+    }
+    if (this.isStale(started)) {
+      return this.failIfStale(started);
+    }
+
+    // Progress is recorded per image; a cancel seen there stops the batch
+    const controller = new AbortController();
+    const onProgress: BatchProgressCallback = async (progress) => {
+      const job = await this.store.update(jobId, (current) =>
+        current.status === 'running'
+          ? { ...current, progress: { completed: progress.completed, total: progress.total } }
+          : null
+      );
+      if (!job || job.status !== 'running') {
+        controller.abort();
+      }
+    };
+
+    // Each run is traced as one `jobs` request in the metrics registry
+    const trace = new RequestTrace('jobs');
+    const generator = new ImageGeneratorService(this.env, trace);
+
+    let result: BatchResult;
+    try {
+      result = await this.execute(generator, started, onProgress, controller.signal);
+    } catch (error) {
+      result = { success: false, images: [], error: error instanceof Error ? error.message : String(error) };
+    }
+
+    const images = result.images.filter((img): img is { url: string; id: string } => 'url' in img);
+    const finished = await this.store.update(jobId, (job) => {
+      // Cancelled meanwhile: keep the status, attach what was generated
+      if (job.status === 'cancelled') {
+        return images.length > 0 ? { ...job, images } : null;
+      }
+      if (job.status !== 'running') return null;
+
+      return {
+        ...job,
+        status: result.success ? 'succeeded' : 'failed',
+        completedAt: Date.now(),
+        progress: { completed: job.request.n, total: job.request.n },
+        images,
+        error: result.success ? undefined : result.error || 'Unknown error',
+        errors: result.errors,
+      };
+    });
+
+    if (finished) {
+      // Succeeded as 2xx, failed as 5xx, cancelled as 4xx (499: client closed)
+      trace.finish(finished.status === 'succeeded' ? 200 : finished.status === 'failed' ? 500 : 499);
+    }
+
+    if (finished && finished.webhookUrl && (finished.status === 'succeeded' || finished.status === 'failed')) {
+      return this.notify(finished);
+    }
+    return finished;
+  }
+
+  /**
+   * Mark a job failed if it has been `running` for longer than the timeout
+   * and send its webhook (after the response when `ctx` is given). Returns
+   * the job as stored afterwards; other jobs are returned unchanged.
+   */
+  async failIfStale(job: ImageJob, ctx?: ExecutionContext): Promise<ImageJob> {
+    if (!this.isStale(job)) {
+      return job;
+    }
+
+    // Only the caller whose write lands sends the webhook
+    let timedOut = false;
+    const stored = await this.store.update(job.id, (current) => {
+      timedOut = this.isStale(current);
+      if (!timedOut) return null;
+
+      return {
+        ...current,
+        status: 'failed',
+        completedAt: Date.now(),
+        error: `Job timed out after ${Math.round(this.timeoutMs / 60_000)} minutes`,
+      };
+    });
+    if (!stored) {
+      return job;
+    }
+    if (!timedOut || !stored.webhookUrl) {
+      return stored;
+    }
+
+    const delivery = this.notify(stored);
+    if (ctx) {
+      ctx.waitUntil(delivery.catch((error) => console.error(`Webhook for job ${job.id} failed:`, error)));
+      return stored;
+    }
+    return delivery;
+  }
+
+  private isStale(job: ImageJob): boolean {
+    return job.status === 'running' && Date.now() - (job.startedAt ?? job.createdAt) > this.timeoutMs;
+  }
+
+  /**
+   * Run the job's generation through ImageGeneratorService
+   */
+  private async execute(
+    generator: ImageGeneratorService,
+    job: ImageJob,
+    onProgress: BatchProgressCallback,
+    signal: AbortSignal
+  ): Promise<BatchResult> {
+    const { task, model, prompt, n, params } = job.request;
+
+    if (task === 'generations') {
+      return generator.generateImages(model, prompt, n, params, false, onProgress, signal);
+    }
+
+    const inputs = await this.store.loadInputs(job);
+    if (inputs.mask) {
+      return generator.generateInpaints(
+        model, prompt, inputs.images[0], inputs.mask, n, params, false, onProgress, signal
+      );
+    }
+
+    const imageInput = inputs.images.length === 1 ? inputs.images[0] : inputs.images;
+    return generator.generateImageToImages(model, prompt, imageInput, n, params, false, onProgress, signal);
+  }
+
+  /**
+   * POST the finished job to its webhook URL, retrying with backoff.
+   * With JOB_WEBHOOK_SECRET set, the body is signed with HMAC-SHA256 in
+   * the X-Webhook-Signature header.
+   */
+  private async notify(job: ImageJob): Promise<ImageJob> {
+    const body = JSON.stringify(formatJob(job));
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    if (this.webhookSecret) {
+      headers['X-Webhook-Signature'] = `sha256=${await this.sign(body)}`;
+    }
+
+    let attempts = 0;
+    let status: number | undefined;
+    let delivered = false;
+
+    while (attempts < WEBHOOK_ATTEMPTS && !delivered) {
+      if (attempts > 0) {
+        await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** (attempts - 1)));
+      }
+      attempts++;
+
+      try {
+        const response = await fetch(job.webhookUrl!, {
+          method: 'POST',
+          headers,
+          body,
+          signal: AbortSignal.timeout(WEBHOOK_TIMEOUT_MS),
+        });
+        status = response.status;
+        delivered = response.ok;
+      } catch (error) {
+        console.warn(`Webhook for job ${job.id} failed: ${error instanceof Error ? error.message : error}`);
+      }
+    }
+
+    const webhook = { delivered, attempts, status };
+    return (await this.store.update(job.id, (current) => ({ ...current, webhook }))) || { ...job, webhook };
+  }
+
+  private async sign(body: string): Promise<string> {
+    const encoder = new TextEncoder();
+    const key = await crypto.subtle.importKey(
+      'raw',
+      encoder.encode(this.webhookSecret!),
+      { name: 'HMAC', hash: 'SHA-256' },
+      false,
+      ['sign']
+    );
+    const signature = await crypto.subtle.sign('HMAC', key, encoder.encode(body));
+    return [...new Uint8Array(signature)].map((b) => b.toString(16).padStart(2, '0')).join('');
+  }
+}
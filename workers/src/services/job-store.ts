@@ -0,0 +1,199 @@
+// ============================================================================
+// Job Store - Async image generation jobs persisted in R2
+// Job records and their input images live under jobs/<id>/, next to the
+// generated images, and expire with them
+// ============================================================================
+
+import type { Env } from '../types.js';
+import { toBlob, type ImageInput } from './binary.js';
+
+export const JOBS_PREFIX = 'jobs/';
+
+// Attempts for a compare-and-swap job update before giving up
+const MAX_UPDATE_ATTEMPTS = 5;
+
+export type JobStatus = 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+
+export interface ImageJobRequest {
+  task: 'generations' | 'edits';
+  model: string;
+  prompt: string;
+  n: number;
+  params: Record<string, any>;
+  // Number of input images stored with the job (edits)
+  inputCount?: number;
+  hasMask?: boolean;
+}
+
+export interface ImageJob {
+  id: string;
+  status: JobStatus;
+  request: ImageJobRequest;
+  createdAt: number;
+  startedAt?: number;
+  completedAt?: number;
+  expiresAt: number;
+  progress: { completed: number; total: number };
+  images: Array<{ url: string; id: string }>;
+  error?: string;
+  errors?: Array<{ index: number; error: string }>;
+  webhookUrl?: string;
+  webhook?: { delivered: boolean; attempts: number; status?: number };
+  // Origin the job was submitted to, for absolute result URLs
+  baseUrl: string;
+}
+
+/**
+ * Whether a job can still change state
+ */
+export function isTerminal(status: JobStatus): boolean {
+  return status === 'succeeded' || status === 'failed' || status === 'cancelled';
+}
+
+/**
+ * Public (OpenAI-style) representation of a job
+ */
+export function formatJob(job: ImageJob): Record<string, any> {
+  const seconds = (ms?: number) => (ms === undefined ? null : Math.floor(ms / 1000));
+
+  return {
+    id: job.id,
+    object: 'image.job',
+    status: job.status,
+    task: job.request.task,
+    model: job.request.model,
+    n: job.request.n,
+    created: seconds(job.createdAt),
+    started_at: seconds(job.startedAt),
+    completed_at: seconds(job.completedAt),
+    expires_at: seconds(job.expiresAt),
+    progress: job.progress,
+    data: job.images.map((img) => ({
+      url: img.url.startsWith('/') ? new URL(img.url, job.baseUrl).toString() : img.url,
+    })),
+    error: job.error ? { message: job.error, type: 'api_error' } : null,
+    ...(job.errors?.length ? { errors: job.errors } : {}),
+  };
+}
+
+export class JobStore {
+  private bucket: R2Bucket;
+  private expiryHours: number;
+
+  constructor(env: Env) {
+    this.bucket = env.IMAGE_BUCKET;
+    this.expiryHours = parseInt(env.IMAGE_EXPIRY_HOURS || '24', 10);
+  }
+
+  /**
+   * Create a queued job, storing any input images alongside it
+   */
+  async create(
+    request: ImageJobRequest,
+    options: { baseUrl: string; webhookUrl?: string; images?: ImageInput[]; mask?: ImageInput }
+  ): Promise<ImageJob> {
+    const createdAt = Date.now();
+    const id = `job_${crypto.randomUUID().replace(/-/g, '')}`;
+    const expiresAt = createdAt + this.expiryHours * 60 * 60 * 1000;
+    const customMetadata = { expiresAt: String(expiresAt) };
+
+    const images = options.images || [];
+    await Promise.all(images.map((image, i) =>
+      this.bucket.put(`${JOBS_PREFIX}${id}/image-${i}`, toBlob(image), { customMetadata })
+    ));
+    if (options.mask) {
+      await this.bucket.put(`${JOBS_PREFIX}${id}/mask`, toBlob(options.mask), { customMetadata });
+    }
+
+    const job: ImageJob = {
+      id,
+      status: 'queued',
+      request: { ...request, inputCount: images.length, hasMask: !!options.mask },
+      createdAt,
+      expiresAt,
+      progress: { completed: 0, total: request.n },
+      images: [],
+      webhookUrl: options.webhookUrl,
+      baseUrl: options.baseUrl,
+    };
+
+    await this.write(job);
+    return job;
+  }
+
+  async get(id: string): Promise<ImageJob | null> {
+    if (!this.isValidId(id)) return null;
+    const object = await this.bucket.get(this.recordKey(id));
+    return object ? object.json<ImageJob>() : null;
+  }
+
+  /**
+   * Read-modify-write a job with an etag precondition, retrying if another
+   * writer got in first. `mutate` returns null to leave the job unchanged.
+   * Returns the job as stored afterwards, or null if it does not exist.
+   */
+  async update(id: string, mutate: (job: ImageJob) => ImageJob | null): Promise<ImageJob | null> {
+    if (!this.isValidId(id)) return null;
+
+    for (let attempt = 0; attempt < MAX_UPDATE_ATTEMPTS; attempt++) {
+      const object = await this.bucket.get(this.recordKey(id));
+      if (!object) return null;
+
+      const current = await object.json<ImageJob>();
+      const next = mutate(current);
+      if (!next) return current;
+
+      if (await this.write(next, object.etag)) {
+        return next;
+      }
+    }
+
+    throw new Error(`Job ${id} is being updated concurrently`);
+  }
+
+  /**
+   * Cancel a queued or running job; finished jobs are returned unchanged
+   */
+  async cancel(id: string): Promise<ImageJob | null> {
+    return this.update(id, (job) =>
+      isTerminal(job.status) ? null : { ...job, status: 'cancelled', completedAt: Date.now() }
+    );
+  }
+
+  /**
+   * Input images stored with an edits job
+   */
+  async loadInputs(job: ImageJob): Promise<{ images: ArrayBuffer[]; mask?: ArrayBuffer }> {
+    const read = async (key: string) => {
+      const object = await this.bucket.get(`${JOBS_PREFIX}${job.id}/${key}`);
+      if (!object) throw new Error(`Job input ${key} is missing`);
+      return object.arrayBuffer();
+    };
+
+    const images = await Promise.all(
+      Array.from({ length: job.request.inputCount || 0 }, (_, i) => read(`image-${i}`))
+    );
+    const mask = job.request.hasMask ? await read('mask') : undefined;
+    return { images, mask };
+  }
+
+  /**
+   * Write a job record; with `etag`, only if it is unchanged since read
+   */
+  private async write(job: ImageJob, etag?: string): Promise<boolean> {
+    const written = await this.bucket.put(this.recordKey(job.id), JSON.stringify(job), {
+      httpMetadata: { contentType: 'application/json' },
+      customMetadata: { expiresAt: String(job.expiresAt), status: job.status },
+      ...(etag ? { onlyIf: { etagMatches: etag } } : {}),
+    });
+    return written !== null;
+  }
+
+  private recordKey(id: string): string {
+    return `${JOBS_PREFIX}${id}/job.json`;
+  }
+
+  private isValidId(id: string): boolean {
+    return /^job_[0-9a-f]{32}$/.test(id);
+  }
+}
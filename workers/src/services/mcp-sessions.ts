@@ -0,0 +1,186 @@
+// ============================================================================
+// MCP Session Store - Open SSE streams for the legacy HTTP+SSE transport
+// Workers cannot write to a stream from a request other than the one that
+// created it, so in production each session is a Durable Object that owns
+// its stream (MCP_SESSIONS). The in-memory store backs tests and local runs.
+// ============================================================================
+
+import type { Env } from '../types.js';
+
+// Keep-alive comment interval so proxies do not drop idle streams
+const KEEPALIVE_MS = 15_000;
+
+export interface MCPSessionStore {
+  /**
+   * Open a session stream. The first event tells the client where to POST
+   * (`endpoint` is the message URL up to and including its query separator).
+   */
+  open(endpoint: string): Promise<{ id: string; stream: ReadableStream<Uint8Array> }>;
+  has(id: string): Promise<boolean>;
+  /**
+   * Push a JSON-RPC message to a session; false if the session is gone
+   */
+  send(id: string, message: unknown): Promise<boolean>;
+  close(id: string): Promise<void>;
+}
+
+interface Session {
+  writer: WritableStreamDefaultWriter<Uint8Array>;
+  keepAlive: ReturnType<typeof setInterval>;
+}
+
+const encoder = new TextEncoder();
+
+/**
+ * Encode a JSON-RPC message as an SSE "message" event
+ */
+export function encodeSSEMessage(message: unknown): Uint8Array {
+  return encoder.encode(`event: message\ndata: ${JSON.stringify(message)}\n\n`);
+}
+
+export class InMemoryMCPSessionStore implements MCPSessionStore {
+  private sessions = new Map<string, Session>();
+
+  async open(endpoint: string, id: string = crypto.randomUUID()): Promise<{ id: string; stream: ReadableStream<Uint8Array> }> {
+    const { readable, writable } = new TransformStream<Uint8Array, Uint8Array>();
+    const writer = writable.getWriter();
+
+    const keepAlive = setInterval(() => {
+      writer.write(encoder.encode(': keepalive\n\n')).catch(() => this.close(id));
+    }, KEEPALIVE_MS);
+
+    this.sessions.set(id, { writer, keepAlive });
+    writer.write(encoder.encode(`event: endpoint\ndata: ${endpoint}sessionId=${id}\n\n`)).catch(() => this.close(id));
+
+    return { id, stream: readable };
+  }
+
+  async has(id: string): Promise<boolean> {
+    return this.sessions.has(id);
+  }
+
+  async send(id: string, message: unknown): Promise<boolean> {
+    const session = this.sessions.get(id);
+    if (!session) return false;
+
+    try {
+      await session.writer.write(encodeSSEMessage(message));
+      return true;
+    } catch {
+      // Client disconnected
+      await this.close(id);
+      return false;
+    }
+  }
+
+  async close(id: string): Promise<void> {
+    const session = this.sessions.get(id);
+    if (!session) return;
+
+    this.sessions.delete(id);
+    clearInterval(session.keepAlive);
+    try {
+      await session.writer.close();
+    } catch {
+      // Already closed or errored
+    }
+  }
+}
+
+/**
+ * One Durable Object per session. It holds the stream returned to the GET
+ * and writes the messages that POST requests forward to it:
+ *   POST /open?endpoint=...   -> the SSE stream
+ *   GET  /has                 -> 204 while open, 404 once closed
+ *   POST /send (JSON-RPC body) -> 202, or 404 once closed
+ *   POST /close               -> 204
+ */
+export class MCPSessionObject implements DurableObject {
+  private id: string;
+  private sessions = new InMemoryMCPSessionStore();
+
+  constructor(state: DurableObjectState) {
+    this.id = state.id.toString();
+  }
+
+  async fetch(request: Request): Promise<Response> {
+    const url = new URL(request.url);
+
+    switch (url.pathname) {
+      case '/open': {
+        const { stream } = await this.sessions.open(url.searchParams.get('endpoint') || '', this.id);
+        return new Response(stream, { headers: { 'Content-Type': 'text/event-stream' } });
+      }
+      case '/has':
+        return new Response(null, { status: (await this.sessions.has(this.id)) ? 204 : 404 });
+      case '/send': {
+        const delivered = await this.sessions.send(this.id, await request.json());
+        return new Response(null, { status: delivered ? 202 : 404 });
+      }
+      case '/close':
+        await this.sessions.close(this.id);
+        return new Response(null, { status: 204 });
+      default:
+        return new Response('Not found', { status: 404 });
+    }
+  }
+}
+
+/**
+ * Sessions held by MCPSessionObject instances, addressed by object id
+ */
+export class DurableObjectMCPSessionStore implements MCPSessionStore {
+  constructor(private namespace: DurableObjectNamespace) {}
+
+  async open(endpoint: string): Promise<{ id: string; stream: ReadableStream<Uint8Array> }> {
+    const objectId = this.namespace.newUniqueId();
+    const response = await this.namespace.get(objectId).fetch(
+      `https://mcp-session/open?endpoint=${encodeURIComponent(endpoint)}`,
+      { method: 'POST' }
+    );
+    if (!response.ok || !response.body) {
+      throw new Error(`MCP session could not be opened (${response.status})`);
+    }
+    return { id: objectId.toString(), stream: response.body };
+  }
+
+  async has(id: string): Promise<boolean> {
+    const stub = this.stub(id);
+    if (!stub) return false;
+    return (await stub.fetch('https://mcp-session/has')).ok;
+  }
+
+  async send(id: string, message: unknown): Promise<boolean> {
+    const stub = this.stub(id);
+    if (!stub) return false;
+    const response = await stub.fetch('https://mcp-session/send', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(message),
+    });
+    return response.ok;
+  }
+
+  async close(id: string): Promise<void> {
+    await this.stub(id)?.fetch('https://mcp-session/close', { method: 'POST' });
+  }
+
+  private stub(id: string): DurableObjectStub | null {
+    try {
+      return this.namespace.get(this.namespace.idFromString(id));
+    } catch {
+      // Not an id this namespace issued
+      return null;
+    }
+  }
+}
+
+// Used when MCP_SESSIONS is not bound; shared by every MCPEndpoint in this isolate
+const memorySessions = new InMemoryMCPSessionStore();
+
+/**
+ * Session store for this deployment
+ */
+export function getMCPSessionStore(env: Env): MCPSessionStore {
+  return env.MCP_SESSIONS ? new DurableObjectMCPSessionStore(env.MCP_SESSIONS) : memorySessions;
+}
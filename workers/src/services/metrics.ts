@@ -0,0 +1,253 @@
+// ============================================================================
+// Metrics - Per-request timing spans, Server-Timing and an isolate registry
+// Latency histograms, error counts and bytes moved by endpoint, model and
+// account, exported as Prometheus text or JSON at /metrics
+// ============================================================================
+
+// Histogram bucket upper bounds in milliseconds
+const BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000];
+
+type Labels = Record<string, string>;
+
+interface HistogramSeries {
+  name: string;
+  labels: Labels;
+  buckets: number[]; // Non-cumulative counts per bucket, plus +Inf at the end
+  sum: number;
+  count: number;
+}
+
+interface CounterSeries {
+  name: string;
+  labels: Labels;
+  value: number;
+}
+
+// Shared by every request handled by this isolate
+const histograms = new Map<string, HistogramSeries>();
+const counters = new Map<string, CounterSeries>();
+
+const HELP: Record<string, string> = {
+  image_request_duration_ms: 'Request latency by endpoint, model and status class',
+  image_requests_total: 'Requests by endpoint, model and status class',
+  image_stage_duration_ms: 'Time spent per generation stage (parse, ai, encode, upload)',
+  workers_ai_request_duration_ms: 'Workers AI call latency by model, account and status',
+  workers_ai_requests_total: 'Workers AI calls by model, account and status',
+  image_bytes_total: 'Bytes moved by direction (ai_request, ai_response, r2_upload)',
+};
+
+function seriesKey(name: string, labels: Labels): string {
+  return `${name}|${Object.keys(labels).sort().map((k) => `${k}=${labels[k]}`).join(',')}`;
+}
+
+/**
+ * Add one observation (milliseconds) to a histogram
+ */
+export function observe(name: string, labels: Labels, valueMs: number): void {
+  const key = seriesKey(name, labels);
+  let series = histograms.get(key);
+  if (!series) {
+    series = { name, labels, buckets: new Array(BUCKETS_MS.length + 1).fill(0), sum: 0, count: 0 };
+    histograms.set(key, series);
+  }
+
+  let index = 0;
+  while (index < BUCKETS_MS.length && valueMs > BUCKETS_MS[index]) index++;
+  series.buckets[index]++;
+  series.sum += valueMs;
+  series.count++;
+}
+
+/**
+ * Increase a counter
+ */
+export function increment(name: string, labels: Labels, by: number = 1): void {
+  const key = seriesKey(name, labels);
+  const series = counters.get(key);
+  if (series) {
+    series.value += by;
+  } else {
+    counters.set(key, { name, labels, value: by });
+  }
+}
+
+/**
+ * Clear all series (tests and benchmarks)
+ */
+export function resetMetrics(): void {
+  histograms.clear();
+  counters.clear();
+}
+
+function formatLabels(labels: Labels, extra?: Labels): string {
+  const all = { ...labels, ...extra };
+  const parts = Object.keys(all).map((k) => `${k}="${all[k].replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n')}"`);
+  return parts.length > 0 ? `{${parts.join(',')}}` : '';
+}
+
+/**
+ * Prometheus text exposition format (0.0.4)
+ */
+export function renderPrometheus(): string {
+  const lines: string[] = [];
+  const described = new Set<string>();
+  const describe = (name: string, type: string) => {
+    if (described.has(name)) return;
+    described.add(name);
+    if (HELP[name]) lines.push(`# HELP ${name} ${HELP[name]}`);
+    lines.push(`# TYPE ${name} ${type}`);
+  };
+
+  const sortedHistograms = [...histograms.values()].sort((a, b) => a.name.localeCompare(b.name));
+  for (const series of sortedHistograms) {
+    describe(series.name, 'histogram');
+    let cumulative = 0;
+    BUCKETS_MS.forEach((bound, i) => {
+      cumulative += series.buckets[i];
+      lines.push(`${series.name}_bucket${formatLabels(series.labels, { le: String(bound) })} ${cumulative}`);
+    });
+    lines.push(`${series.name}_bucket${formatLabels(series.labels, { le: '+Inf' })} ${series.count}`);
+    lines.push(`${series.name}_sum${formatLabels(series.labels)} ${series.sum}`);
+    lines.push(`${series.name}_count${formatLabels(series.labels)} ${series.count}`);
+  }
+
+  const sortedCounters = [...counters.values()].sort((a, b) => a.name.localeCompare(b.name));
+  for (const series of sortedCounters) {
+    describe(series.name, 'counter');
+    lines.push(`${series.name}${formatLabels(series.labels)} ${series.value}`);
+  }
+
+  return lines.join('\n') + '\n';
+}
+
+/**
+ * Estimate a quantile from bucket counts (upper bound of the bucket it falls in)
+ */
+function quantile(series: HistogramSeries, q: number): number | null {
+  if (series.count === 0) return null;
+  const target = q * series.count;
+  let cumulative = 0;
+  for (let i = 0; i < BUCKETS_MS.length; i++) {
+    cumulative += series.buckets[i];
+    if (cumulative >= target) return BUCKETS_MS[i];
+  }
+  return null; // Above the largest bucket
+}
+
+/**
+ * JSON view: histograms with count/mean/p50/p95/p99 and raw counters
+ */
+export function snapshot(): {
+  histograms: Array<Record<string, string | number | null>>;
+  counters: Array<Record<string, string | number>>;
+} {
+  return {
+    histograms: [...histograms.values()].map((series) => ({
+      metric: series.name,
+      ...series.labels,
+      count: series.count,
+      meanMs: series.count > 0 ? +(series.sum / series.count).toFixed(2) : 0,
+      p50Ms: quantile(series, 0.5),
+      p95Ms: quantile(series, 0.95),
+      p99Ms: quantile(series, 0.99),
+    })),
+    counters: [...counters.values()].map((series) => ({
+      metric: series.name,
+      ...series.labels,
+      value: series.value,
+    })),
+  };
+}
+
+/**
+ * Timing spans for one request. Stage timings are summed per name for the
+ * Server-Timing header (parallel images add up) and also recorded in the
+ * isolate histograms. Note that Workers only advance the clock across I/O,
+ * so CPU-only stages (parse, encode) read near zero in production.
+ */
+export class RequestTrace {
+  readonly endpoint: string;
+  // Set by the generator once the request's model is known
+  model = 'unknown';
+  // Set by handlers whose response body outlives them (streams); they call
+  // finish() with the real outcome once the body is done
+  deferred = false;
+  private started: number;
+  private finished = false;
+  private stages = new Map<string, { duration: number; count: number }>();
+
+  constructor(endpoint: string) {
+    this.endpoint = endpoint;
+    this.started = performance.now();
+  }
+
+  /**
+   * Time an async stage
+   */
+  async span<T>(stage: string, fn: () => Promise<T>): Promise<T> {
+    const started = performance.now();
+    try {
+      return await fn();
+    } finally {
+      this.record(stage, performance.now() - started);
+    }
+  }
+
+  /**
+   * Time a synchronous stage
+   */
+  measure<T>(stage: string, fn: () => T): T {
+    const started = performance.now();
+    try {
+      return fn();
+    } finally {
+      this.record(stage, performance.now() - started);
+    }
+  }
+
+  record(stage: string, durationMs: number): void {
+    const entry = this.stages.get(stage);
+    if (entry) {
+      entry.duration += durationMs;
+      entry.count++;
+    } else {
+      this.stages.set(stage, { duration: durationMs, count: 1 });
+    }
+    observe('image_stage_duration_ms', { endpoint: this.endpoint, model: this.model, stage }, durationMs);
+  }
+
+  /**
+   * One Workers AI attempt; `status` is the HTTP status or 'error' for a network failure
+   */
+  aiCall(account: string, status: number | 'error', durationMs: number): void {
+    const labels = { model: this.model, account, status: String(status) };
+    observe('workers_ai_request_duration_ms', labels, durationMs);
+    increment('workers_ai_requests_total', labels);
+  }
+
+  bytes(direction: 'ai_request' | 'ai_response' | 'r2_upload', count: number): void {
+    increment('image_bytes_total', { endpoint: this.endpoint, model: this.model, direction }, count);
+  }
+
+  /**
+   * Record the request outcome; call once when the response is ready
+   */
+  finish(status: number): void {
+    if (this.finished) return;
+    this.finished = true;
+    const labels = { endpoint: this.endpoint, model: this.model, status: `${Math.floor(status / 100)}xx` };
+    observe('image_request_duration_ms', labels, performance.now() - this.started);
+    increment('image_requests_total', labels);
+  }
+
+  /**
+   * Server-Timing header value, e.g. `ai;dur=812.4;desc="x4", total;dur=845.1`
+   */
+  serverTiming(): string {
+    const parts = [...this.stages.entries()].map(([stage, { duration, count }]) =>
+      `${stage};dur=${duration.toFixed(1)}${count > 1 ? `;desc="x${count}"` : ''}`
+    );
+    parts.push(`total;dur=${(performance.now() - this.started).toFixed(1)}`);
+    return parts.join(', ');
+  }
+}
@@ -33,6 +33,24 @@ export class ParamParser {
     throw new Error(`Invalid input type: ${typeof input}`);
   }
 
+  /**
+   * Raw --key=value parameters embedded in a prompt (keys lowercased)
+   */
+  static extractEmbedded(raw: string): Record<string, string> {
+    // Match --key=value or --key value patterns
+    const paramRegex = /--(\w+)(?:=(.+?))?(?=\s+--|\s*$)/g;
+    const params: Record<string, string> = {};
+    let match;
+
+    while ((match = paramRegex.exec(raw)) !== null) {
+      const key = match[1];
+      const value = match[2]?.trim() || 'true';
+      params[key.toLowerCase()] = value;
+    }
+
+    return params;
+  }
+
   /**
    * Parse a string with embedded parameters
    */
@@ -41,21 +59,12 @@ export class ParamParser {
     explicitParams: Record<string, any>,
     modelConfig?: ModelConfig
   ): ParsedParams {
-    // Match --key=value or --key value patterns
-    const paramRegex = /--(\w+)(?:=(.+?))?(?=\s+--|\s*$)/g;
-    const params: Record<string, string> = {};
-    let match;
-
     // Extract pure prompt (everything before first --)
     const promptMatch = raw.match(/^([^-]+?)(?=\s+--)/);
     const purePrompt = promptMatch ? promptMatch[1].trim() : raw;
 
     // Parse embedded parameters
-    while ((match = paramRegex.exec(raw)) !== null) {
-      const key = match[1];
-      const value = match[2]?.trim() || 'true';
-      params[key.toLowerCase()] = value;
-    }
+    const params = this.extractEmbedded(raw);
 
     // Merge explicit params (higher priority) with embedded params
     const mergedParams = { ...params, ...explicitParams };
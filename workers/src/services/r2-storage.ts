@@ -4,6 +4,90 @@
 // ============================================================================
 
 import type { Env, ImageMetadata } from '../types.js';
+import { CACHE_PREFIX } from './generation-cache.js';
+import { JOBS_PREFIX } from './job-store.js';
+import { base64ToBytes } from './binary.js';
+
+// Cleanup index and cursors, stored outside images/
+const STATE_KEY = '_meta/storage-state.json';
+
+// R2 operations one cleanupExpired call may spend (the cron invocation limit is 1000)
+const CLEANUP_MAX_OPERATIONS = 500;
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+/**
+ * Running totals for the objects under one date folder
+ */
+export interface FolderSummary {
+  count: number;
+  size: number;
+  oldest?: number;
+  newest?: number;
+  minExpiresAt?: number;
+  maxExpiresAt?: number;
+}
+
+interface FolderIndex extends FolderSummary {
+  // Last key counted; keys sort by upload time, so newer objects come after it
+  lastKey?: string;
+  // No more uploads can land in this folder and all of it is counted
+  complete?: boolean;
+}
+
+interface StorageState {
+  version: 1;
+  folders: Record<string, FolderIndex>;
+  // Resume points for prefixes swept object by object (cache pointers, jobs)
+  sweepCursors?: Record<string, string>;
+  totalDeleted: number;
+  lastRunAt?: number;
+  // Last time a cleanup pass reached every date folder
+  indexedAt?: number;
+}
+
+type Budget = { remaining: number };
+
+function emptySummary(): FolderSummary {
+  return { count: 0, size: 0 };
+}
+
+/**
+ * expiresAt from custom metadata; objects without one never expire
+ */
+function expiryOf(custom: Record<string, string> | undefined): number {
+  const expiresAt = parseInt(custom?.expiresAt ?? '', 10);
+  return Number.isFinite(expiresAt) ? expiresAt : Number.MAX_SAFE_INTEGER;
+}
+
+function addToSummary(summary: FolderSummary, obj: R2Object): void {
+  const createdAt = parseInt(obj.customMetadata?.createdAt ?? '', 10);
+  const expiresAt = expiryOf(obj.customMetadata);
+
+  summary.count++;
+  summary.size += obj.size;
+  if (Number.isFinite(createdAt)) {
+    if (summary.oldest === undefined || createdAt < summary.oldest) summary.oldest = createdAt;
+    if (summary.newest === undefined || createdAt > summary.newest) summary.newest = createdAt;
+  }
+  if (summary.minExpiresAt === undefined || expiresAt < summary.minExpiresAt) summary.minExpiresAt = expiresAt;
+  if (summary.maxExpiresAt === undefined || expiresAt > summary.maxExpiresAt) summary.maxExpiresAt = expiresAt;
+}
+
+function mergeSummary(target: FolderSummary, source: FolderSummary): void {
+  target.count += source.count;
+  target.size += source.size;
+  if (source.oldest !== undefined && (target.oldest === undefined || source.oldest < target.oldest)) {
+    target.oldest = source.oldest;
+  }
+  if (source.newest !== undefined && (target.newest === undefined || source.newest > target.newest)) {
+    target.newest = source.newest;
+  }
+}
+
+function utcMidnight(timestamp: number): number {
+  return Math.floor(timestamp / DAY_MS) * DAY_MS;
+}
 
 export class R2StorageService {
   private bucket: R2Bucket;
@@ -24,8 +108,8 @@ export class R2StorageService {
     imageData: string | ArrayBuffer,
     metadata: Omit<ImageMetadata, 'id' | 'expiresAt' | 'createdAt'>
   ): Promise<{ id: string; url: string; expiresAt: number }> {
-    const id = this.generateId();
     const timestamp = Date.now();
+    const id = this.generateId(timestamp);
     const expiresAt = timestamp + this.expiryHours * 60 * 60 * 1000;
 
     const fullMetadata: ImageMetadata = {
@@ -35,23 +119,14 @@ export class R2StorageService {
       expiresAt,
     };
 
-    // Convert base64 to ArrayBuffer if needed
-    let body: ArrayBuffer;
-    if (typeof imageData === 'string') {
-      // Check if it's a data URI
-      if (imageData.startsWith('data:')) {
-        const base64 = imageData.split(',')[1];
-        body = this.base64ToArrayBuffer(base64);
-      } else {
-        body = this.base64ToArrayBuffer(imageData);
-      }
-    } else {
-      body = imageData;
-    }
+    // Convert base64 (raw or data URI) to bytes if needed
+    const body: ArrayBuffer | Uint8Array = typeof imageData === 'string'
+      ? base64ToBytes(imageData)
+      : imageData;
 
-    // Generate key with date-based prefix for organization (timezone-aware)
-    const datePrefix = this.getDatePrefix(timestamp);
-    const key = `images/${datePrefix}/${id}.png`;
+    // Generate key with date-based prefix for organization (timezone-aware).
+    // The id starts with the same timestamp, so the key can be rebuilt from it.
+    const key = this.keyForTimestamp(id, timestamp);
 
     // Upload to R2
     await this.bucket.put(key, body, {
@@ -77,18 +152,12 @@ export class R2StorageService {
    * Retrieve image metadata
    */
   async getImage(id: string): Promise<{ metadata: ImageMetadata; data: ArrayBuffer } | null> {
-    // Search for the image (note: in production, you'd want an index)
-    const listed = await this.bucket.list({
-      prefix: 'images/',
-      limit: 100,
-    });
-
-    const matchingObject = listed.objects.find((obj) => obj.key.includes(id));
-    if (!matchingObject) {
-      return null;
+    // Resolve the key from the id itself: one get() for current ids
+    let object: R2ObjectBody | null = null;
+    for (const key of this.candidateKeysForId(id)) {
+      object = await this.bucket.get(key);
+      if (object) break;
     }
-
-    const object = await this.bucket.get(matchingObject.key);
     if (!object) {
       return null;
     }
@@ -110,39 +179,324 @@ export class R2StorageService {
   }
 
   /**
-   * Delete expired images
+   * Read raw object bytes by key
+   */
+  async getObjectData(key: string): Promise<ArrayBuffer | null> {
+    const object = await this.bucket.get(key);
+    return object ? object.arrayBuffer() : null;
+  }
+
+  /**
+   * Delete expired images, spending at most `maxOperations` R2 calls.
+   * Each date folder keeps running totals in an index. Calls only touch
+   * what changed: new uploads after the folder's last counted key, the
+   * expired head of a folder, or whole folders that have fully expired.
+   * Work cut short by the budget resumes on the next call.
    */
-  async cleanupExpired(): Promise<number> {
+  async cleanupExpired(maxOperations: number = CLEANUP_MAX_OPERATIONS): Promise<number> {
     const now = Date.now();
-    let deleted = 0;
+    const budget: Budget = { remaining: maxOperations };
+    const state = await this.loadState();
+    const progress = { deleted: 0 };
+
+    const listing = await this.listDayFolders(budget);
+    if (!listing) {
+      return this.finishCleanup(state, progress.deleted, now, false);
+    }
+
+    // Keys directly under images/ (no date folder) are checked one by one
+    const strays = listing.strays.filter((obj) => expiryOf(obj.customMetadata) < now);
+    if (strays.length > 0 && this.spend(budget, 1)) {
+      await this.bucket.delete(strays.map((obj) => obj.key));
+      progress.deleted += strays.length;
+    }
+
+    // Forget folders that no longer exist
+    const present = new Set(listing.days);
+    for (const day of Object.keys(state.folders)) {
+      if (!present.has(day)) delete state.folders[day];
+    }
+
+    for (const day of listing.days) {
+      if (!(await this.cleanupFolder(day, state, now, budget, progress))) {
+        return this.finishCleanup(state, progress.deleted, now, false);
+      }
+    }
+
+    // Generation cache pointers and async jobs share the image's expiry.
+    // They are keyed by hash or job id, not date, so they are scanned,
+    // resuming from a cursor.
+    const cursors: Record<string, string> = {};
+    for (const prefix of [CACHE_PREFIX, JOBS_PREFIX]) {
+      const cursor = await this.sweepPrefix(prefix, state.sweepCursors?.[prefix], now, budget, progress);
+      if (cursor !== undefined) cursors[prefix] = cursor;
+    }
+    state.sweepCursors = cursors;
+
+    return this.finishCleanup(state, progress.deleted, now, true);
+  }
+
+  /**
+   * Bring one date folder's index up to date and delete what has expired;
+   * false if the budget ran out first
+   */
+  private async cleanupFolder(
+    day: string,
+    state: StorageState,
+    now: number,
+    budget: Budget,
+    progress: { deleted: number }
+  ): Promise<boolean> {
+    const dayStart = Date.parse(`${day}T00:00:00Z`);
+    if (!Number.isFinite(dayStart)) return true;
+
+    const prefix = `images/${day}/`;
+    // The folder date is in the configured timezone, so uploads to it happen
+    // before UTC midnight + 2 days whatever TZ is
+    const closed = dayStart + 2 * DAY_MS <= now;
+    const folder = state.folders[day] ?? (state.folders[day] = emptySummary());
+
+    // Everything in it has expired: delete by key, no metadata needed
+    if (folder.complete && folder.maxExpiresAt !== undefined && folder.maxExpiresAt <= now) {
+      if (!(await this.purgeFolder(prefix, folder, budget, progress))) return false;
+      delete state.folders[day];
+      return true;
+    }
+
+    if (!folder.complete) {
+      const reachedEnd = await this.extendFolder(prefix, folder, now, budget, progress);
+      if (!reachedEnd) return false;
+      if (closed) folder.complete = true;
+    }
+
+    if (folder.minExpiresAt !== undefined && folder.minExpiresAt <= now) {
+      if (!(await this.trimFolder(prefix, folder, now, budget, progress))) return false;
+    }
+
+    if (closed && folder.count === 0) {
+      delete state.folders[day];
+    }
+    return true;
+  }
+
+  /**
+   * Count objects uploaded after the folder's last counted key, deleting
+   * any that have already expired
+   */
+  private async extendFolder(
+    prefix: string,
+    folder: FolderIndex,
+    now: number,
+    budget: Budget,
+    progress: { deleted: number }
+  ): Promise<boolean> {
     let cursor: string | undefined = undefined;
 
     do {
+      // A page costs a list and possibly a delete
+      if (!this.spend(budget, 2)) return false;
+
       const listOptions: R2ListOptions = {
-        prefix: 'images/',
+        prefix,
         limit: 1000,
+        include: ['customMetadata'],
       };
       if (cursor) {
         listOptions.cursor = cursor;
+      } else if (folder.lastKey) {
+        listOptions.startAfter = folder.lastKey;
       }
 
       const listed = await this.bucket.list(listOptions);
 
       const expiredKeys: string[] = [];
+      for (const obj of listed.objects) {
+        if (expiryOf(obj.customMetadata) < now) {
+          expiredKeys.push(obj.key);
+        } else {
+          addToSummary(folder, obj);
+        }
+      }
+
+      if (expiredKeys.length > 0) {
+        await this.bucket.delete(expiredKeys);
+        progress.deleted += expiredKeys.length;
+      }
+      if (listed.objects.length > 0) {
+        folder.lastKey = listed.objects[listed.objects.length - 1].key;
+      }
+
+      // Handle cursor for truncated results
+      if (listed.truncated && 'cursor' in listed) {
+        cursor = (listed as any).cursor;
+      } else {
+        cursor = undefined;
+      }
+    } while (cursor !== undefined);
 
+    return true;
+  }
+
+  /**
+   * Delete the expired head of a folder. Keys start with the upload time,
+   * so with a fixed IMAGE_EXPIRY_HOURS the expired objects come first and
+   * the scan stops at the first live one. Objects left behind by an expiry
+   * change are removed when the whole folder is purged.
+   */
+  private async trimFolder(
+    prefix: string,
+    folder: FolderIndex,
+    now: number,
+    budget: Budget,
+    progress: { deleted: number }
+  ): Promise<boolean> {
+    for (;;) {
+      if (!this.spend(budget, 2)) return false;
+
+      const listed = await this.bucket.list({ prefix, limit: 1000, include: ['customMetadata'] });
+
+      const expired: R2Object[] = [];
+      let firstLive: R2Object | undefined;
       for (const obj of listed.objects) {
-        const custom = obj.customMetadata || {};
-        const expiresAt = parseInt(custom.expiresAt, 10);
+        if (expiryOf(obj.customMetadata) < now) {
+          expired.push(obj);
+        } else {
+          firstLive = obj;
+          break;
+        }
+      }
 
-        if (expiresAt < now) {
-          expiredKeys.push(obj.key);
+      if (expired.length > 0) {
+        await this.bucket.delete(expired.map((obj) => obj.key));
+        progress.deleted += expired.length;
+        for (const obj of expired) {
+          // Objects past lastKey were never counted
+          if (folder.lastKey !== undefined && obj.key <= folder.lastKey) {
+            folder.count--;
+            folder.size -= obj.size;
+          }
         }
       }
 
+      if (firstLive) {
+        const createdAt = parseInt(firstLive.customMetadata?.createdAt ?? '', 10);
+        folder.oldest = Number.isFinite(createdAt) ? createdAt : folder.oldest;
+        folder.minExpiresAt = expiryOf(firstLive.customMetadata);
+        return true;
+      }
+
+      if (!listed.truncated) {
+        // Folder is empty now
+        Object.assign(folder, emptySummary(), {
+          oldest: undefined,
+          newest: undefined,
+          minExpiresAt: undefined,
+          maxExpiresAt: undefined,
+        });
+        return true;
+      }
+    }
+  }
+
+  /**
+   * Delete everything under a fully expired folder without reading metadata
+   */
+  private async purgeFolder(
+    prefix: string,
+    folder: FolderIndex,
+    budget: Budget,
+    progress: { deleted: number }
+  ): Promise<boolean> {
+    for (;;) {
+      if (!this.spend(budget, 2)) return false;
+
+      // Always the first page: the previous page has just been deleted
+      const listed = await this.bucket.list({ prefix, limit: 1000 });
+      if (listed.objects.length === 0) return true;
+
+      await this.bucket.delete(listed.objects.map((obj) => obj.key));
+      progress.deleted += listed.objects.length;
+
+      // Keep the index accurate if the purge is interrupted
+      folder.count -= listed.objects.length;
+      folder.size -= listed.objects.reduce((total, obj) => total + obj.size, 0);
+
+      if (!listed.truncated) return true;
+    }
+  }
+
+  /**
+   * Delete expired objects under a flat prefix; returns the cursor to resume
+   * from, or undefined once the scan has reached the end
+   */
+  private async sweepPrefix(
+    prefix: string,
+    cursor: string | undefined,
+    now: number,
+    budget: Budget,
+    progress: { deleted: number }
+  ): Promise<string | undefined> {
+    do {
+      if (!this.spend(budget, 2)) return cursor;
+
+      const listOptions: R2ListOptions = {
+        prefix,
+        limit: 1000,
+        include: ['customMetadata'],
+      };
+      if (cursor) {
+        listOptions.cursor = cursor;
+      }
+
+      const listed = await this.bucket.list(listOptions);
+
+      const expiredKeys = listed.objects
+        .filter((obj) => expiryOf(obj.customMetadata) < now)
+        .map((obj) => obj.key);
+
       if (expiredKeys.length > 0) {
         await this.bucket.delete(expiredKeys);
-        deleted += expiredKeys.length;
+        progress.deleted += expiredKeys.length;
+      }
+
+      // Handle cursor for truncated results
+      if (listed.truncated && 'cursor' in listed) {
+        cursor = (listed as any).cursor;
+      } else {
+        cursor = undefined;
+      }
+    } while (cursor !== undefined);
+
+    return undefined;
+  }
+
+  /**
+   * Date folders under images/ plus any objects stored outside a folder;
+   * null if the budget ran out
+   */
+  private async listDayFolders(budget: Budget): Promise<{ days: string[]; strays: R2Object[] } | null> {
+    const days: string[] = [];
+    const strays: R2Object[] = [];
+    let cursor: string | undefined = undefined;
+
+    do {
+      if (!this.spend(budget, 1)) return null;
+
+      const listOptions: R2ListOptions = {
+        prefix: 'images/',
+        delimiter: '/',
+        limit: 1000,
+        include: ['customMetadata'],
+      };
+      if (cursor) {
+        listOptions.cursor = cursor;
+      }
+
+      const listed = await this.bucket.list(listOptions);
+      for (const folder of listed.delimitedPrefixes) {
+        days.push(folder.slice('images/'.length, -1));
       }
+      strays.push(...listed.objects);
 
       // Handle cursor for truncated results
       if (listed.truncated && 'cursor' in listed) {
@@ -152,9 +506,44 @@ export class R2StorageService {
       }
     } while (cursor !== undefined);
 
+    return { days: days.sort(), strays };
+  }
+
+  private spend(budget: Budget, operations: number): boolean {
+    if (budget.remaining < operations) return false;
+    budget.remaining -= operations;
+    return true;
+  }
+
+  private async finishCleanup(state: StorageState, deleted: number, now: number, complete: boolean): Promise<number> {
+    state.totalDeleted += deleted;
+    state.lastRunAt = now;
+    if (complete) {
+      state.indexedAt = now;
+    }
+    await this.saveState(state);
     return deleted;
   }
 
+  private async loadState(): Promise<StorageState> {
+    try {
+      const object = await this.bucket.get(STATE_KEY);
+      if (object) {
+        const state = await object.json<StorageState>();
+        if (state?.version === 1) return state;
+      }
+    } catch (error) {
+      console.warn(`Storage state unreadable, rebuilding: ${error instanceof Error ? error.message : error}`);
+    }
+    return { version: 1, folders: {}, totalDeleted: 0 };
+  }
+
+  private async saveState(state: StorageState): Promise<void> {
+    await this.bucket.put(STATE_KEY, JSON.stringify(state), {
+      httpMetadata: { contentType: 'application/json' },
+    });
+  }
+
   /**
    * List all images (with pagination)
    */
@@ -202,22 +591,21 @@ export class R2StorageService {
    * Delete a specific image
    */
   async deleteImage(id: string): Promise<boolean> {
-    const listed = await this.bucket.list({
-      prefix: 'images/',
-      limit: 100,
-    });
-
-    const matchingObject = listed.objects.find((obj) => obj.key.includes(id));
-    if (!matchingObject) {
-      return false;
+    for (const key of this.candidateKeysForId(id)) {
+      const head = await this.bucket.head(key);
+      if (head) {
+        await this.bucket.delete(key);
+        return true;
+      }
     }
-
-    await this.bucket.delete(matchingObject.key);
-    return true;
+    return false;
   }
 
   /**
-   * Get storage statistics
+   * Get storage statistics.
+   * Folders indexed by cleanupExpired are answered from their running
+   * totals; only uploads since the last cleanup are listed. Until the first
+   * full cleanup pass has built the index, falls back to scanning images/.
    */
   async getStats(): Promise<{
     totalImages: number;
@@ -225,32 +613,59 @@ export class R2StorageService {
     oldestImage?: number;
     newestImage?: number;
   }> {
-    let total = 0;
-    let size = 0;
-    let oldest: number | undefined;
-    let newest: number | undefined;
+    const state = await this.loadState();
+    const summary = emptySummary();
+
+    if (state.indexedAt === undefined) {
+      await this.summarizePrefix('images/', summary);
+    } else {
+      for (const [day, folder] of Object.entries(state.folders)) {
+        mergeSummary(summary, folder);
+        if (!folder.complete) {
+          // Uploads since the last cleanup
+          await this.summarizePrefix(`images/${day}/`, summary, folder.lastKey);
+        }
+      }
+
+      // Folders created since the last full pass (uploads land on recent dates)
+      const now = Date.now();
+      for (let dayStart = utcMidnight(state.indexedAt) - DAY_MS; dayStart <= now + DAY_MS; dayStart += DAY_MS) {
+        const day = new Date(dayStart).toISOString().split('T')[0];
+        if (!state.folders[day]) {
+          await this.summarizePrefix(`images/${day}/`, summary);
+        }
+      }
+    }
+
+    return {
+      totalImages: summary.count,
+      totalSize: summary.size,
+      oldestImage: summary.oldest,
+      newestImage: summary.newest,
+    };
+  }
+
+  /**
+   * Add every object under a prefix (optionally after a key) to `summary`
+   */
+  private async summarizePrefix(prefix: string, summary: FolderSummary, startAfter?: string): Promise<void> {
     let cursor: string | undefined = undefined;
 
     do {
       const listOptions: R2ListOptions = {
-        prefix: 'images/',
+        prefix,
         limit: 1000,
+        include: ['customMetadata'],
       };
       if (cursor) {
         listOptions.cursor = cursor;
+      } else if (startAfter) {
+        listOptions.startAfter = startAfter;
       }
 
       const listed = await this.bucket.list(listOptions);
-
       for (const obj of listed.objects) {
-        total++;
-        size += obj.size;
-
-        const custom = obj.customMetadata || {};
-        const createdAt = parseInt(custom.createdAt, 10);
-
-        if (!oldest || createdAt < oldest) oldest = createdAt;
-        if (!newest || createdAt > newest) newest = createdAt;
+        addToSummary(summary, obj);
       }
 
       // Handle cursor for truncated results
@@ -260,8 +675,6 @@ export class R2StorageService {
         cursor = undefined;
       }
     } while (cursor !== undefined);
-
-    return { totalImages: total, totalSize: size, oldestImage: oldest, newestImage: newest };
   }
 
   // ===== Helper Methods =====
@@ -294,10 +707,38 @@ export class R2StorageService {
     }
   }
 
-  private generateId(): string {
-    const timestamp = Date.now().toString(36);
+  /**
+   * Generate an id of the form "<base36 timestamp>-<random>".
+   * The timestamp must be the upload timestamp so the key can be derived from the id.
+   */
+  private generateId(timestamp: number): string {
     const random = Math.random().toString(36).substring(2, 10);
-    return `${timestamp}-${random}`;
+    return `${timestamp.toString(36)}-${random}`;
+  }
+
+  private keyForTimestamp(id: string, timestamp: number): string {
+    return `images/${this.getDatePrefix(timestamp)}/${id}.png`;
+  }
+
+  /**
+   * Candidate object keys for an id, most likely first.
+   * The date folder is recomputed from the id's timestamp; the neighbouring
+   * days are included in case TZ changed since upload (offsets are < 1 day).
+   */
+  private candidateKeysForId(id: string): string[] {
+    const match = id.match(/^([0-9a-z]+)-[0-9a-z]+$/);
+    if (!match) {
+      return [];
+    }
+
+    const timestamp = parseInt(match[1], 36);
+    if (!Number.isFinite(timestamp)) {
+      return [];
+    }
+
+    const day = 24 * 60 * 60 * 1000;
+    const keys = [timestamp, timestamp - day, timestamp + day].map((ts) => this.keyForTimestamp(id, ts));
+    return [...new Set(keys)];
   }
 
   private extractIdFromKey(key: string): string {
@@ -305,13 +746,4 @@ export class R2StorageService {
     const match = key.match(/images\/[\d-]+\/([^.]+)\.png/);
     return match ? match[1] : key;
   }
-
-  private base64ToArrayBuffer(base64: string): ArrayBuffer {
-    const binary = atob(base64);
-    const bytes = new Uint8Array(binary.length);
-    for (let i = 0; i < binary.length; i++) {
-      bytes[i] = binary.charCodeAt(i);
-    }
-    return bytes.buffer;
-  }
 }
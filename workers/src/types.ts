@@ -133,6 +133,12 @@ export interface ImageMetadata {
 export interface AIAccount {
   account_id: string;
   api_token: string;
+  weight?: number; // Relative share of traffic (default: 1)
+}
+
+// Async image job queue message
+export interface ImageJobMessage {
+  jobId: string;
 }
 
 // Environment interface
@@ -143,6 +149,14 @@ export interface Env {
   IMAGE_EXPIRY_HOURS: string;
   API_KEYS?: string; // Comma-separated list of valid API keys
   AI_ACCOUNTS?: string; // JSON array of {account_id, api_token} for multi-account AI inference
+  GENERATION_CONCURRENCY?: string; // Max parallel generations per request when n > 1 (default: 4)
+  ACCOUNT_CONCURRENCY?: string; // Max in-flight Workers AI calls per account per isolate (default: 4)
+  GENERATION_CACHE?: string; // "true" to reuse images for identical seeded requests (default: off)
+  CF_API_BASE_URL?: string; // Override Cloudflare REST API base (e.g. a local /ai/run/ stub for testing)
+  IMAGE_JOBS?: Queue<ImageJobMessage>; // Queue for async image jobs (optional; without it jobs run via waitUntil)
+  JOB_WEBHOOK_SECRET?: string; // HMAC-SHA256 key for signing async job webhooks (optional)
+  MCP_SESSIONS?: DurableObjectNamespace; // MCPSessionObject namespace for HTTP+SSE MCP sessions (in-memory without it)
+  JOB_TIMEOUT_MINUTES?: string; // A job still running after this long is marked failed (default: 20)
   DEPLOYED_AT?: string;
   COMMIT_SHA?: string;
   TZ?: string; // Timezone for logging and folder creation (default: UTC)